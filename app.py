@@ -1,23 +1,39 @@
-from flask import Flask, request, send_file
+from flask import Flask, Response, g, request, send_file
 from flask_cors import CORS
 import requests
-from bs4 import BeautifulSoup
 import re
 import os
 import urllib.parse
-from urllib.request import urlretrieve
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER
-from reportlab.lib import colors
+import mimetypes
+import unicodedata
 from datetime import datetime
 from PIL import Image as PILImage
-import zipfile
+import functools
+import itertools
+import time
 import shutil
 import logging as python_logging
 import sys
 import os
+from scraping.fetcher import ConcurrentFetcher
+from scraping.http_client import HttpClient
+from scraping.chapter_cache import ChapterCache
+from scraping.toc_cache import TocCache
+from scraping.image_prefetcher import ImagePrefetcher
+from scraping.image_store import ImageStore
+from scraping.parsing import HtmlParser
+from scraping.retry import CircuitBreaker, RetryPolicy
+from pipeline.artifact_cache import ArtifactCache
+from pipeline.jobs import JobManager, JobStore
+from pipeline.manifest import BuildManifest, content_fingerprint
+from pipeline.metrics import Metrics
+from pipeline.streaming import BoundedPipeline
+from pipeline.workspace import BuildWorkspace, prune_workspaces
+from rendering.epub import render_epub
+from rendering.images import ImageTranscoder
+from rendering.pdf import render_pdf, render_segmented_pdf, render_volume_pdf
+from rendering.pool import RenderPool, timed_call
+from rendering.zip_stream import stream_zip
 
 # Add the custom_logging directory to the path and import AppLogger
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'custom_logging'))
@@ -35,20 +51,86 @@ app = Flask(__name__)
 CORS(app, resources={
     r"/process": {"origins": "*", "methods": ["POST", "OPTIONS"]},
     r"/get_books": {"origins": "*", "methods": ["GET", "OPTIONS"]},
-    r"/download": {"origins": "*", "methods": ["POST", "OPTIONS"]},
-    r"/confirm-download": {"origins": "*", "methods": ["POST", "OPTIONS"]}
+    r"/download": {"origins": "*", "methods": ["POST", "OPTIONS"], "expose_headers": ["X-Build-Id", "X-Failed-Volumes", "X-Missing-Chapters", "X-Artifact-Url"]},
+    r"/confirm-download": {"origins": "*", "methods": ["POST", "OPTIONS"]},
+    r"/jobs": {"origins": "*", "methods": ["POST", "OPTIONS"]},
+    r"/jobs/.*": {"origins": "*", "methods": ["GET", "OPTIONS"], "expose_headers": ["X-Build-Id", "X-Failed-Volumes", "X-Missing-Chapters", "X-Artifact-Url"]},
+    r"/artifacts/.*": {"origins": "*", "methods": ["GET", "HEAD", "OPTIONS"], "expose_headers": ["Accept-Ranges", "Content-Range", "Content-Disposition", "ETag"]}
 })
 
+# Deployment settings, overridable through FLASK_-prefixed environment variables
+# (e.g. FLASK_FETCH_WORKERS=16)
+app.config.from_mapping(
+    HTML_PARSER='html.parser',
+    HTML_SCOPED_PARSING=True,
+    FETCH_CONCURRENT=True,
+    FETCH_WORKERS=8,
+    FETCH_PER_HOST=4,
+    IMAGE_FETCH_WORKERS=4,
+    HTTP_POOL_CONNECTIONS=10,
+    HTTP_POOL_MAXSIZE=16,
+    HTTP_CONNECT_TIMEOUT=10,
+    HTTP_READ_TIMEOUT=60,
+    HTTP_HEADERS={},
+    HTTP_MAX_ATTEMPTS=3,
+    HTTP_BACKOFF=0.5,
+    HTTP_MAX_BACKOFF=10,
+    HTTP_MAX_RETRY_AFTER=60,
+    CIRCUIT_FAILURE_THRESHOLD=5,
+    CIRCUIT_RESET_TIMEOUT=30,
+    FAIL_ON_MISSING_CHAPTERS=False,
+    CACHE_DIR='cache',
+    CHAPTER_CACHE_ENABLED=True,
+    CHAPTER_CACHE_MAX_BYTES=256 * 1024 * 1024,
+    CHAPTER_CACHE_MAX_AGE=7 * 24 * 3600,
+    TOC_CACHE_TTL=900,
+    TOC_CACHE_MAX_ENTRIES=256,
+    IMAGE_STORE_ENABLED=True,
+    IMAGE_STORE_MAX_BYTES=1024 * 1024 * 1024,
+    JOBS_DIR='jobs',
+    JOB_WORKERS=2,
+    JOB_TTL=3600,
+    JOB_HEARTBEAT_INTERVAL=30,
+    JOB_STALE_AFTER=300,
+    DOWNLOADS_DIR='app-downloads',
+    WORKSPACE_TTL=3600,
+    STREAM_ZIP=True,
+    STREAM_ZIP_KEEP=False,
+    RENDER_WORKERS=4,
+    RENDER_START_METHOD='spawn',
+    PIPELINE_RENDER=True,
+    PIPELINE_DEPTH=1,
+    ARTIFACT_CACHE_ENABLED=True,
+    ARTIFACT_CACHE_MAX_BYTES=2 * 1024 * 1024 * 1024,
+    ARTIFACT_CACHE_TTL=24 * 3600,
+    INCREMENTAL_BUILDS=True,
+    MANIFEST_REVALIDATE_AFTER=3600,
+    SEGMENT_CACHE_MAX_BYTES=1024 * 1024 * 1024,
+    PDF_CHUNK_CHAPTERS=16,
+    IMAGE_TRANSCODE=True,
+    IMAGE_DPI=150,
+    IMAGE_JPEG_QUALITY=80,
+    IMAGE_GRAYSCALE=False,
+    ARTIFACT_OFFLOAD='',
+    ARTIFACT_OFFLOAD_PREFIX='/internal-downloads/',
+    METRICS_FLUSH_INTERVAL=5,
+    METRICS_RETENTION=3600,
+    LOG_LEVEL='INFO',
+    LOG_ASYNC=True,
+    LOG_BODY_MAX_BYTES=1024,
+)
+app.config.from_prefixed_env()
+
 # Initialize logger
 if AppLogger:
-    app_logger = AppLogger()
+    app_logger = AppLogger(level=app.config['LOG_LEVEL'], async_mode=app.config['LOG_ASYNC'])
     logger = app_logger.logger
     logger.info("Application started - using AppLogger")
 else:
     # Fallback to basic file logging
     os.makedirs('logs', exist_ok=True)
     python_logging.basicConfig(
-        level=python_logging.DEBUG,
+        level=app.config['LOG_LEVEL'],
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
             python_logging.FileHandler('logs/info.log'),
@@ -57,6 +139,131 @@ else:
     )
     logger = python_logging.getLogger(__name__)
     logger.info("Application started - using basic logging")
+
+html_parser = HtmlParser(
+    backend=app.config['HTML_PARSER'],
+    scoped=app.config['HTML_SCOPED_PARSING']
+)
+if html_parser.fell_back:
+    logger.warning("HTML parser backend '%s' is not installed, using '%s'", html_parser.requested_backend, html_parser.backend)
+
+http_client = HttpClient(
+    pool_connections=app.config['HTTP_POOL_CONNECTIONS'],
+    pool_maxsize=app.config['HTTP_POOL_MAXSIZE'],
+    connect_timeout=app.config['HTTP_CONNECT_TIMEOUT'],
+    read_timeout=app.config['HTTP_READ_TIMEOUT'],
+    headers=app.config['HTTP_HEADERS'],
+    retry=RetryPolicy(
+        max_attempts=app.config['HTTP_MAX_ATTEMPTS'],
+        backoff=app.config['HTTP_BACKOFF'],
+        max_backoff=app.config['HTTP_MAX_BACKOFF'],
+        max_retry_after=app.config['HTTP_MAX_RETRY_AFTER']
+    ),
+    breaker=CircuitBreaker(
+        failure_threshold=app.config['CIRCUIT_FAILURE_THRESHOLD'],
+        reset_timeout=app.config['CIRCUIT_RESET_TIMEOUT']
+    )
+)
+
+chapter_cache = None
+if app.config['CHAPTER_CACHE_ENABLED']:
+    chapter_cache = ChapterCache(
+        cache_dir=app.config['CACHE_DIR'],
+        max_bytes=app.config['CHAPTER_CACHE_MAX_BYTES'],
+        max_age=app.config['CHAPTER_CACHE_MAX_AGE']
+    )
+
+image_store = None
+if app.config['IMAGE_STORE_ENABLED']:
+    image_store = ImageStore(
+        http_client.download,
+        cache_dir=app.config['CACHE_DIR'],
+        max_bytes=app.config['IMAGE_STORE_MAX_BYTES']
+    )
+
+# Finished downloads are keyed on cached chapter content, so they need the chapter cache
+artifact_cache = None
+if app.config['ARTIFACT_CACHE_ENABLED'] and chapter_cache is not None:
+    artifact_cache = ArtifactCache(
+        cache_dir=app.config['CACHE_DIR'],
+        max_bytes=app.config['ARTIFACT_CACHE_MAX_BYTES'],
+        max_age=app.config['ARTIFACT_CACHE_TTL']
+    )
+
+build_manifest = None
+if app.config['INCREMENTAL_BUILDS']:
+    build_manifest = BuildManifest(
+        cache_dir=app.config['CACHE_DIR'],
+        max_bytes=app.config['SEGMENT_CACHE_MAX_BYTES']
+    )
+
+image_transcoder = None
+if app.config['IMAGE_TRANSCODE']:
+    image_transcoder = ImageTranscoder(
+        dpi=app.config['IMAGE_DPI'],
+        quality=app.config['IMAGE_JPEG_QUALITY'],
+        grayscale=app.config['IMAGE_GRAYSCALE']
+    )
+
+toc_cache = TocCache(
+    cache_dir=app.config['CACHE_DIR'],
+    ttl=app.config['TOC_CACHE_TTL'],
+    max_entries=app.config['TOC_CACHE_MAX_ENTRIES']
+)
+
+job_manager = JobManager(
+    JobStore(jobs_dir=app.config['JOBS_DIR'], ttl=app.config['JOB_TTL'], stale_after=app.config['JOB_STALE_AFTER']),
+    max_workers=app.config['JOB_WORKERS'],
+    heartbeat_interval=app.config['JOB_HEARTBEAT_INTERVAL']
+)
+
+chapter_fetcher = ConcurrentFetcher(
+    max_workers=app.config['FETCH_WORKERS'],
+    per_host=app.config['FETCH_PER_HOST']
+)
+
+image_fetcher = ConcurrentFetcher(
+    max_workers=app.config['IMAGE_FETCH_WORKERS'],
+    per_host=app.config['FETCH_PER_HOST']
+)
+
+render_pool = None
+if app.config['RENDER_WORKERS'] > 1:
+    render_pool = RenderPool(
+        max_workers=app.config['RENDER_WORKERS'],
+        start_method=app.config['RENDER_START_METHOD']
+    )
+
+metrics = Metrics(
+    cache_dir=app.config['CACHE_DIR'],
+    flush_interval=app.config['METRICS_FLUSH_INTERVAL'],
+    retention=app.config['METRICS_RETENTION']
+)
+
+def cache_samples():
+    caches = {'toc': toc_cache, 'chapter': chapter_cache, 'image': image_store, 'artifact': artifact_cache}
+    for name, cache in caches.items():
+        if cache is not None:
+            stats = cache.stats()
+            yield 'webtoreader_cache_requests_total', {'cache': name, 'result': 'hit'}, stats['hits']
+            yield 'webtoreader_cache_requests_total', {'cache': name, 'result': 'miss'}, stats['misses']
+
+def segment_samples():
+    if build_manifest is not None:
+        stats = build_manifest.stats()
+        yield 'webtoreader_segments_total', {'result': 'reused'}, stats['reused']
+        yield 'webtoreader_segments_total', {'result': 'rendered'}, stats['rendered']
+        yield 'webtoreader_chapters_skipped_total', {}, stats['skipped_fetches']
+
+def http_samples():
+    stats = http_client.retry_stats()
+    yield 'webtoreader_http_retries_total', {}, stats['retries']
+    yield 'webtoreader_http_circuit_rejections_total', {}, stats['circuit_rejections']
+
+metrics.add_collector(cache_samples)
+metrics.add_collector(http_samples)
+metrics.add_collector(segment_samples)
+
 def validate_url(data):
     if data is None:
         return False
@@ -67,61 +274,128 @@ def validate_url(data):
         return False
     return True
 
+VOLUME_PATTERN = re.compile(r"Volume\s+(\d+)")
+
+def parse_table_of_contents(html):
+    """Parse a series index page into an ordered list of volumes and their chapters.
+
+    Volumes whose chapter list could not be located keep ``chapters`` as None.
+    The post content is parsed on its own first; the whole page is only parsed
+    when no volume headers are found there.
+    """
+    volumes = extract_volumes(html_parser.content_soup(html, from_encoding='utf-8'))
+    if not volumes and html_parser.scoped:
+        volumes = extract_volumes(html_parser.parse(html, from_encoding='utf-8'))
+    return volumes
+
+def extract_volumes(soup):
+    volumes = []
+    for h3 in soup.find_all('h3'):
+        volume_title = h3.text.strip()
+        match = VOLUME_PATTERN.match(volume_title)
+        if not match:
+            continue
+        chapter_data = None
+        container = h3.find_next_sibling('div')
+        if container:
+            inner_div = container.find('div')
+            if inner_div:
+                chapter_data = []
+                for p in inner_div.find_all('p'):
+                    for a in p.find_all('a', href=True):
+                        chapter_data.append({
+                            'name': a.get_text(strip=True),
+                            'url': a['href']
+                        })
+        volumes.append({
+            'title': volume_title,
+            'number': match.group(1),
+            'chapters': chapter_data
+        })
+    return volumes
+
+def load_table_of_contents(url):
+    with metrics.stage('index_fetch'):
+        response = http_client.get(url)
+        response.raise_for_status()
+    metrics.inc('webtoreader_bytes_total', len(response.content), kind='page')
+    with metrics.stage('index_parse'):
+        return parse_table_of_contents(response.content)
+
+def get_table_of_contents(url):
+    """Return the parsed index page for ``url``, shared by /process and /download."""
+    return toc_cache.get_or_load(url, load_table_of_contents)
+
 def get_webpage_content(url):
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Accept-Charsets': 'utf-8'
-        }
-        response = requests.get(url, headers=headers, timeout=60)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        soup = BeautifulSoup(response.content, 'html.parser', from_encoding='utf-8')
         books = {}
-        for h3 in soup.find_all('h3'):
-            if re.match(r"Volume\s+\d+", h3.text.strip()):
-                volume_title = h3.text.strip()
-                container = h3.find_next_sibling('div')
-                if container:
-                    inner_div = container.find('div')
-                    if inner_div:
-                        chapter_data = []
-                        for p in inner_div.find_all('p'):
-                            for a in p.find_all('a', href=True):
-                                chapter_name = a.get_text(strip=True)
-                                chapter_url = a['href']
-                                chapter_data.append({
-                                    'name': chapter_name,
-                                    'url': chapter_url
-                                })
-                        books[volume_title] = chapter_data
+        for volume in get_table_of_contents(url):
+            if volume['chapters'] is not None:
+                books[volume['title']] = volume['chapters']
         return books
     except requests.RequestException as e:
         return None
     
 def get_book_names(url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
         book_titles = {}
-        for h3 in soup.find_all('h3'):
-            if re.match(r"Volume\s+\d+", h3.text.strip()):
-                volume_title = h3.text.strip()
-                book_titles[volume_title] = True
+        for volume in get_table_of_contents(url):
+            book_titles[volume['title']] = True
         return list(book_titles.keys())
     except requests.RequestException as e:
         return None
     
+def fetch_cached_page(url, kind, parse):
+    """Fetch ``url`` and return ``parse(body)``, revalidating any cached copy."""
+    if chapter_cache is None:
+        with metrics.stage(f'{kind}_fetch'):
+            response = http_client.get(url)
+            response.raise_for_status()
+            body = response.content
+        metrics.inc('webtoreader_bytes_total', len(body), kind='page')
+        return parse_page(kind, parse, body)
+
+    entry = chapter_cache.get(url)
+    with metrics.stage(f'{kind}_fetch'):
+        response = http_client.get(url, headers=ChapterCache.conditional_headers(entry))
+        if not (entry and response.status_code == 304):
+            # An error page would otherwise be parsed as an empty chapter
+            response.raise_for_status()
+    if entry and response.status_code == 304:
+        chapter_cache.mark_validated(url)
+        chapter_cache.record_hit()
+        if entry['kind'] == kind:
+            return entry['parsed']
+        parsed = parse_page(kind, parse, entry['body'])
+        chapter_cache.set_parsed(url, kind, parsed)
+        return parsed
+
+    chapter_cache.record_miss()
+    if entry:
+        chapter_cache.mark_changed()
+    metrics.inc('webtoreader_bytes_total', len(response.content), kind='page')
+    parsed = parse_page(kind, parse, response.content)
+    if response.status_code == 200:
+        chapter_cache.put(
+            url,
+            response.content,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            kind=kind,
+            parsed=parsed
+        )
+    return parsed
+
+def parse_page(kind, parse, body):
+    with metrics.stage(f'{kind}_parse'):
+        return parse(body)
+
 def fetch_chapter(url):
-    print(f"Fetching chapter from URL: {url}")
-    logger.debug(f"Fetching chapter from URL: {url}")
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    content = soup.find('div', class_='entry-content alignfull wp-block-post-content has-global-padding is-layout-constrained wp-block-post-content-is-layout-constrained')
+    logger.debug("Fetching chapter from URL: %s", url)
+    return fetch_cached_page(url, 'chapter', parse_chapter)
+
+def parse_chapter(html):
+    content = html_parser.content_div(html)
     if content:
         comments_divs = content.find_all('div', class_='wp-block-comments')
         
@@ -200,11 +474,12 @@ def fetch_chapter(url):
     return None
 
 def fetch_illustrations(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    return fetch_cached_page(url, 'illustrations', parse_illustrations)
+
+def parse_illustrations(html):
     images = []
     
-    content_div = soup.find('div', class_='entry-content alignfull wp-block-post-content has-global-padding is-layout-constrained wp-block-post-content-is-layout-constrained')
+    content_div = html_parser.content_div(html)
     if content_div:
         img_figures = content_div.find_all('figure', class_='wp-block-image')
         for figure in img_figures:
@@ -218,509 +493,465 @@ def fetch_illustrations(url):
     
     return images
 
-def download_image(img_url, save_dir, filename):
+def download_image(img_url, save_dir, filename, progress=None):
     try:
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
-        
-        parsed_url = urllib.parse.urlparse(img_url)
-        ext = os.path.splitext(parsed_url.path)[1]
-        if not ext:
-            ext = '.jpg'
-        
-        filepath = os.path.join(save_dir, f"{filename}{ext}")
-        urlretrieve(img_url, filepath)
-        return filepath
+        with metrics.stage('image_download'):
+            filepath = store_image(img_url, save_dir, filename)
     except Exception as e:
+        metrics.inc('webtoreader_images_total', result='failed')
         return None
+    metrics.inc('webtoreader_images_total', result='downloaded')
+    metrics.inc('webtoreader_bytes_total', os.path.getsize(filepath), kind='image')
+    if progress:
+        progress.advance('images_downloaded')
+    return filepath
+
+def store_image(img_url, save_dir, filename):
+    if image_store is not None:
+        record = image_store.fetch(img_url)
+        try:
+            return image_store.link_into(record, save_dir)
+        except FileNotFoundError:
+            # The blob was evicted between lookup and link; fetch it again
+            return image_store.link_into(image_store.fetch(img_url), save_dir)
+
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    
+    parsed_url = urllib.parse.urlparse(img_url)
+    ext = os.path.splitext(parsed_url.path)[1]
+    if not ext:
+        ext = '.jpg'
+    
+    filepath = os.path.join(save_dir, f"{filename}{ext}")
+    http_client.download(img_url, filepath)
+    return filepath
+
+def image_size(img_path):
+    """Return (width, height) of a downloaded image, measured once by the image store."""
+    if image_store is not None:
+        size = image_store.size_of(img_path)
+        if size:
+            return size
+    with PILImage.open(img_path) as pil_img:
+        return pil_img.size
+
+def is_illustrations_link(link):
+    return '/illustrations/' in link or link.endswith('-illustrations/')
+
+def plan_chapters(chapter_list):
+    """Assign chapter numbers up front so fetches can complete in any order.
+
+    Entries marked unselected by select_chapters are left out, but still count
+    towards the numbers of the chapters after them.
+    """
+    planned = []
+    text_chapter_num = 0
+    for chapter_data in chapter_list:
+        try:
+            link = chapter_data['url']
+            name = chapter_data['name']
+        except (KeyError, TypeError):
+            continue
+        if is_illustrations_link(link):
+            chapter = {
+                'chapter_num': None,
+                'chapter_name': name,
+                'url': link,
+                'type': 'illustrations'
+            }
+        else:
+            text_chapter_num += 1
+            chapter = {
+                'chapter_num': text_chapter_num,
+                'chapter_name': name,
+                'url': link,
+                'type': 'text'
+            }
+        if chapter_data.get('selected', True):
+            planned.append(chapter)
+    return planned
+
+CHAPTER_RANGE_PATTERN = re.compile(r"(\d+)\s*-\s*(\d*)")
+
+def parse_chapter_selection(items):
+    """Return the (first, last) id ranges selected by ``items``; ``last`` is None for open ranges.
+
+    Items are chapter ids, as listed by /process with ``includeChapters``, or
+    "first-last" ranges, where "first-" runs to the end of the volume. Raises
+    ValueError for anything else.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("expected a non-empty list of chapter ids and ranges")
+    ranges = []
+    for item in items:
+        if isinstance(item, int) and not isinstance(item, bool):
+            first, last = item, item
+        elif isinstance(item, str) and item.strip().isdigit():
+            first = last = int(item)
+        else:
+            match = CHAPTER_RANGE_PATTERN.fullmatch(item.strip()) if isinstance(item, str) else None
+            if not match:
+                raise ValueError(f"invalid chapter id or range: {item!r}")
+            first, last = int(match.group(1)), int(match.group(2)) if match.group(2) else None
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"invalid chapter id or range: {item!r}")
+        ranges.append((first, last))
+    return ranges
+
+def select_chapters(chapter_list, ranges):
+    """Mark the entries of a volume's chapter list whose ids fall outside ``ranges`` as unselected.
+
+    A chapter's id is its 1-based position in the volume's list on the index page.
+    """
+    selected = []
+    for chapter_id, chapter in enumerate(chapter_list, start=1):
+        if any(first <= chapter_id and (last is None or chapter_id <= last) for first, last in ranges):
+            selected.append(chapter)
+        else:
+            selected.append(dict(chapter, selected=False))
+    return selected
+
+def toc_chapters(chapter_list):
+    """Chapter ids, names and types of a volume as listed by /process."""
+    return [
+        {'id': chapter_id, 'name': chapter['name'],
+         'type': 'illustrations' if is_illustrations_link(chapter['url']) else 'text'}
+        for chapter_id, chapter in enumerate(chapter_list or [], start=1)
+    ]
+
+def fetch_planned_chapter(link, chapter_type):
+    if chapter_type == 'illustrations':
+        return fetch_illustrations(link)
+    return fetch_chapter(link)
+
+def attach_chapter_result(chapter, result):
+    key = 'images' if chapter['type'] == 'illustrations' else 'content'
+    return dict(chapter, **{key: result})
+
+def chapter_images(chapter_type, result):
+    if not result:
+        return []
+    if chapter_type == 'illustrations':
+        return result
+    return result.get('inline_images', [])
+
+def new_image_prefetcher(workspace, progress=None):
+    return ImagePrefetcher(workspace.images_dir, download_image, image_fetcher, progress)
+
+def reusable_segments(volume, planned):
+    """Return {url: fingerprint} for the chapters of ``volume`` that need not be fetched again.
+
+    A chapter qualifies when the manifest saw it within MANIFEST_REVALIDATE_AFTER
+    seconds and the PDF segment for that content, at the same position, is stored.
+    """
+    known = build_manifest.chapters(chapter['url'] for chapter in planned)
+    fresh_after = time.time() - app.config['MANIFEST_REVALIDATE_AFTER']
+    reusable = {}
+    for index, chapter in enumerate(planned):
+        entry = known.get(chapter['url'])
+        if not entry or entry['kind'] != chapter['type'] or entry['validated_at'] < fresh_after:
+            continue
+        key = BuildManifest.segment_key(entry['fingerprint'], chapter, volume if index == 0 else None, render_profile())
+        if build_manifest.has_segment(key):
+            reusable[chapter['url']] = entry['fingerprint']
+    return reusable
+
+def iter_processed_volumes(books, concurrent=None, progress=None, images=None, missing=None, reuse_segments=False):
+    """Fetch the chapters of ``books`` one volume at a time.
+
+    Yields (volume, chapters) for each volume with at least one chapter, as soon
+    as that volume has been fetched. When an ImagePrefetcher is passed as
+    ``images``, image URLs are queued for download as soon as each chapter has
+    been parsed.
+
+    Chapters that still fail after the HTTP client's retries are left out and
+    appended to ``missing`` as "volume: chapter name", or fail the whole build
+    with FAIL_ON_MISSING_CHAPTERS.
+
+    With ``reuse_segments`` (PDF builds), chapters whose rendered segment can be
+    reused (see reusable_segments) are not fetched at all; they are yielded
+    with their content ``fingerprint`` instead of their content.
+    """
+    if missing is None:
+        missing = []
+    if concurrent is None:
+        concurrent = app.config['FETCH_CONCURRENT']
+
+    def fetch(link, chapter_type):
+        result = fetch_planned_chapter(link, chapter_type)
+        metrics.inc('webtoreader_chapters_total', type=chapter_type)
+        if images:
+            images.prefetch_all(chapter_images(chapter_type, result))
+        if progress:
+            progress.advance('chapters_fetched')
+        return result
+
+    planned_books = {volume: plan_chapters(chapter_list) for volume, chapter_list in books.items()}
+    if progress:
+        progress.set('chapters_total', sum(len(planned) for planned in planned_books.values()))
+
+    for volume, planned in planned_books.items():
+        reusable = reusable_segments(volume, planned) if reuse_segments and build_manifest is not None else {}
+        to_fetch = [chapter for chapter in planned if chapter['url'] not in reusable]
+        if concurrent:
+            results = chapter_fetcher.map(
+                (fetch, chapter['url'], chapter['type']) for chapter in to_fetch
+            )
+        else:
+            results = []
+            for chapter in to_fetch:
+                try:
+                    results.append(fetch(chapter['url'], chapter['type']))
+                except Exception as e:
+                    results.append(e)
 
-def process_chapters(books):
-    processed_books = {}
-    for volume, chapter_list in books.items():
         chapters = []
-        text_chapter_num = 0
-        for i, chapter_data in enumerate(chapter_list, start=1):
-            try:
-                link = chapter_data['url']
-                name = chapter_data['name']
-                
-                if '/illustrations/' in link or link.endswith('-illustrations/'):
-                    illustrations = fetch_illustrations(link)
-                    chapters.append({
-                        'chapter_num': None,
-                        'chapter_name': name,
-                        'url': link,
-                        'type': 'illustrations',
-                        'images': illustrations
-                    })
-                else:
-                    text_chapter_num += 1
-                    content = fetch_chapter(link)
-                    chapters.append({
-                        'chapter_num': text_chapter_num,
-                        'chapter_name': name,
-                        'url': link,
-                        'type': 'text',
-                        'content': content
-                    })
-            except Exception as e:
+        failed = []
+        results = iter(results)
+        for chapter in planned:
+            if chapter['url'] in reusable:
+                build_manifest.record_skipped_fetch()
+                if progress:
+                    progress.advance('chapters_fetched')
+                chapters.append(dict(chapter, fingerprint=reusable[chapter['url']]))
                 continue
+            result = next(results)
+            if isinstance(result, Exception):
+                logger.error("Failed to fetch chapter %s: %s", chapter['url'], result)
+                metrics.inc('webtoreader_chapters_missing_total', type=chapter['type'])
+                failed.append(f"{volume}: {chapter['chapter_name']}")
+                continue
+            if build_manifest is not None:
+                build_manifest.record(volume, chapter['url'], chapter['type'], content_fingerprint(result))
+            chapters.append(attach_chapter_result(chapter, result))
+        missing.extend(failed)
+        if failed and app.config['FAIL_ON_MISSING_CHAPTERS']:
+            raise BuildError(f"Failed to fetch {len(failed)} chapter(s): {', '.join(failed)}", 502)
 
-            processed_books[volume] = chapters
-    return processed_books
+        if chapters:
+            yield volume, chapters
 
-def create_epub(books):
-    pass
+def process_chapters(books, concurrent=None, progress=None, images=None, missing=None, reuse_segments=False):
+    """Fetch every chapter of ``books`` and return them as {volume: chapters}."""
+    return dict(iter_processed_volumes(books, concurrent, progress, images, missing, reuse_segments))
 
-def create_single_pdf(volume_name: str, chapters: list):
+def create_epub(books, progress=None, workspace=None, images=None):
+    """Write ``books`` as one EPUB; ``books`` may also be an iterable of (volume, chapters)."""
+    owns_workspace = workspace is None
+    if owns_workspace:
+        workspace = BuildWorkspace.create(app.config['DOWNLOADS_DIR'])
+    owns_images = images is None
+    if owns_images:
+        images = new_image_prefetcher(workspace, progress)
+    if isinstance(books, dict):
+        books = books.items()
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_volume_name = volume_name.replace(' ', '_').replace('Volume_', 'Vol')
-    pdf_filename = f"{safe_volume_name}_{timestamp}.pdf"
-    filepath = os.path.join("app-downloads", pdf_filename)
+    partial_path = workspace.file_path(f"book_{timestamp}.epub.part")
+    names = []
+    resolved = {}
+
+    def volumes():
+        for volume_name, chapters in books:
+            for chapter in chapters:
+                images.prefetch_all(chapter_images(chapter['type'], chapter.get('images') or chapter.get('content')))
+            # Only the current volume's images are kept resolved
+            resolved.clear()
+            resolved.update(resolve_images(chapters, images))
+            names.append(volume_name)
+            yield volume_name, chapters
     
-    if not os.path.exists("app-downloads"):
-        os.makedirs("app-downloads")
-
-    doc = SimpleDocTemplate(filepath, pagesize=A4, rightMargin=54, leftMargin=54, topMargin=54, bottomMargin=18)
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        name='TitleStyle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
+    filepath = None
+    try:
+        with metrics.stage('epub_build'):
+            render_epub(volumes(), partial_path, resolved)
+        volume_names = '_'.join([vol.replace(' ', '_').replace('Volume_', 'Vol') for vol in names])
+        filepath = workspace.file_path(f"{volume_names}_{timestamp}.epub")
+        os.replace(partial_path, filepath)
+        return filepath
+    except Exception as e:
+        logger.error("Failed to create EPUB: %s", e)
+        filepath = None
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return None
+    finally:
+        if owns_images:
+            images.close()
+        if owns_workspace:
+            # Nothing is left to serve from a failed build
+            if filepath:
+                workspace.finish()
+            else:
+                workspace.cleanup()
 
-    chapter_style = ParagraphStyle(
-        name='ChapterStyle',
-        parent=styles['Heading2'],
-        fontSize=18,
-        spaceAfter=12,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
+def volume_pdf_filename(volume_name):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe_volume_name = volume_name.replace(' ', '_').replace('Volume_', 'Vol')
+    return f"{safe_volume_name}_{timestamp}.pdf"
 
-    body_style = ParagraphStyle(
-        name='BodyStyle',
-        parent=styles['BodyText'],
-        fontSize=12,
-        spaceAfter=3
-    )
-    
-    part_style = ParagraphStyle(
-        name='PartStyle',
-        parent=body_style,
-        fontSize=12,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold',
-        spaceAfter=6,
-        spaceBefore=6
-    )
+def resolve_images(chapters, images):
+    """Wait for the images of ``chapters`` and map each URL to (local path, size)."""
+    resolved = {}
+    for chapter in chapters:
+        for img_info in chapter_images(chapter['type'], chapter.get('images') or chapter.get('content')):
+            src = img_info['src']
+            if src in resolved:
+                continue
+            img_path = images.get(src)
+            if img_path and os.path.exists(img_path):
+                try:
+                    resolved[src] = (img_path, image_size(img_path))
+                except Exception as e:
+                    resolved[src] = (img_path, None)
+    return resolved
 
-    content = []
-    
-    page_width = A4[0] - 108
-    max_width = page_width
-    max_height = A4[1] - 108
+def volume_render_task(volume_name, chapters, pdf_path, images, missing=None):
+    """Return (render function, args, finish) to render one volume's PDF to ``pdf_path``.
+
+    With incremental builds the volume is put together from one PDF segment
+    per chapter: stored segments of unchanged chapters are linked next to
+    ``pdf_path`` and only the other chapters are rendered. ``finish(ok)``
+    stores the newly rendered segments once the render succeeded and removes
+    the build's links. Segments missing an image are not stored, so that the
+    image is tried again on the next build. Without them the volume is
+    rendered in batches of PDF_CHUNK_CHAPTERS chapters.
+
+    A chapter whose fetch was skipped but whose segment is gone is fetched
+    now; if that fails it is left out and appended to ``missing`` like in
+    iter_processed_volumes, or fails the build with FAIL_ON_MISSING_CHAPTERS.
+    """
+    if build_manifest is None or not all(chapter.get('url') for chapter in chapters):
+        render = functools.partial(render_volume_pdf, chunk_chapters=app.config['PDF_CHUNK_CHAPTERS'],
+                                   transcoder=image_transcoder)
+        return render, (volume_name, chapters, pdf_path, resolve_images(chapters, images)), lambda ok: None
+
+    segment_dir = f"{pdf_path}.segments"
+    os.makedirs(segment_dir, exist_ok=True)
+    prepared = []
+    rendered = []
+    for index, chapter in enumerate(chapters):
+        segment = os.path.join(segment_dir, f"{index}.pdf")
+        # The volume title goes on whichever chapter ends up first
+        title = volume_name if not prepared else None
+        if 'fingerprint' in chapter:
+            key = BuildManifest.segment_key(chapter['fingerprint'], chapter, title, render_profile())
+            if build_manifest.link_segment(key, segment):
+                prepared.append(dict(chapter, segment=segment))
+                continue
+            # The fetch was skipped for a segment that has been evicted since, or that belongs to another position
+            try:
+                result = fetch_planned_chapter(chapter['url'], chapter['type'])
+            except Exception as e:
+                logger.error("Failed to fetch chapter %s: %s", chapter['url'], e)
+                metrics.inc('webtoreader_chapters_missing_total', type=chapter['type'])
+                name = f"{volume_name}: {chapter['chapter_name']}"
+                if app.config['FAIL_ON_MISSING_CHAPTERS']:
+                    shutil.rmtree(segment_dir, ignore_errors=True)
+                    raise BuildError(f"Failed to fetch 1 chapter(s): {name}", 502)
+                if missing is not None:
+                    missing.append(name)
+                continue
+            chapter = attach_chapter_result(chapter, result)
+            images.prefetch_all(chapter_images(chapter['type'], result))
+        result = chapter.get('images') if chapter['type'] == 'illustrations' else chapter.get('content')
+        key = BuildManifest.segment_key(content_fingerprint(result), chapter, title, render_profile())
+        if not build_manifest.link_segment(key, segment):
+            rendered.append((key, segment, chapter_images(chapter['type'], result)))
+        prepared.append(dict(chapter, segment=segment))
+    resolved = resolve_images(prepared, images)
+
+    def finish(ok):
+        if ok:
+            for key, segment, chapter_imgs in rendered:
+                if all(resolved.get(img['src'], (None, None))[1] for img in chapter_imgs):
+                    build_manifest.put_segment(key, segment)
+        shutil.rmtree(segment_dir, ignore_errors=True)
 
-    content.append(Paragraph(volume_name, title_style))
-    content.append(Spacer(1, 12))
+    render = functools.partial(render_segmented_pdf, transcoder=image_transcoder)
+    return render, (volume_name, prepared, pdf_path, resolved), finish
 
+def create_single_pdf(volume_name: str, chapters: list, progress=None, workspace=None, images=None, missing=None):
+    owns_workspace = workspace is None
+    if owns_workspace:
+        workspace = BuildWorkspace.create(app.config['DOWNLOADS_DIR'])
+    owns_images = images is None
+    if owns_images:
+        images = new_image_prefetcher(workspace, progress)
     for chapter in chapters:
-        if chapter['type'] == 'text':
-            chapter_title = chapter.get('chapter_name', f"Chapter {chapter['chapter_num']}")
-            content.append(Paragraph(chapter_title, chapter_style))
-            
-            chapter_content = chapter['content']
-            
-            if chapter_content:
-                if 'paragraphs' in chapter_content and chapter_content['paragraphs']:
-                    for para in chapter_content['paragraphs']:
-                        if para.strip():
-                            if re.match(r'^Part\s+\d+$', para.strip()):
-                                content.append(Paragraph(para.strip(), part_style))
-                            else:
-                                content.append(Paragraph(para.strip(), body_style))
-                            content.append(Spacer(1, 6))
-                
-                if 'inline_images' in chapter_content and chapter_content['inline_images']:
-                    for img_info in chapter_content['inline_images']:
-                        img_path = download_image(img_info['src'], "temp_images", f"{safe_volume_name}_chapter{chapter['chapter_num']}_inline_{chapter_content['inline_images'].index(img_info)+1}")
-                        if img_path and os.path.exists(img_path):
-                            try:
-                                with PILImage.open(img_path) as pil_img:
-                                    orig_width, orig_height = pil_img.size
-                                    aspect_ratio = orig_width / orig_height
-                                
-                                if orig_width > max_width or orig_height > max_height:
-                                    if orig_width > orig_height:
-                                        img_width = max_width
-                                        img_height = img_width / aspect_ratio
-                                        if img_height > max_height:
-                                            img_height = max_height
-                                            img_width = img_height * aspect_ratio
-                                    else:
-                                        img_height = max_height
-                                        img_width = img_height * aspect_ratio
-                                        if img_width > max_width:
-                                            img_width = max_width
-                                            img_height = img_width / aspect_ratio
-                                else:
-                                    img_width = orig_width
-                                    img_height = orig_height
-                                
-                                img = Image(img_path, width=img_width, height=img_height)
-                                content.append(img)
-                                
-                                if img_info.get('caption'):
-                                    caption_style = ParagraphStyle(
-                                        name='CaptionStyle',
-                                        parent=body_style,
-                                        fontSize=10,
-                                        textColor=colors.grey,
-                                        alignment=TA_CENTER,
-                                        spaceAfter=12
-                                    )
-                                    content.append(Paragraph(img_info['caption'], caption_style))
-                                content.append(Spacer(1, 12))
-                                
-                            except Exception as e:
-                                content.append(Paragraph(f"[Image: {img_info.get('alt', 'No description')}]", body_style))
-                                content.append(Spacer(1, 6))
-                
-                if 'tables' in chapter_content and chapter_content['tables']:
-                    for table_data in chapter_content['tables']:
-                        if table_data:
-                            wrapped_table_data = []
-                            cell_style = ParagraphStyle(
-                                name='TableCellStyle',
-                                parent=body_style,
-                                fontSize=9,
-                                leading=11,
-                                alignment=TA_JUSTIFY
-                            )
-                            
-                            for row in table_data:
-                                wrapped_row = []
-                                for cell in row:
-                                    cell_html = str(cell).replace('\n', '<br/>')
-                                    wrapped_row.append(Paragraph(cell_html, cell_style))
-                                wrapped_table_data.append(wrapped_row)
-                            
-                            num_cols = len(table_data[0])
-                            col_width = page_width / num_cols
-                            
-                            table = Table(wrapped_table_data, colWidths=[col_width] * num_cols)
-                            
-                            table.setStyle(TableStyle([
-                                ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
-                                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                            ]))
-                            
-                            content.append(table)
-                            content.append(Spacer(1, 12))
-            
-            content.append(PageBreak())
-        elif chapter['type'] == 'illustrations':
-            illustrations_title = chapter.get('chapter_name', 'Illustrations')
-            content.append(Paragraph(illustrations_title, chapter_style))
-            
-            first_img_max_height = max_height - 84
-            
-            for img_info in chapter['images']:
-                img_index = chapter['images'].index(img_info)
-                is_first_image = (img_index == 0)
-                
-                img_path = download_image(img_info['src'], "temp_images", f"{safe_volume_name}_illustrations_{img_index+1}")
-                if img_path and os.path.exists(img_path):
-                    try:
-                        with PILImage.open(img_path) as pil_img:
-                            orig_width, orig_height = pil_img.size
-                            aspect_ratio = orig_width / orig_height
-                        
-                        img_max_height = first_img_max_height if is_first_image else max_height
-                        
-                        if orig_width > orig_height:
-                            img_width = min(max_width, orig_width)
-                            img_height = img_width / aspect_ratio
-                            if img_height > img_max_height:
-                                img_height = img_max_height
-                                img_width = img_height * aspect_ratio
-                        else:
-                            img_height = min(img_max_height, orig_height)
-                            img_width = img_height * aspect_ratio
-                            if img_width > max_width:
-                                img_width = max_width
-                                img_height = img_width / aspect_ratio
-                        
-                        img_width_points = min(img_width, max_width)
-                        img_height_points = min(img_height, img_max_height)
-                        
-                        img = Image(img_path, width=img_width_points, height=img_height_points)
-                        content.append(img)
-                        
-                        if img_info['caption']:
-                            content.append(Paragraph(img_info['caption'], body_style))
-                        content.append(Spacer(1, 12))
-                        
-                    except Exception as e:
-                        content.append(Paragraph(f"[Image could not be loaded: {img_info.get('alt', 'No description')}]", body_style))
-                        content.append(Spacer(1, 12))
-            content.append(PageBreak())
+        images.prefetch_all(chapter_images(chapter['type'], chapter.get('images') or chapter.get('content')))
+    filepath = workspace.file_path(volume_pdf_filename(volume_name))
+    on_page = (lambda: progress.advance('pages_rendered')) if progress else None
     
+    finish = None
     try:
-        doc.build(content)
+        render, args, finish = volume_render_task(volume_name, chapters, filepath, images, missing)
+        with metrics.stage('pdf_build'):
+            pages = render(*args, on_page)
+        metrics.inc('webtoreader_pages_rendered_total', pages)
+        finish(True)
         return filepath
+    except BuildError:
+        # A missing chapter with FAIL_ON_MISSING_CHAPTERS fails the whole build, not just this volume
+        raise
     except Exception as e:
+        if finish:
+            finish(False)
         return None
+    finally:
+        if owns_images:
+            images.close()
+        if owns_workspace:
+            workspace.finish()
 
-def create_pdf(books: dict):
+def create_pdf(books: dict, progress=None, workspace=None, images=None):
+    owns_workspace = workspace is None
+    if owns_workspace:
+        workspace = BuildWorkspace.create(app.config['DOWNLOADS_DIR'])
+    owns_images = images is None
+    if owns_images:
+        images = new_image_prefetcher(workspace, progress)
+    for chapters in books.values():
+        for chapter in chapters:
+            images.prefetch_all(chapter_images(chapter['type'], chapter.get('images') or chapter.get('content')))
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     volume_names = '_'.join([vol.replace(' ', '_').replace('Volume_', 'Vol') for vol in books.keys()])
     pdf_filename = f"{volume_names}_{timestamp}.pdf"
-    filepath = os.path.join("app-downloads", pdf_filename)
-    
-    if not os.path.exists("app-downloads"):
-        os.makedirs("app-downloads")
-
-    doc = SimpleDocTemplate(filepath, pagesize=A4, rightMargin=54, leftMargin=54, topMargin=54, bottomMargin=18)
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        name='TitleStyle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
-
-    chapter_style = ParagraphStyle(
-        name='ChapterStyle',
-        parent=styles['Heading2'],
-        fontSize=18,
-        spaceAfter=12,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-
-    body_style = ParagraphStyle(
-        name='BodyStyle',
-        parent=styles['BodyText'],
-        fontSize=12,
-        spaceAfter=3
-    )
-    
-    part_style = ParagraphStyle(
-        name='PartStyle',
-        parent=body_style,
-        fontSize=12,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold',
-        spaceAfter=6,
-        spaceBefore=6
-    )
-
-    content = []
-    
-    page_width = A4[0] - 108
-    max_width = page_width
-    max_height = A4[1] - 108
-
-    for volume, chapters in books.items():
-        content.append(Paragraph(volume, title_style))
-        content.append(Spacer(1, 12))
-
-        for chapter in chapters:
-            if chapter['type'] == 'text':
-                chapter_title = chapter.get('chapter_name', f"Chapter {chapter['chapter_num']}")
-                content.append(Paragraph(chapter_title, chapter_style))
-                
-                chapter_content = chapter['content']
-                
-                if chapter_content:
-                    if 'paragraphs' in chapter_content and chapter_content['paragraphs']:
-                        for para in chapter_content['paragraphs']:
-                            if para.strip():
-                                if re.match(r'^Part\s+\d+$', para.strip()):
-                                    content.append(Paragraph(para.strip(), part_style))
-                                else:
-                                    content.append(Paragraph(para.strip(), body_style))
-                                content.append(Spacer(1, 6))
-                    
-                    if 'inline_images' in chapter_content and chapter_content['inline_images']:
-                        for img_info in chapter_content['inline_images']:
-                            safe_volume_name = volume.replace(' ', '_').replace('Volume_', 'Vol')
-                            img_path = download_image(img_info['src'], "temp_images", f"{safe_volume_name}_chapter{chapter['chapter_num']}_inline_{chapter_content['inline_images'].index(img_info)+1}")
-                            if img_path and os.path.exists(img_path):
-                                try:
-                                    with PILImage.open(img_path) as pil_img:
-                                        orig_width, orig_height = pil_img.size
-                                        aspect_ratio = orig_width / orig_height
-                                    
-                                    if orig_width > max_width or orig_height > max_height:
-                                        if orig_width > orig_height:
-                                            img_width = max_width
-                                            img_height = img_width / aspect_ratio
-                                            if img_height > max_height:
-                                                img_height = max_height
-                                                img_width = img_height * aspect_ratio
-                                        else:
-                                            img_height = max_height
-                                            img_width = img_height * aspect_ratio
-                                            if img_width > max_width:
-                                                img_width = max_width
-                                                img_height = img_width / aspect_ratio
-                                    else:
-                                        img_width = orig_width
-                                        img_height = orig_height
-                                    
-                                    img = Image(img_path, width=img_width, height=img_height)
-                                    content.append(img)
-                                    
-                                    if img_info.get('caption'):
-                                        caption_style = ParagraphStyle(
-                                            name='CaptionStyle',
-                                            parent=body_style,
-                                            fontSize=10,
-                                            textColor=colors.grey,
-                                            alignment=TA_CENTER,
-                                            spaceAfter=12
-                                        )
-                                        content.append(Paragraph(img_info['caption'], caption_style))
-                                    content.append(Spacer(1, 12))
-                                    
-                                except Exception as e:
-                                    content.append(Paragraph(f"[Image: {img_info.get('alt', 'No description')}]", body_style))
-                                    content.append(Spacer(1, 6))
-                    
-                    if 'tables' in chapter_content and chapter_content['tables']:
-                        for table_data in chapter_content['tables']:
-                            if table_data:
-                                wrapped_table_data = []
-                                cell_style = ParagraphStyle(
-                                    name='TableCellStyle',
-                                    parent=body_style,
-                                    fontSize=9,
-                                    leading=11,
-                                    alignment=TA_JUSTIFY
-                                )
-                                
-                                for row in table_data:
-                                    wrapped_row = []
-                                    for cell in row:
-                                        cell_html = str(cell).replace('\n', '<br/>')
-                                        wrapped_row.append(Paragraph(cell_html, cell_style))
-                                    wrapped_table_data.append(wrapped_row)
-                                
-                                num_cols = len(table_data[0])
-                                col_width = page_width / num_cols
-                                
-                                table = Table(wrapped_table_data, colWidths=[col_width] * num_cols)
-                                
-                                table.setStyle(TableStyle([
-                                    ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
-                                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                                    ('TOPPADDING', (0, 0), (-1, -1), 6),
-                                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                ]))
-                                
-                                content.append(table)
-                                content.append(Spacer(1, 12))
-                
-                content.append(PageBreak())
-            elif chapter['type'] == 'illustrations':
-                illustrations_title = chapter.get('chapter_name', 'Illustrations')
-                content.append(Paragraph(illustrations_title, chapter_style))
-                
-                first_img_max_height = max_height - 84
-                
-                for img_info in chapter['images']:
-                    img_index = chapter['images'].index(img_info)
-                    is_first_image = (img_index == 0)
-                    
-                    safe_volume_name = volume.replace(' ', '_').replace('Volume_', 'Vol')
-                    img_path = download_image(img_info['src'], "temp_images", f"{safe_volume_name}_illustrations_{img_index+1}")
-                    if img_path and os.path.exists(img_path):
-                        try:
-                            with PILImage.open(img_path) as pil_img:
-                                orig_width, orig_height = pil_img.size
-                                aspect_ratio = orig_width / orig_height
-                            
-                            img_max_height = first_img_max_height if is_first_image else max_height
-                            
-                            if orig_width > orig_height:
-                                img_width = min(max_width, orig_width)
-                                img_height = img_width / aspect_ratio
-                                
-                                if img_height > img_max_height:
-                                    img_height = img_max_height
-                                    img_width = img_height * aspect_ratio
-                            else:
-                                img_height = min(img_max_height, orig_height)
-                                img_width = img_height * aspect_ratio
-                                
-                                if img_width > max_width:
-                                    img_width = max_width
-                                    img_height = img_width / aspect_ratio
-                            
-                            img_width_points = min(img_width, max_width)
-                            img_height_points = min(img_height, img_max_height)
-                            
-                            img = Image(img_path, width=img_width_points, height=img_height_points)
-                            content.append(img)
-                            
-                            if img_info['caption']:
-                                content.append(Paragraph(img_info['caption'], body_style))
-                            content.append(Spacer(1, 12))
-                            
-                        except Exception as e:
-                            content.append(Paragraph(f"[Image could not be loaded: {img_info.get('alt', 'No description')}]", body_style))
-                            content.append(Spacer(1, 12))
-                content.append(PageBreak())
+    filepath = workspace.file_path(pdf_filename)
+    all_chapters = [chapter for chapters in books.values() for chapter in chapters]
+    on_page = (lambda: progress.advance('pages_rendered')) if progress else None
     
     try:
-        doc.build(content)
-        
-        try:
-            import shutil
-            if os.path.exists("temp_images"):
-                shutil.rmtree("temp_images")
-        except Exception as e:
-            pass
-        
+        with metrics.stage('pdf_build'):
+            pages = render_pdf(books, filepath, resolve_images(all_chapters, images), on_page,
+                               chunk_chapters=app.config['PDF_CHUNK_CHAPTERS'], transcoder=image_transcoder)
+        metrics.inc('webtoreader_pages_rendered_total', pages)
         return filepath
     except Exception as e:
         return None
+    finally:
+        if owns_images:
+            images.close()
+        if owns_workspace:
+            workspace.finish()
     
 def cleanup_directories():
     print("Cleaning up directories...")
     import shutil
+    downloads_dir = app.config['DOWNLOADS_DIR']
     try:
-        if os.path.exists("app-downloads"):
-            print("Deleting app-downloads directory...")
-            logger.debug("Starting deletion of app-downloads directory")
-            shutil.rmtree("app-downloads")
-            logger.debug("Successfully deleted app-downloads directory")
-            print("Deleted app-downloads directory.")
+        if os.path.exists(downloads_dir):
+            print(f"Deleting {downloads_dir} directory...")
+            logger.debug("Starting deletion of %s directory", downloads_dir)
+            shutil.rmtree(downloads_dir)
+            logger.debug("Successfully deleted %s directory", downloads_dir)
+            print(f"Deleted {downloads_dir} directory.")
         else:
-            logger.debug("app-downloads directory does not exist, skipping deletion")
-            print("app-downloads directory does not exist, skipping deletion.")
+            logger.debug("%s directory does not exist, skipping deletion", downloads_dir)
+            print(f"{downloads_dir} directory does not exist, skipping deletion.")
     except Exception as e:
-        logger.error(f"Failed to delete app-downloads directory: {e}")
-        print(f"Failed to delete app-downloads directory: {e}")
+        logger.error("Failed to delete %s directory: %s", downloads_dir, e)
+        print(f"Failed to delete {downloads_dir} directory: {e}")
     
     try:
         if os.path.exists("temp_images"):
@@ -747,132 +978,580 @@ def process():
             return {"error": "Failed to fetch or parse the webpage"}, 500
 
         volumes = [{"id": i, "title": volume} for i, volume in enumerate(books, start=1)]
+        if request.json.get('includeChapters'):
+            # The index page was just parsed by get_book_names, so this is a cache hit
+            toc = {volume['title']: volume for volume in get_table_of_contents(url)}
+            for volume in volumes:
+                entry = toc.get(volume['title'], {})
+                volume['number'] = entry.get('number')
+                volume['chapters'] = toc_chapters(entry.get('chapters'))
         return {"books": volumes}, 200
     else:
         return {"error": "Invalid url"}, 400
 
-@app.route('/download', methods=['POST', 'OPTIONS'])
-def download():
-    if request.method == 'OPTIONS':
-        response = app.make_default_options_response()
-        headers = response.headers
-        headers['Access-Control-Allow-Origin'] = '*'
-        headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        headers['Access-Control-Allow-Headers'] = 'Content-Type, Accept'
-        return response
+class BuildError(Exception):
+    """A download build failed; ``status`` is the HTTP status to report."""
 
-    print("Download request received")
-    logger.debug("Download request received")
-    
-    selected_books = request.json.get('selectedBooks')
-    selected_format = request.json.get('format')
-    url = request.json.get('url')
-
-    if not selected_books:
-        return {"error": "No books selected"}, 400
-    if not selected_format:
-        return {"error": "No format selected"}, 400
-    if not url:
-        return {"error": "No URL provided"}, 400
-
-    print(f"Processing {len(selected_books)} books in {selected_format} format")
-    logger.debug(f"Processing {len(selected_books)} books in {selected_format} format")
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+PDF_FORMATS = ('PDF', 'pdf')
+EPUB_FORMATS = ('EPUB', 'epub')
+
+def validate_download_request(data):
+    """Return an error message for an invalid download request, or None."""
+    if not data:
+        return "Invalid request"
+    if not data.get('selectedBooks') and not data.get('selectedChapters'):
+        return "No books selected"
+    if not data.get('format'):
+        return "No format selected"
+    if not data.get('url'):
+        return "No URL provided"
+    if data.get('format') not in PDF_FORMATS + EPUB_FORMATS:
+        return "Unsupported format"
+    selected_chapters = data.get('selectedChapters')
+    if selected_chapters is not None:
+        if not isinstance(selected_chapters, dict):
+            return "Invalid chapter selection"
+        try:
+            for items in selected_chapters.values():
+                parse_chapter_selection(items)
+        except ValueError as e:
+            return f"Invalid chapter selection: {e}"
+    return None
+
+def build_download(url, selected_books, selected_format, progress=None, stream=False, selected_chapters=None):
+    """Fetch, process and render the selected volumes and chapters in a fresh build workspace.
+
+    Returns a dict with the artifact ``path`` (or a ``stream`` of bytes, see
+    render_download), ``download_name``, ``mimetype`` and the ``build_id`` of its
+    workspace. Raises BuildError when nothing could be built.
+    """
+    start = time.perf_counter()
+    prune_workspaces(app.config['DOWNLOADS_DIR'], max_age=app.config['WORKSPACE_TTL'])
+    workspace = BuildWorkspace.create(app.config['DOWNLOADS_DIR'])
+    images = new_image_prefetcher(workspace, progress)
+    try:
+        artifact = render_download(url, selected_books, selected_format, workspace, images, progress, stream,
+                                   selected_chapters)
+    except Exception:
+        images.close()
+        workspace.cleanup()
+        metrics.inc('webtoreader_downloads_total', format=str(selected_format).lower(), result='failed')
+        raise
+    artifact['build_id'] = workspace.id
+    if 'stream' in artifact:
+        def finish():
+            # The streamed copy stays behind under the artifact URL; without it there is nothing to keep
+            images.close()
+            if artifact.get('path'):
+                workspace.finish()
+            else:
+                workspace.cleanup()
+            record_download(selected_format, artifact, start)
+        artifact['stream'] = close_after(metered(artifact['stream']), finish)
+        return artifact
+    images.close()
+    workspace.finish()
+    metrics.inc('webtoreader_bytes_total', os.path.getsize(artifact['path']), kind='artifact')
+    record_download(selected_format, artifact, start)
+    return artifact
+
+def record_download(selected_format, artifact, start):
+    """Count a finished download and observe how long it took to build (or stream)."""
+    if artifact.get('cached'):
+        result = 'cached'
+    elif artifact.get('failed_volumes') or artifact.get('missing_chapters'):
+        result = 'partial'
+    else:
+        result = 'ok'
+    metrics.inc('webtoreader_downloads_total', format=str(selected_format).lower(), result=result)
+    metrics.observe('webtoreader_stage_duration_seconds', time.perf_counter() - start, stage='build')
+
+def metered(chunks):
+    for chunk in chunks:
+        metrics.inc('webtoreader_bytes_total', len(chunk), kind='artifact')
+        yield chunk
+
+def close_after(chunks, close):
+    try:
+        yield from chunks
+    finally:
+        close()
+
+def render_volume_pdfs(volumes, workspace, images, progress=None, failed=None, parallel=True, missing=None):
+    """Yield each volume's PDF path in volume order as soon as it is built.
+
+    ``volumes`` is a {volume: chapters} dict or an iterable of (volume, chapters)
+    pairs, consumed as rendering proceeds. Volumes that fail are skipped and
+    their names appended to ``failed``; chapters that turn out to be missing
+    only while rendering are appended to ``missing``. With ``parallel`` and a render pool
+    configured, volumes are rendered on worker processes.
+    """
+    if failed is None:
+        failed = []
+    if isinstance(volumes, dict):
+        volumes = volumes.items()
+    if render_pool is None or not parallel:
+        for volume_name, chapters in volumes:
+            logger.debug("Creating PDF for: %s", volume_name)
+            pdf_path = create_single_pdf(volume_name, chapters, progress, workspace, images, missing)
+            if pdf_path:
+                logger.debug("Created PDF: %s", pdf_path)
+                yield pdf_path
+            else:
+                logger.error("Failed to create PDF for: %s", volume_name)
+                failed.append(volume_name)
+        return
+
+    submitted = []
+
+    def tasks():
+        for volume_name, chapters in volumes:
+            for chapter in chapters:
+                images.prefetch_all(chapter_images(chapter['type'], chapter.get('images') or chapter.get('content')))
+            pdf_path = workspace.file_path(volume_pdf_filename(volume_name))
+            try:
+                render, args, finish = volume_render_task(volume_name, chapters, pdf_path, images, missing)
+            except BuildError:
+                raise
+            except Exception as e:
+                logger.error("Failed to prepare PDF for: %s: %s", volume_name, e)
+                failed.append(volume_name)
+                continue
+            submitted.append((volume_name, pdf_path, finish))
+            logger.debug("Rendering %s on the render pool", volume_name)
+            yield (render, *args)
+
+    # Renders are timed on the workers so that queueing for a worker is not counted
+    for index, result in enumerate(render_pool.map(timed_call, tasks())):
+        volume_name, pdf_path, finish = submitted[index]
+        finish(not isinstance(result, Exception))
+        if isinstance(result, Exception):
+            metrics.inc('webtoreader_stage_errors_total', stage='pdf_build')
+            logger.error("Failed to create PDF for: %s: %s", volume_name, result)
+            failed.append(volume_name)
+            continue
+        pages, seconds = result
+        metrics.observe('webtoreader_stage_duration_seconds', seconds, stage='pdf_build')
+        metrics.inc('webtoreader_pages_rendered_total', pages)
+        if progress:
+            progress.advance('pages_rendered', pages)
+        logger.debug("Created PDF: %s", pdf_path)
+        yield pdf_path
+
+# Part of every artifact cache key; bump it whenever PDF or EPUB output changes
+RENDERER_VERSION = 2
+
+def render_profile():
+    """Renderer version and image settings, which together decide how a chapter is rendered."""
+    return [RENDERER_VERSION, image_transcoder.settings() if image_transcoder else None]
+
+def artifact_key(volumes, selected_format):
+    """Artifact cache key for the chapters of ``volumes``, or None while their content is not cached."""
+    urls = {name: [chapter['url'] for chapter in plan_chapters(chapters)] for name, chapters in volumes.items()}
+    all_urls = [url for volume_urls in urls.values() for url in volume_urls]
+    fingerprint = chapter_cache.fingerprint(all_urls) if all_urls else None
+    if fingerprint is None:
+        return None
+    return ArtifactCache.key(urls, fingerprint, selected_format, render_profile())
+
+# Build timestamp in artifact names, e.g. Vol1_20250101_120000.pdf
+NAME_TIMESTAMP_PATTERN = re.compile(r'_\d{8}_\d{6}(?=\.[^.]+$)')
+
+def restamped_name(download_name):
+    """Return ``download_name`` with its build timestamp replaced by the current time."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return NAME_TIMESTAMP_PATTERN.sub(f"_{timestamp}", download_name, count=1)
+
+def cached_artifact(volumes, selected_format, workspace):
+    """Link a cached artifact for ``volumes`` into ``workspace``, or return None on a miss.
+
+    The link is named as if the artifact had just been built, so builds served
+    from the same entry do not hand out the same file name.
+    """
+    key = artifact_key(volumes, selected_format)
+    entry = artifact_cache.acquire(key) if key else None
+    if entry is None:
+        return None
+    download_name = restamped_name(entry['download_name'])
+    try:
+        path = ArtifactCache.link_into(entry, workspace.path, download_name)
+    except OSError as e:
+        logger.error("Failed to use cached artifact %s: %s", entry['path'], e)
+        return None
+    finally:
+        artifact_cache.release(entry['lease'])
+    logger.debug("Serving cached artifact %s as %s", entry['download_name'], download_name)
+    return {'path': path, 'download_name': download_name, 'mimetype': entry['mimetype'], 'cached': True}
+
+def store_artifact(volumes, selected_format, artifact):
+    """Add a finished artifact to the cache; partial builds are not cached."""
+    if artifact.get('failed_volumes') or artifact.get('missing_chapters'):
+        return
+    try:
+        key = artifact_key(volumes, selected_format)
+        if key:
+            artifact_cache.put(key, artifact['path'], artifact['download_name'], artifact['mimetype'])
+    except Exception as e:
+        logger.error("Failed to cache artifact %s: %s", artifact['download_name'], e)
+
+def keep_stream(chunks, path, complete, finish_on_disconnect=False):
+    """Yield ``chunks`` while writing them to ``path``, then call ``complete`` with the finished file.
+
+    With ``finish_on_disconnect`` the rest of the stream is still written,
+    without sending it, if the client goes away, so the download can be
+    resumed from the artifact URL. A stream that fails or is abandoned
+    leaves no file behind.
+    """
+    with open(path, 'wb') as f:
+        try:
+            try:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            except GeneratorExit:
+                if not finish_on_disconnect:
+                    raise
+                logger.debug("Client went away, finishing %s for its artifact URL", path)
+                for chunk in chunks:
+                    f.write(chunk)
+        except BaseException:
+            f.close()
+            os.remove(path)
+            raise
+    complete(path)
+
+def render_download(url, selected_books, selected_format, workspace, images, progress=None, stream=False,
+                    selected_chapters=None):
+    """Fetch and render the selected volumes into ``workspace``.
+
+    ``selected_chapters`` maps volume numbers to chapter ids and ranges (see
+    parse_chapter_selection); only those chapters of the volume, and their
+    images, are fetched and rendered. Volumes in ``selected_books`` are built
+    whole.
+
+    With ``stream`` a multi-volume PDF download is returned as a generator of ZIP
+    bytes under ``stream`` instead of a file ``path``. In pipelined mode volumes
+    are handed to the renderer as soon as they are fetched, through a queue of
+    at most PIPELINE_DEPTH volumes.
+    """
+    logger.debug("Processing %s books in %s format", len(selected_books or []), selected_format)
     
     books = get_webpage_content(url)
     if books is None:
-        return {"error": "Failed to fetch or parse the webpage"}, 500
-    selected_books = [str(i) for i in selected_books]
+        raise BuildError("Failed to fetch or parse the webpage", 500)
+    selected_books = [str(i) for i in selected_books or []]
+    selected_chapters = {str(volume): parse_chapter_selection(items) for volume, items in (selected_chapters or {}).items()}
     filtered_books = {}
     for volume_key, chapters in books.items():
-        match = re.match(r"Volume\s+(\d+)", volume_key)
+        match = VOLUME_PATTERN.match(volume_key)
         if match:
             volume_num = match.group(1)
             if volume_num in selected_books:
                 filtered_books[volume_key] = chapters
-    processed_books = process_chapters(filtered_books)
-    if not processed_books:
-        return {"error": "No valid books to process"}, 400
+            elif volume_num in selected_chapters:
+                chapters = select_chapters(chapters, selected_chapters[volume_num])
+                if any(chapter.get('selected', True) for chapter in chapters):
+                    filtered_books[volume_key] = chapters
     
-    pdf_paths = []
-    if selected_format == 'PDF' or selected_format == 'pdf':
-        print("Creating PDF files...")
+    if artifact_cache is not None:
+        artifact = cached_artifact(filtered_books, selected_format, workspace)
+        if artifact:
+            return artifact
+    
+    missing = []
+    reuse_segments = selected_format in PDF_FORMATS
+    if app.config['PIPELINE_RENDER']:
+        volumes = BoundedPipeline(
+            iter_processed_volumes(filtered_books, progress=progress, images=images, missing=missing,
+                                   reuse_segments=reuse_segments),
+            depth=app.config['PIPELINE_DEPTH'],
+            name='fetch-volumes'
+        )
+        volume_count = len(filtered_books)
+    else:
+        processed_books = process_chapters(filtered_books, progress=progress, images=images, missing=missing,
+                                           reuse_segments=reuse_segments)
+        volumes = iter(processed_books.items())
+        volume_count = len(processed_books)
+    close_volumes = getattr(volumes, 'close', lambda: None)
+    
+    try:
+        artifact = render_volumes(volumes, volume_count, selected_format, workspace, images, progress, stream,
+                                  missing)
+    except Exception:
+        close_volumes()
+        raise
+    # Filled in as chapters are fetched, so complete once a stream has ended
+    artifact['missing_chapters'] = missing
+    keep = app.config['STREAM_ZIP_KEEP']
+    if 'stream' in artifact and (keep or artifact_cache is not None):
+        # Streaming itself never needs the whole archive on disk; a copy is only written to cache it or keep it
+        def complete(path):
+            if artifact_cache is not None:
+                store_artifact(filtered_books, selected_format, dict(artifact, path=path))
+            if keep:
+                # Served from the artifact URL like a non-streamed build
+                artifact['path'] = path
+        artifact['resumable'] = keep
+        artifact['stream'] = keep_stream(artifact['stream'], workspace.file_path(artifact['download_name']), complete,
+                                         finish_on_disconnect=keep)
+    elif 'stream' not in artifact and artifact_cache is not None:
+        store_artifact(filtered_books, selected_format, artifact)
+    if 'stream' in artifact:
+        artifact['stream'] = close_after(artifact['stream'], close_volumes)
+    else:
+        close_volumes()
+    return artifact
+
+def missing_report(failed, missing):
+    """Return a MISSING.txt ZIP entry listing left-out volumes and chapters, or None if nothing is missing.
+
+    Streamed ZIPs start before these are known, so the archive reports them
+    itself instead of the X-Failed-Volumes and X-Missing-Chapters headers.
+    """
+    if not failed and not missing:
+        return None
+    lines = []
+    if failed:
+        lines += ["Volumes that could not be rendered:"] + [f"  {name}" for name in failed] + [""]
+    if missing:
+        lines += ["Chapters that could not be fetched:"] + [f"  {name}" for name in missing] + [""]
+    return 'MISSING.txt', '\n'.join(lines).encode('utf-8')
+
+def render_volumes(volumes, volume_count, selected_format, workspace, images, progress=None, stream=False,
+                   missing=None):
+    first_volume = next(volumes, None)
+    if first_volume is None:
+        raise BuildError("No valid books to process", 400)
+    volumes = itertools.chain([first_volume], volumes)
+    
+    if selected_format in PDF_FORMATS:
         logger.debug("Creating PDF files...")
         
-        for volume_name, chapters in processed_books.items():
-            print(f"Creating PDF for: {volume_name}")
-            logger.debug(f"Creating PDF for: {volume_name}")
-            pdf_path = create_single_pdf(volume_name, chapters)
-            if pdf_path:
-                pdf_paths.append(pdf_path)
-                print(f"Created PDF: {pdf_path}")
-                logger.debug(f"Created PDF: {pdf_path}")
-        
-        if not pdf_paths:
-            return {"error": "Failed to create PDFs"}, 500
-        
-        # Clean up temp_images after PDF creation
-        try:
-            if os.path.exists("temp_images"):
-                print("Removing temp_images directory after PDF creation")
-                logger.debug("Removing temp_images directory after PDF creation")
-                shutil.rmtree("temp_images")
-                print("Successfully removed temp_images directory")
-                logger.debug("Successfully removed temp_images directory")
-        except Exception as e:
-            print(f"Failed to remove temp_images: {e}")
-            logger.error(f"Failed to remove temp_images: {e}")
+        failed = []
+        volume_pdfs = render_volume_pdfs(volumes, workspace, images, progress, failed, parallel=volume_count > 1,
+                                         missing=missing)
+        first_pdf = next(volume_pdfs, None)
+        if first_pdf is None:
+            raise BuildError("Failed to create PDFs", 500)
         
-        if len(pdf_paths) == 1:
+        if volume_count == 1:
             # Single PDF - send it but don't clean up yet
-            pdf_path = pdf_paths[0]
-            print(f"Sending single PDF: {os.path.basename(pdf_path)}")
-            logger.debug(f"Sending single PDF: {os.path.basename(pdf_path)}")
-            
-            return send_file(pdf_path, as_attachment=True, download_name=os.path.basename(pdf_path), mimetype='application/pdf')
+            return {'path': first_pdf, 'download_name': os.path.basename(first_pdf), 'mimetype': 'application/pdf'}
         
-        # Multiple PDFs - create zip and clean up
+        # Multiple PDFs - each volume goes into the ZIP as soon as it is built and is then removed
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         zip_filename = f"books_{timestamp}.zip"
-        zip_filepath = os.path.join("app-downloads", zip_filename)
-        
-        print(f"Creating ZIP file with {len(pdf_paths)} PDFs: {zip_filename}")
-        logger.debug(f"Creating ZIP file with {len(pdf_paths)} PDFs: {zip_filename}")
+        chunks = stream_zip(itertools.chain([first_pdf], volume_pdfs), remove_after=True,
+                            trailer=lambda: missing_report(failed, missing))
         
-        with zipfile.ZipFile(zip_filepath, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for pdf_path in pdf_paths:
-                zipf.write(pdf_path, os.path.basename(pdf_path))
-                print(f"Added {os.path.basename(pdf_path)} to ZIP")
-                logger.debug(f"Added {os.path.basename(pdf_path)} to ZIP")
+        if stream:
+            logger.debug("Streaming ZIP file: %s", zip_filename)
+            return {'stream': chunks, 'download_name': zip_filename, 'mimetype': 'application/zip', 'failed_volumes': failed}
         
-        # Remove individual PDF files
-        for pdf_path in pdf_paths:
-            try:
-                print(f"Removing temporary PDF file: {pdf_path}")
-                logger.debug(f"Removing temporary PDF file: {pdf_path}")
-                os.remove(pdf_path)
-                print(f"Successfully removed PDF file: {pdf_path}")
-                logger.debug(f"Successfully removed PDF file: {pdf_path}")
-            except Exception as e:
-                print(f"Failed to remove PDF file {pdf_path}: {e}")
-                logger.error(f"Failed to remove PDF file {pdf_path}: {e}")
+        zip_filepath = workspace.file_path(zip_filename)
+        logger.debug("Creating ZIP file: %s", zip_filename)
+        with open(zip_filepath, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
         
-        print(f"Sending ZIP file: {zip_filename}")
-        logger.debug(f"Sending ZIP file: {zip_filename}")
-        return send_file(zip_filepath, as_attachment=True, download_name=zip_filename, mimetype='application/zip')
+        return {'path': zip_filepath, 'download_name': zip_filename, 'mimetype': 'application/zip', 'failed_volumes': failed}
         
-    elif selected_format == 'EPUB' or selected_format == 'epub':
-        print("Creating EPUB file...")
+    elif selected_format in EPUB_FORMATS:
         logger.debug("Creating EPUB file...")
-        path = create_epub(processed_books)
+        path = create_epub(volumes, progress, workspace, images)
         if not path:
-            return {"error": "Failed to create EPUB"}, 500
-        
-        print(f"Sending EPUB file: {os.path.basename(path)}")
-        logger.debug(f"Sending EPUB file: {os.path.basename(path)}")
-        return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+            raise BuildError("Failed to create EPUB", 500)
+        return {'path': path, 'download_name': os.path.basename(path), 'mimetype': 'application/epub+zip'}
     
-    return {"error": "Unsupported format"}, 400
+    raise BuildError("Unsupported format", 400)
+
+def artifact_url(build_id, download_name):
+    """Stable GET URL of a finished artifact, which answers Range requests until the build is confirmed."""
+    return f"/artifacts/{build_id}/{urllib.parse.quote(download_name)}"
+
+def set_content_disposition(headers, download_name):
+    # Same encoding as send_file: an ASCII fallback plus an RFC 5987 name for other characters
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        names = {
+            'filename': unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii'),
+            'filename*': f"UTF-8''{urllib.parse.quote(download_name, safe='!#$&+^`|')}"
+        }
+    headers.set('Content-Disposition', 'attachment', **names)
+
+def offloaded_file(path, download_name, mimetype):
+    """Return a bodiless response asking the fronting proxy to send ``path``, or None.
+
+    With ARTIFACT_OFFLOAD set to ``x-accel-redirect`` (nginx) the proxy gets
+    the file's location below ARTIFACT_OFFLOAD_PREFIX, an internal location
+    aliased to DOWNLOADS_DIR; with ``x-sendfile`` (Apache, lighttpd) it gets
+    the absolute path. The proxy then answers Range requests itself.
+    """
+    mode = (app.config['ARTIFACT_OFFLOAD'] or '').lower()
+    if not mode:
+        return None
+    response = Response(mimetype=mimetype or 'application/octet-stream')
+    set_content_disposition(response.headers, download_name)
+    if mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(app.config['DOWNLOADS_DIR']))
+        if relative.startswith(os.pardir):
+            return None
+        prefix = app.config['ARTIFACT_OFFLOAD_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{urllib.parse.quote(relative.replace(os.sep, '/'))}"
+        return response
+    logger.warning("Unknown ARTIFACT_OFFLOAD mode '%s', sending the file from the worker", mode)
+    return None
+
+def send_artifact_file(path, download_name, mimetype):
+    """Send a file from a worker, or through the proxy when ARTIFACT_OFFLOAD is set.
+
+    ``send_file`` handles ETag, If-Range and Range on GET requests, so an
+    interrupted download can be resumed from the artifact URL.
+    """
+    response = offloaded_file(path, download_name, mimetype)
+    if response is not None:
+        return response
+    return send_file(path, as_attachment=True, download_name=download_name, mimetype=mimetype)
+
+def send_artifact(artifact):
+    logger.debug("Sending file: %s", artifact['download_name'])
+    if 'stream' in artifact:
+        response = Response(artifact['stream'], mimetype=artifact['mimetype'])
+        response.headers['Content-Disposition'] = f'attachment; filename="{artifact["download_name"]}"'
+        response.headers['X-Build-Id'] = artifact['build_id']
+        if artifact.get('resumable'):
+            # Available once the stream has ended, with Range support for resuming it
+            response.headers['X-Artifact-Url'] = artifact_url(artifact['build_id'], artifact['download_name'])
+        return response
+    response = send_artifact_file(artifact['path'], artifact['download_name'], artifact['mimetype'])
+    if artifact.get('build_id'):
+        response.headers['X-Build-Id'] = artifact['build_id']
+        response.headers['X-Artifact-Url'] = artifact_url(artifact['build_id'], artifact['download_name'])
+    if artifact.get('cached'):
+        response.headers['X-Artifact-Cache'] = 'hit'
+    if artifact.get('failed_volumes'):
+        # Volumes that could not be rendered are left out of the ZIP
+        response.headers['X-Failed-Volumes'] = ','.join(urllib.parse.quote(name) for name in artifact['failed_volumes'])
+    if artifact.get('missing_chapters'):
+        # Chapters that could not be fetched are left out of the book
+        response.headers['X-Missing-Chapters'] = ','.join(urllib.parse.quote(name) for name in artifact['missing_chapters'])
+    return response
+
+def submit_download_job(data):
+    params = {
+        'url': data['url'],
+        'selected_books': data.get('selectedBooks') or [],
+        'selected_format': data['format']
+    }
+    if data.get('selectedChapters'):
+        params['selected_chapters'] = data['selectedChapters']
+    job_id = job_manager.submit(build_download, params)
+    logger.debug("Queued download job %s", job_id)
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}"}, 202
+
+@app.route('/download', methods=['POST', 'OPTIONS'])
+def download():
+    if request.method == 'OPTIONS':
+        response = app.make_default_options_response()
+        headers = response.headers
+        headers['Access-Control-Allow-Origin'] = '*'
+        headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        headers['Access-Control-Allow-Headers'] = 'Content-Type, Accept'
+        return response
+
+    logger.debug("Download request received")
     
+    data = request.json
+    error = validate_download_request(data)
+    if error:
+        return {"error": error}, 400
+
+    if data.get('async'):
+        return submit_download_job(data)
+
+    # Streamed ZIPs start sooner; unless STREAM_ZIP_KEEP is set they cannot be resumed, so clients that need
+    # Range requests can opt out
+    stream = app.config['STREAM_ZIP'] and data.get('stream', True) is not False
+    try:
+        artifact = build_download(data['url'], data.get('selectedBooks') or [], data['format'], stream=stream,
+                                  selected_chapters=data.get('selectedChapters'))
+    except BuildError as e:
+        return {"error": e.message}, e.status
+    return send_artifact(artifact)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Pipeline metrics of every worker in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs', methods=['POST', 'OPTIONS'])
+def create_job():
+    if request.method == 'OPTIONS':
+        response = app.make_default_options_response()
+        headers = response.headers
+        headers['Access-Control-Allow-Origin'] = '*'
+        headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        headers['Access-Control-Allow-Headers'] = 'Content-Type, Accept'
+        return response
+
+    data = request.json
+    error = validate_download_request(data)
+    if error:
+        return {"error": error}, 400
+    return submit_download_job(data)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return {"error": "Job not found"}, 404
+    response = {
+        "job_id": job['id'],
+        "status": job['status'],
+        "progress": job['progress'],
+        "error": job['error']
+    }
+    if job['status'] == 'finished':
+        response["artifact_url"] = f"/jobs/{job['id']}/artifact"
+        response["filename"] = job['artifact']['download_name']
+        response["build_id"] = job['artifact'].get('build_id')
+        response["failed_volumes"] = job['artifact'].get('failed_volumes', [])
+        response["missing_chapters"] = job['artifact'].get('missing_chapters', [])
+    return response, 200
+
+@app.route('/jobs/<job_id>/artifact', methods=['GET'])
+def job_artifact(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return {"error": "Job not found"}, 404
+    if job['status'] != 'finished':
+        return {"error": f"Job is {job['status']}"}, 409
+    if not os.path.exists(job['artifact']['path']):
+        return {"error": "Artifact no longer available"}, 410
+    return send_artifact(job['artifact'])
+
+@app.route('/artifacts/<build_id>/<filename>', methods=['GET'])
+def build_artifact(build_id, filename):
+    """Serve a finished build's artifact under a stable URL, with Range support."""
+    workspace = BuildWorkspace.open(app.config['DOWNLOADS_DIR'], build_id)
+    if workspace is None or workspace.building:
+        return {"error": "Artifact not found"}, 404
+    filename = os.path.basename(filename)
+    path = workspace.file_path(filename)
+    if not filename or not os.path.isfile(path):
+        return {"error": "Artifact not found"}, 404
+    return send_artifact_file(path, filename, mimetypes.guess_type(filename)[0])
 
 @app.route('/confirm-download', methods=['POST', 'OPTIONS'])
 def confirm_download():
@@ -884,103 +1563,82 @@ def confirm_download():
         headers['Access-Control-Allow-Headers'] = 'Content-Type, Accept'
         return response
     
-    print("Download confirmation received - starting cleanup")
     logger.info("Download confirmation received - starting cleanup")
     
     try:
-        filename = request.json.get('filename') if request.json else None
+        data = request.get_json(silent=True) or {}
+        build_id = data.get('buildId')
+        filename = data.get('filename')
+        downloads_dir = app.config['DOWNLOADS_DIR']
         
-        # If specific filename provided, try to remove it first
-        if filename:
-            file_path = os.path.join("app-downloads", filename)
-            if os.path.exists(file_path):
-                try:
-                    print(f"Removing specific file: {file_path}")
-                    logger.debug(f"Removing specific file: {file_path}")
-                    os.remove(file_path)
-                    print(f"Successfully removed file: {file_path}")
-                    logger.debug(f"Successfully removed file: {file_path}")
-                except Exception as e:
-                    print(f"Failed to remove file {file_path}: {e}")
-                    logger.error(f"Failed to remove file {file_path}: {e}")
-        
-        # Clean up entire app-downloads directory
-        if os.path.exists("app-downloads"):
-            files_in_dir = os.listdir("app-downloads")
-            if files_in_dir:
-                print(f"Cleaning up {len(files_in_dir)} files in app-downloads: {files_in_dir}")
-                logger.debug(f"Cleaning up {len(files_in_dir)} files in app-downloads: {files_in_dir}")
-                
-                for file in files_in_dir:
-                    try:
-                        file_path = os.path.join("app-downloads", file)
-                        print(f"Removing file: {file_path}")
-                        logger.debug(f"Removing file: {file_path}")
-                        os.remove(file_path)
-                        print(f"Successfully removed file: {file_path}")
-                        logger.debug(f"Successfully removed file: {file_path}")
-                    except Exception as e:
-                        print(f"Failed to remove file {file_path}: {e}")
-                        logger.error(f"Failed to remove file {file_path}: {e}")
-            
-            # Remove empty app-downloads directory
-            try:
-                if not os.listdir("app-downloads"):
-                    print("Removing empty app-downloads directory")
-                    logger.debug("Removing empty app-downloads directory")
-                    os.rmdir("app-downloads")
-                    print("Successfully removed empty app-downloads directory")
-                    logger.debug("Successfully removed empty app-downloads directory")
-                else:
-                    remaining_files = os.listdir("app-downloads")
-                    print(f"app-downloads directory not empty, contains: {remaining_files}")
-                    logger.debug(f"app-downloads directory not empty, contains: {remaining_files}")
-            except Exception as e:
-                print(f"Failed to remove app-downloads directory: {e}")
-                logger.error(f"Failed to remove app-downloads directory: {e}")
+        # Only remove the workspace of the confirmed build, never other users' files
+        if build_id:
+            workspace = BuildWorkspace.open(downloads_dir, build_id)
+            workspaces = [workspace] if workspace else []
         else:
-            print("app-downloads directory does not exist")
-            logger.debug("app-downloads directory does not exist")
+            # Legacy clients only send the file name; it is ambiguous when builds
+            # finished in the same second, so leave those to the TTL sweep
+            workspaces = BuildWorkspace.find_by_filename(downloads_dir, filename)
+            if len(workspaces) > 1:
+                logger.warning("Not removing %s build workspaces holding %s", len(workspaces), filename)
+                workspaces = []
         
-        # Also clean up temp_images if it exists
-        if os.path.exists("temp_images"):
-            try:
-                print("Removing temp_images directory")
-                logger.debug("Removing temp_images directory")
-                shutil.rmtree("temp_images")
-                print("Successfully removed temp_images directory")
-                logger.debug("Successfully removed temp_images directory")
-            except Exception as e:
-                print(f"Failed to remove temp_images directory: {e}")
-                logger.error(f"Failed to remove temp_images directory: {e}")
+        for workspace in workspaces:
+            logger.debug("Removing build workspace: %s", workspace.path)
+            workspace.cleanup()
+        
+        # Sweep workspaces whose downloads were never confirmed
+        stale = prune_workspaces(downloads_dir, max_age=app.config['WORKSPACE_TTL'])
+        if stale:
+            logger.debug("Removed %s stale build workspaces: %s", len(stale), stale)
         
-        print("Cleanup completed successfully")
         logger.info("Cleanup completed successfully")
         return {"status": "success", "message": "Cleanup completed"}, 200
         
     except Exception as e:
-        print(f"Error during cleanup: {e}")
-        logger.error(f"Error during cleanup: {e}")
+        logger.error("Error during cleanup: %s", e)
         return {"status": "error", "message": str(e)}, 500
     
 
+def sample_body(mimetype, length, read):
+    """Return a small JSON body for debug logging, or None.
+
+    Bodies are only read when debug logging is on, the payload is JSON and its
+    declared length is at most LOG_BODY_MAX_BYTES.
+    """
+    if not logger.isEnabledFor(python_logging.DEBUG) or mimetype != 'application/json':
+        return None
+    if length is None or length > app.config['LOG_BODY_MAX_BYTES']:
+        return None
+    return read().decode('utf-8', errors='replace')
+
 @app.before_request
 def log_request_info():
-    if request.method == 'POST' and request.content_type == 'application/json':
-        try:
-            data = request.json
-            pass
-        except Exception as e:
-            pass
-    else:
-        pass
+    g.request_start = time.perf_counter()
+    body = sample_body(request.mimetype, request.content_length, lambda: request.get_data(cache=True))
+    if body is not None:
+        logger.debug("%s %s request body: %s", request.method, request.path, body)
 
 @app.after_request
 def log_response_info(response):
-    try:
-        response_data = response.get_data(as_text=True)
-    except Exception as e:
-        pass
+    """Log method, path, status, size and latency of every request.
+
+    File and streamed responses are never read: their size is the declared
+    Content-Length (or '-'), and a streamed response's latency is the time
+    until its headers were ready.
+    """
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    passthrough = response.is_streamed or response.direct_passthrough
+    size = response.content_length
+    logger.info(
+        "%s %s %s %s bytes %.1f ms%s",
+        request.method, request.path, response.status_code,
+        size if size is not None else '-', elapsed * 1000, ' (streamed)' if response.is_streamed and not response.direct_passthrough else ''
+    )
+    if not passthrough:
+        body = sample_body(response.mimetype, size, response.get_data)
+        if body is not None:
+            logger.debug("%s %s response body: %s", request.method, request.path, body)
     return response
 
 
@@ -0,0 +1,211 @@
+"""Layout code as it was before rendering.pdf.FlowableBuilder, kept as a baseline.
+
+Every call rebuilds the sample stylesheet and the paragraph styles, and a new
+caption style, table cell style and TableStyle is created for every image and
+table. Only used by benchmarks.bench_rendering.
+"""
+import re
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import Paragraph, Spacer, PageBreak, Image, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER
+from reportlab.lib import colors
+
+
+def legacy_flowables(volume_name, chapters, images):
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        name='TitleStyle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=20,
+        alignment=TA_CENTER
+    )
+
+    chapter_style = ParagraphStyle(
+        name='ChapterStyle',
+        parent=styles['Heading2'],
+        fontSize=18,
+        spaceAfter=12,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+
+    body_style = ParagraphStyle(
+        name='BodyStyle',
+        parent=styles['BodyText'],
+        fontSize=12,
+        spaceAfter=3
+    )
+    
+    part_style = ParagraphStyle(
+        name='PartStyle',
+        parent=body_style,
+        fontSize=12,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold',
+        spaceAfter=6,
+        spaceBefore=6
+    )
+
+    content = []
+    
+    page_width = A4[0] - 108
+    max_width = page_width
+    max_height = A4[1] - 108
+
+    content.append(Paragraph(volume_name, title_style))
+    content.append(Spacer(1, 12))
+
+    for chapter in chapters:
+        if chapter['type'] == 'text':
+            chapter_title = chapter.get('chapter_name', f"Chapter {chapter['chapter_num']}")
+            content.append(Paragraph(chapter_title, chapter_style))
+            
+            chapter_content = chapter['content']
+            
+            if chapter_content:
+                if 'paragraphs' in chapter_content and chapter_content['paragraphs']:
+                    for para in chapter_content['paragraphs']:
+                        if para.strip():
+                            if re.match(r'^Part\s+\d+$', para.strip()):
+                                content.append(Paragraph(para.strip(), part_style))
+                            else:
+                                content.append(Paragraph(para.strip(), body_style))
+                            content.append(Spacer(1, 6))
+                
+                if 'inline_images' in chapter_content and chapter_content['inline_images']:
+                    for img_info in chapter_content['inline_images']:
+                        image = images.get(img_info['src'])
+                        if image:
+                            img_path, size = image
+                            try:
+                                orig_width, orig_height = size
+                                aspect_ratio = orig_width / orig_height
+                                
+                                if orig_width > max_width or orig_height > max_height:
+                                    if orig_width > orig_height:
+                                        img_width = max_width
+                                        img_height = img_width / aspect_ratio
+                                        if img_height > max_height:
+                                            img_height = max_height
+                                            img_width = img_height * aspect_ratio
+                                    else:
+                                        img_height = max_height
+                                        img_width = img_height * aspect_ratio
+                                        if img_width > max_width:
+                                            img_width = max_width
+                                            img_height = img_width / aspect_ratio
+                                else:
+                                    img_width = orig_width
+                                    img_height = orig_height
+                                
+                                img = Image(img_path, width=img_width, height=img_height)
+                                content.append(img)
+                                
+                                if img_info.get('caption'):
+                                    caption_style = ParagraphStyle(
+                                        name='CaptionStyle',
+                                        parent=body_style,
+                                        fontSize=10,
+                                        textColor=colors.grey,
+                                        alignment=TA_CENTER,
+                                        spaceAfter=12
+                                    )
+                                    content.append(Paragraph(img_info['caption'], caption_style))
+                                content.append(Spacer(1, 12))
+                                
+                            except Exception as e:
+                                content.append(Paragraph(f"[Image: {img_info.get('alt', 'No description')}]", body_style))
+                                content.append(Spacer(1, 6))
+                
+                if 'tables' in chapter_content and chapter_content['tables']:
+                    for table_data in chapter_content['tables']:
+                        if table_data:
+                            wrapped_table_data = []
+                            cell_style = ParagraphStyle(
+                                name='TableCellStyle',
+                                parent=body_style,
+                                fontSize=9,
+                                leading=11,
+                                alignment=TA_JUSTIFY
+                            )
+                            
+                            for row in table_data:
+                                wrapped_row = []
+                                for cell in row:
+                                    cell_html = str(cell).replace('\n', '<br/>')
+                                    wrapped_row.append(Paragraph(cell_html, cell_style))
+                                wrapped_table_data.append(wrapped_row)
+                            
+                            num_cols = len(table_data[0])
+                            col_width = page_width / num_cols
+                            
+                            table = Table(wrapped_table_data, colWidths=[col_width] * num_cols)
+                            
+                            table.setStyle(TableStyle([
+                                ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
+                                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+                                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                                ('TOPPADDING', (0, 0), (-1, -1), 6),
+                                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                            ]))
+                            
+                            content.append(table)
+                            content.append(Spacer(1, 12))
+            
+            content.append(PageBreak())
+        elif chapter['type'] == 'illustrations':
+            illustrations_title = chapter.get('chapter_name', 'Illustrations')
+            content.append(Paragraph(illustrations_title, chapter_style))
+            
+            first_img_max_height = max_height - 84
+            
+            for img_info in chapter['images']:
+                img_index = chapter['images'].index(img_info)
+                is_first_image = (img_index == 0)
+                
+                image = images.get(img_info['src'])
+                if image:
+                    img_path, size = image
+                    try:
+                        orig_width, orig_height = size
+                        aspect_ratio = orig_width / orig_height
+                        
+                        img_max_height = first_img_max_height if is_first_image else max_height
+                        
+                        if orig_width > orig_height:
+                            img_width = min(max_width, orig_width)
+                            img_height = img_width / aspect_ratio
+                            if img_height > img_max_height:
+                                img_height = img_max_height
+                                img_width = img_height * aspect_ratio
+                        else:
+                            img_height = min(img_max_height, orig_height)
+                            img_width = img_height * aspect_ratio
+                            if img_width > max_width:
+                                img_width = max_width
+                                img_height = img_width / aspect_ratio
+                        
+                        img_width_points = min(img_width, max_width)
+                        img_height_points = min(img_height, img_max_height)
+                        
+                        img = Image(img_path, width=img_width_points, height=img_height_points)
+                        content.append(img)
+                        
+                        if img_info['caption']:
+                            content.append(Paragraph(img_info['caption'], body_style))
+                        content.append(Spacer(1, 12))
+                        
+                    except Exception as e:
+                        content.append(Paragraph(f"[Image could not be loaded: {img_info.get('alt', 'No description')}]", body_style))
+                        content.append(Spacer(1, 12))
+            content.append(PageBreak())
+
+    return content
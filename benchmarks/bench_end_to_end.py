@@ -0,0 +1,189 @@
+"""End-to-end benchmark against a local stand-in novel site.
+
+Usage: python -m benchmarks.bench_end_to_end [--repeat N] [--volumes N] [--chapters N]
+       [--images N] [--illustrations N] [--latency S] [--output results.json]
+
+Serves a synthetic series from benchmarks.site and times get_webpage_content,
+fetch_chapter, create_single_pdf and full /download requests, each with cold
+and warm caches. The ``delta`` download scenario adds one chapter to every
+volume before each run, like a weekly update of an ongoing series, so it
+measures an incremental rebuild. Every result also records how many requests
+and bytes the site served per run, so changes in network traffic show up next
+to timings.
+"""
+import argparse
+import time
+
+from benchmarks.common import import_app, summarize, write_results
+from benchmarks.site import FixtureSite
+
+DOWNLOADS = {
+    'pdf_single': ('PDF', 1),
+    'pdf_zip': ('PDF', None),
+    'epub': ('EPUB', None),
+}
+
+
+def clear_caches(app):
+    app.toc_cache.clear()
+    for cache in (app.chapter_cache, app.image_store, app.artifact_cache, app.build_manifest):
+        if cache is not None:
+            cache.clear()
+
+
+def measure(site, func, repeat, setup=None, teardown=None):
+    """Time ``repeat`` calls of ``func`` and return a summary with per-run site traffic.
+
+    ``setup`` runs before and ``teardown(result)`` after every call, outside the
+    measured time.
+    """
+    timings = []
+    served = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        site.reset_counters()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+        served.append(site.counters())
+        if teardown:
+            teardown(result)
+    summary = summarize(timings)
+    for name in served[0]:
+        summary[name] = sum(counters[name] for counters in served) / len(served)
+    return summary
+
+
+def in_workspace(app, func):
+    """Run ``func(workspace, images)`` in a fresh build workspace and clean it up afterwards."""
+    def run():
+        workspace = app.BuildWorkspace.create(app.app.config['DOWNLOADS_DIR'])
+        images = app.new_image_prefetcher(workspace)
+        try:
+            return func(workspace, images)
+        finally:
+            images.close()
+            workspace.cleanup()
+    return run
+
+
+def bench_scraping(app, site, repeat):
+    results = []
+    results.append(dict(measure(site, lambda: app.get_webpage_content(site.url), repeat, setup=app.toc_cache.clear),
+                        operation='get_webpage_content', scenario='cold'))
+    results.append(dict(measure(site, lambda: app.get_webpage_content(site.url), repeat),
+                        operation='get_webpage_content', scenario='cached'))
+
+    chapter_url = app.get_webpage_content(site.url)['Volume 1'][1]['url']
+    results.append(dict(measure(site, lambda: app.fetch_chapter(chapter_url), repeat, setup=lambda: clear_caches(app)),
+                        operation='fetch_chapter', scenario='cold'))
+    results.append(dict(measure(site, lambda: app.fetch_chapter(chapter_url), repeat),
+                        operation='fetch_chapter', scenario='revalidated'))
+    return results
+
+
+def bench_pdf(app, site, repeat):
+    books = app.get_webpage_content(site.url)
+    chapters = app.process_chapters({'Volume 1': books['Volume 1']})['Volume 1']
+    build = in_workspace(app, lambda workspace, images: app.create_single_pdf(
+        'Volume 1', chapters, workspace=workspace, images=images))
+    results = []
+    for scenario, setup in (('cold_images', app.image_store.clear if app.image_store else None), ('warm_images', None)):
+        summary = measure(site, build, repeat, setup=setup)
+        results.append(dict(summary, operation='create_single_pdf', scenario=scenario))
+    return results
+
+
+def bench_downloads(app, site, repeat):
+    client = app.app.test_client()
+    artifact_cache = app.artifact_cache
+
+    def download(request):
+        response = client.post('/download', json=request)
+        if response.status_code != 200:
+            raise RuntimeError(f"/download failed with {response.status_code}: {response.get_data()[:200]!r}")
+        size = len(response.get_data())
+        response.close()
+        return response.headers.get('X-Build-Id'), size
+
+    def confirm(result):
+        client.post('/confirm-download', json={'buildId': result[0]})
+
+    results = []
+    try:
+        for name, (fmt, selected) in DOWNLOADS.items():
+            books = list(range(1, (selected or site.volumes) + 1))
+            request = {'url': site.url, 'selectedBooks': books, 'format': fmt}
+            # Start the render workers and warm the imports outside the measurements
+            confirm(download(request))
+            chapters = site.chapters
+
+            def add_chapter():
+                site.resize(site.chapters + 1)
+                app.toc_cache.clear()
+
+            scenarios = (
+                ('cold', None, lambda: clear_caches(app)),
+                ('warm', None, None),
+                ('delta', None, add_chapter),
+                ('artifact_hit', artifact_cache, None),
+            )
+            for scenario, cache, setup in scenarios:
+                if scenario == 'artifact_hit' and cache is None:
+                    continue
+                app.artifact_cache = cache
+                if cache is not None:
+                    confirm(download(request))
+                sizes = []
+                summary = measure(site, lambda: download(request), repeat, setup=setup,
+                                  teardown=lambda result: (sizes.append(result[1]), confirm(result)))
+                summary.update({'operation': 'download', 'scenario': scenario, 'download': name,
+                                'format': fmt, 'volumes': len(books), 'output_bytes': sizes[-1]})
+                results.append(summary)
+                if site.chapters != chapters:
+                    site.resize(chapters)
+                    app.toc_cache.clear()
+    finally:
+        app.artifact_cache = artifact_cache
+    return results
+
+
+def run(repeat=3, **site_params):
+    app = import_app()
+    results = []
+    try:
+        with FixtureSite(**site_params) as site:
+            results += bench_scraping(app, site, repeat)
+            results += bench_pdf(app, site, repeat)
+            results += bench_downloads(app, site, repeat)
+            for row in results:
+                row['site'] = site.params()
+    finally:
+        if app.render_pool is not None:
+            app.render_pool.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--volumes', type=int, default=2)
+    parser.add_argument('--chapters', type=int, default=4)
+    parser.add_argument('--images', type=int, default=2, help='inline images per chapter')
+    parser.add_argument('--illustrations', type=int, default=4, help='images per illustrations page')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat, volumes=args.volumes, chapters=args.chapters, images=args.images,
+                  illustrations=args.illustrations, latency=args.latency)
+    print(f"{'operation':<20} {'scenario':<13} {'download':<11} {'median ms':>10} {'requests':>9} {'KiB served':>11}")
+    for row in results:
+        print(f"{row['operation']:<20} {row['scenario']:<13} {row.get('download', ''):<11} "
+              f"{row['median_s'] * 1000:>10.1f} {row['requests']:>9.0f} {row['bytes_served'] / 1024:>11.0f}")
+    print(f"Results written to {write_results('end_to_end', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""EPUB vs. PDF build benchmark.
+
+Usage: python -m benchmarks.bench_epub [--repeat N] [--output results.json]
+
+Renders the same synthetic volumes as EPUB and as PDF and reports build time,
+peak memory and output size. Each format runs in a fresh worker process so its
+peak resident set size is not inflated by the other.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import tracemalloc
+
+from benchmarks.bench_rendering import WORKLOADS, make_volume
+from benchmarks.common import import_app, summarize, timed, write_results
+from rendering.epub import render_epub
+from rendering.pdf import render_pdf
+
+RENDERERS = {
+    'epub': render_epub,
+    'pdf': render_pdf,
+}
+
+
+def max_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(fmt, volumes, images, output_dir, repeat):
+    """Runs in a worker process: time ``repeat`` builds and measure their memory."""
+    render = RENDERERS[fmt]
+    filepath = os.path.join(output_dir, f"book.{fmt}")
+    baseline_rss = max_rss_bytes()
+    render(volumes, filepath, images)
+    rss_growth = max_rss_bytes() - baseline_rss
+
+    timings, _ = timed(lambda: render(volumes, filepath, images), repeat=repeat)
+
+    tracemalloc.start()
+    render(volumes, filepath, images)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize(timings)
+    summary.update({
+        'format': fmt,
+        'peak_rss_growth_bytes': rss_growth,
+        'peak_traced_bytes': peak,
+        'output_bytes': os.path.getsize(filepath),
+    })
+    return summary
+
+
+def run(repeat=3, volumes=2):
+    app = import_app()
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='webtoreader-bench-epub-') as scratch:
+        for workload, params in WORKLOADS.items():
+            chapters, images = make_volume(app, scratch, **params)
+            book = {f"Volume {n}": chapters for n in range(1, volumes + 1)}
+            for fmt in RENDERERS:
+                with context.Pool(1) as pool:
+                    summary = pool.apply(measure, (fmt, book, images, scratch, repeat))
+                summary.update({'workload': workload, 'volumes': volumes})
+                results.append(summary)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--volumes', type=int, default=2)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat, volumes=args.volumes)
+    print(f"{'workload':<12} {'format':<6} {'median ms':>10} {'RSS growth MiB':>15} {'traced peak MiB':>16} {'size KiB':>9}")
+    for row in results:
+        print(f"{row['workload']:<12} {row['format']:<6} {row['median_s'] * 1000:>10.1f} "
+              f"{row['peak_rss_growth_bytes'] / 2 ** 20:>15.1f} {row['peak_traced_bytes'] / 2 ** 20:>16.1f} "
+              f"{row['output_bytes'] / 1024:>9.0f}")
+    print(f"Results written to {write_results('epub', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
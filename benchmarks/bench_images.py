@@ -0,0 +1,92 @@
+"""Image transcoding benchmark for PDF builds.
+
+Usage: python -m benchmarks.bench_images [--repeat N] [--output results.json]
+
+Renders a synthetic volume whose images are large photo-like PNGs, as sites
+often serve illustrations, with the source images embedded as they are and
+with the ImageTranscoder at a few settings, and reports build time and
+output size next to the total size of the source images.
+"""
+import argparse
+import os
+import tempfile
+
+from PIL import Image as PILImage
+
+from benchmarks.bench_rendering import make_volume
+from benchmarks.common import import_app, summarize, timed, write_results
+from rendering.images import ImageTranscoder
+from rendering.pdf import render_volume_pdf
+
+VOLUME = {'chapters': 6, 'paragraphs': 30, 'images': 3, 'tables': 1}
+# Illustrations and inline images at the sizes of high resolution scans
+ILLUSTRATION_SIZE = (3000, 4200)
+INLINE_SIZE = (2400, 1350)
+
+PROFILES = {
+    'source': None,
+    'jpeg_150dpi': ImageTranscoder(dpi=150, quality=80),
+    'jpeg_300dpi': ImageTranscoder(dpi=300, quality=85),
+    'eink_gray': ImageTranscoder(dpi=150, quality=75, grayscale=True),
+}
+
+
+def photo(size, seed):
+    """A gradient with grain, which compresses about as well as a scanned illustration."""
+    base = PILImage.linear_gradient('L').rotate(seed * 37 % 360).resize(size)
+    tint = PILImage.merge('RGB', (base, base.point(lambda v: 255 - v), base.point(lambda v: v // 2 + 64)))
+    grain = PILImage.effect_noise(size, 48).convert('RGB')
+    return PILImage.blend(tint, grain, 0.25)
+
+
+def make_photo_volume(app, images_dir):
+    """Return (chapters, images map) with every image replaced by a large photo-like PNG."""
+    chapters, images = make_volume(app, images_dir, **VOLUME)
+    for seed, (src, (path, _)) in enumerate(sorted(images.items())):
+        size = ILLUSTRATION_SIZE if 'illustration' in src else INLINE_SIZE
+        photo(size, seed).save(path)
+        images[src] = (path, size)
+    return chapters, images
+
+
+def run(repeat=3):
+    app = import_app()
+    results = []
+    with tempfile.TemporaryDirectory(prefix='webtoreader-bench-images-') as scratch:
+        chapters, images = make_photo_volume(app, scratch)
+        source_bytes = sum(os.path.getsize(path) for path, _ in images.values())
+        for profile, transcoder in PROFILES.items():
+            filepath = os.path.join(scratch, f"{profile}.pdf")
+            timings, pages = timed(
+                lambda: render_volume_pdf('Volume 1', chapters, filepath, images, transcoder=transcoder),
+                repeat=repeat
+            )
+            summary = summarize(timings)
+            summary.update({
+                'profile': profile,
+                'settings': transcoder.settings() if transcoder else None,
+                'images': len(images),
+                'source_image_bytes': source_bytes,
+                'pages': pages,
+                'output_bytes': os.path.getsize(filepath),
+            })
+            results.append(summary)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat)
+    print(f"{'profile':<12} {'images':>6} {'pages':>6} {'median ms':>10} {'size KiB':>10}")
+    for row in results:
+        print(f"{row['profile']:<12} {row['images']:>6} {row['pages']:>6} "
+              f"{row['median_s'] * 1000:>10.1f} {row['output_bytes'] / 1024:>10.0f}")
+    print(f"Results written to {write_results('images', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
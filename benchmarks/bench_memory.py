@@ -0,0 +1,86 @@
+"""Peak memory benchmark for whole and chunked PDF builds of large volumes.
+
+Usage: python -m benchmarks.bench_memory [--chapters N ...] [--chunk N] [--output results.json]
+
+Renders synthetic volumes of increasing length, with incompressible images,
+in one pass and in batches of ``--chunk`` chapters, and reports build time
+and peak resident set size growth. Each build runs in a fresh worker process
+so its peak resident set size is not inflated by the others. A whole build
+grows with the volume; a chunked build should stay flat.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from PIL import Image as PILImage
+
+from benchmarks.bench_rendering import make_volume
+from benchmarks.common import import_app, write_results
+from rendering.pdf import render_volume_pdf
+
+CHAPTER_COUNTS = (8, 24, 48)
+VOLUME = {'paragraphs': 30, 'images': 2, 'tables': 1}
+
+
+def fill_with_noise(images):
+    """Overwrite the volume's images with random pixels, which compress about as badly as photos."""
+    for path, size in images.values():
+        PILImage.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)).save(path)
+
+
+def max_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(chapters, images, filepath, chunk_chapters):
+    """Runs in a worker process: build once and return its time and memory."""
+    baseline_rss = max_rss_bytes()
+    start = time.perf_counter()
+    pages = render_volume_pdf('Volume 1', chapters, filepath, images, chunk_chapters=chunk_chapters)
+    seconds = time.perf_counter() - start
+    return {
+        'pages': pages,
+        'seconds': seconds,
+        'peak_rss_growth_bytes': max_rss_bytes() - baseline_rss,
+        'output_bytes': os.path.getsize(filepath),
+    }
+
+
+def run(chapter_counts=CHAPTER_COUNTS, chunk=8):
+    app = import_app()
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='webtoreader-bench-memory-') as scratch:
+        for count in chapter_counts:
+            chapters, images = make_volume(app, scratch, chapters=count, **VOLUME)
+            fill_with_noise(images)
+            filepath = os.path.join(scratch, f"volume_{count}.pdf")
+            for mode, chunk_chapters in (('whole', 0), ('chunked', chunk)):
+                with context.Pool(1) as pool:
+                    summary = pool.apply(measure, (chapters, images, filepath, chunk_chapters))
+                summary.update({'chapters': count, 'mode': mode, 'chunk_chapters': chunk_chapters})
+                results.append(summary)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chapters', type=int, nargs='+', default=list(CHAPTER_COUNTS))
+    parser.add_argument('--chunk', type=int, default=8)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(chapter_counts=args.chapters, chunk=args.chunk)
+    print(f"{'chapters':>8} {'mode':<8} {'pages':>6} {'build ms':>10} {'RSS growth MiB':>15} {'size KiB':>9}")
+    for row in results:
+        print(f"{row['chapters']:>8} {row['mode']:<8} {row['pages']:>6} {row['seconds'] * 1000:>10.1f} "
+              f"{row['peak_rss_growth_bytes'] / 2 ** 20:>15.1f} {row['output_bytes'] / 1024:>9.0f}")
+    print(f"Results written to {write_results('memory', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Parse-time benchmark for the HTML parser backends.
+
+Usage: python -m benchmarks.bench_parsing [--repeat N] [--output results.json]
+
+Times parse_chapter, parse_illustrations and parse_table_of_contents on
+synthetic WordPress pages for every installed backend, with and without
+scoped parsing, and checks that each combination produces the same output as
+the original full html.parser parse.
+"""
+import argparse
+
+from benchmarks import fixtures
+from benchmarks.common import import_app, summarize, timed, write_results
+from scraping.parsing import HtmlParser, available_backends
+
+
+def run(repeat=20):
+    app = import_app()
+    pages = {
+        'chapter': (app.parse_chapter, [fixtures.chapter_page(seed=i) for i in range(5)]),
+        'illustrations': (app.parse_illustrations, [fixtures.illustrations_page(seed=i) for i in range(5)]),
+        'index': (app.parse_table_of_contents, [fixtures.index_page(volumes=12, chapters=25)]),
+    }
+
+    original_parser = app.html_parser
+    results = []
+    try:
+        app.html_parser = HtmlParser('html.parser', scoped=False)
+        reference = {kind: [parse(page) for page in batch] for kind, (parse, batch) in pages.items()}
+
+        for backend in available_backends():
+            for scoped in (False, True):
+                app.html_parser = HtmlParser(backend, scoped=scoped)
+                for kind, (parse, batch) in pages.items():
+                    timings, output = timed(lambda: [parse(page) for page in batch], repeat=repeat)
+                    summary = summarize([t / len(batch) for t in timings])
+                    summary.update({
+                        'backend': backend,
+                        'scoped': scoped,
+                        'page': kind,
+                        'page_bytes': sum(len(page) for page in batch) // len(batch),
+                        'identical_output': output == reference[kind],
+                    })
+                    results.append(summary)
+    finally:
+        app.html_parser = original_parser
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat)
+    print(f"{'backend':<12} {'scoped':<7} {'page':<14} {'median ms':>10} {'identical':>10}")
+    for row in results:
+        print(f"{row['backend']:<12} {str(row['scoped']):<7} {row['page']:<14} "
+              f"{row['median_s'] * 1000:>10.2f} {str(row['identical_output']):>10}")
+    print(f"Results written to {write_results('parsing', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
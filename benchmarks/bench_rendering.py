@@ -0,0 +1,131 @@
+"""Layout benchmark for the PDF flowable builder.
+
+Usage: python -m benchmarks.bench_rendering [--repeat N] [--output results.json]
+
+Builds image-heavy and table-heavy synthetic volumes with the shared
+FlowableBuilder and with the pre-refactor layout code, and reports the time
+and memory allocations of building the flowables as well as the time of the
+full document build.
+"""
+import argparse
+import io
+import os
+import tempfile
+import tracemalloc
+
+from PIL import Image as PILImage
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate
+
+from benchmarks import fixtures
+from benchmarks.baseline_layout import legacy_flowables
+from benchmarks.common import import_app, summarize, timed, write_results
+from rendering.pdf import FlowableBuilder
+
+WORKLOADS = {
+    'image_heavy': {'chapters': 6, 'paragraphs': 40, 'images': 25, 'tables': 1},
+    'table_heavy': {'chapters': 6, 'paragraphs': 40, 'images': 2, 'tables': 12},
+}
+
+
+def make_volume(app, images_dir, chapters, paragraphs, images, tables):
+    """Return (chapters, images map) for a synthetic volume with real image files."""
+    volume = [{
+        'chapter_num': None, 'chapter_name': 'Illustrations', 'type': 'illustrations',
+        'images': app.parse_illustrations(fixtures.illustrations_page(seed=0, images=6)),
+    }]
+    for n in range(1, chapters + 1):
+        page = fixtures.chapter_page(seed=n, paragraphs=paragraphs, images=images, tables=tables, comments=0)
+        volume.append({'chapter_num': n, 'chapter_name': f'Chapter {n}', 'type': 'text', 'content': app.parse_chapter(page)})
+
+    image_map = {}
+    for chapter in volume:
+        for img_info in app.chapter_images(chapter['type'], chapter.get('images') or chapter.get('content')):
+            src = img_info['src']
+            if src not in image_map:
+                size = (1200, 1700) if 'illustration' in src else (800, 450)
+                path = os.path.join(images_dir, f"{len(image_map)}.png")
+                PILImage.new('RGB', size, (len(image_map) % 255, 90, 160)).save(path)
+                image_map[src] = (path, size)
+    return volume, image_map
+
+
+def measure_allocations(func):
+    """Return (allocated blocks still referenced, peak traced bytes) for one call of ``func``."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del result
+    return blocks, peak
+
+
+def build_document(content):
+    pages = [0]
+
+    def count_page(canvas, doc):
+        pages[0] += 1
+
+    doc = SimpleDocTemplate(io.BytesIO(), pagesize=A4, rightMargin=54, leftMargin=54, topMargin=54, bottomMargin=18)
+    doc.build(content, onFirstPage=count_page, onLaterPages=count_page)
+    return pages[0]
+
+
+def run(repeat=5):
+    app = import_app()
+    results = []
+    with tempfile.TemporaryDirectory(prefix='webtoreader-bench-images-') as images_dir:
+        for workload, params in WORKLOADS.items():
+            chapters, images = make_volume(app, images_dir, **params)
+            layouts = {
+                'legacy': lambda: legacy_flowables('Volume 1', chapters, images),
+                'builder': lambda: FlowableBuilder(images).volume('Volume 1', chapters),
+            }
+            for layout in layouts.values():
+                # Warm up ReportLab's caches and compile the shared styles outside the measurements
+                build_document(layout())
+            flowable_timings = {name: [] for name in layouts}
+            build_timings = {name: [] for name in layouts}
+            # Alternate between the layouts so drift affects both equally
+            for _ in range(repeat):
+                for name, layout in layouts.items():
+                    timings, content = timed(layout, repeat=1)
+                    flowable_timings[name] += timings
+                    timings, pages = timed(lambda: build_document(layout()), repeat=1)
+                    build_timings[name] += timings
+            for name, layout in layouts.items():
+                blocks, peak = measure_allocations(layout)
+                summary = summarize(build_timings[name])
+                summary.update({
+                    'workload': workload,
+                    'layout': name,
+                    'flowables': len(layout()),
+                    'pages': build_document(layout()),
+                    'flowables_median_s': summarize(flowable_timings[name])['median_s'],
+                    'allocated_blocks': blocks,
+                    'peak_bytes': peak,
+                })
+                results.append(summary)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat)
+    print(f"{'workload':<12} {'layout':<8} {'pages':>6} {'flowables ms':>13} {'build ms':>10} {'blocks':>8} {'peak KiB':>9}")
+    for row in results:
+        print(f"{row['workload']:<12} {row['layout']:<8} {row['pages']:>6} "
+              f"{row['flowables_median_s'] * 1000:>13.2f} {row['median_s'] * 1000:>10.1f} "
+              f"{row['allocated_blocks']:>8} {row['peak_bytes'] / 1024:>9.1f}")
+    print(f"Results written to {write_results('rendering', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
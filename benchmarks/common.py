@@ -0,0 +1,65 @@
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench_results')
+
+
+def import_app():
+    """Import the Flask app with its caches pointed at a throwaway directory."""
+    scratch = tempfile.mkdtemp(prefix='webtoreader-bench-')
+    for name in ('CACHE_DIR', 'JOBS_DIR', 'DOWNLOADS_DIR'):
+        os.environ.setdefault(f'FLASK_{name}', os.path.join(scratch, name.lower()))
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def timed(func, repeat=5, setup=None):
+    """Run ``func`` ``repeat`` times and return (timings in seconds, last result).
+
+    ``setup`` is called before every run, outside the measured time.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'min_s': ordered[0],
+        'median_s': ordered[len(ordered) // 2],
+        'max_s': ordered[-1],
+    }
+
+
+def write_results(name, results, output=None):
+    """Write benchmark results as JSON and return the file path."""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{name}_{timestamp}.json")
+    payload = {
+        'benchmark': name,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    return output
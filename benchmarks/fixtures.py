@@ -0,0 +1,101 @@
+import random
+
+from scraping.parsing import CONTENT_CLASS
+
+WORDS = (
+    "the of and a to in he she it was that his her with as for had you on not at but "
+    "sword magic guild dungeon knight village princess demon lord academy mana spirit "
+    "quietly suddenly laughed replied carefully smiled whispered glanced shouted"
+).split()
+
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def paragraph(rng, sentences=4):
+    return ' '.join(sentence(rng, rng.randint(8, 18)) for _ in range(sentences))
+
+
+def page_chrome(rng, body):
+    """Wrap ``body`` in WordPress theme chrome: header, navigation, sidebar and footer."""
+    nav = ''.join(f'<li class="menu-item"><a href="https://example.com/page-{i}/">{sentence(rng, 2)}</a></li>' for i in range(40))
+    widgets = ''.join(
+        f'<section class="widget"><h2 class="widget-title">{sentence(rng, 3)}</h2><ul>'
+        + ''.join(f'<li><a href="https://example.com/post-{i}-{j}/">{sentence(rng, 6)}</a></li>' for j in range(15))
+        + '</ul></section>'
+        for i in range(6)
+    )
+    return (
+        '<!DOCTYPE html><html lang="en-US"><head><meta charset="UTF-8"><title>Series</title>'
+        + ''.join(f'<link rel="stylesheet" href="https://example.com/wp-content/style-{i}.css">' for i in range(10))
+        + '<script>' + 'var wpData = {"a": 1};' * 50 + '</script></head><body class="wp-site-blocks">'
+        + f'<header class="wp-block-template-part"><nav class="wp-block-navigation"><ul>{nav}</ul></nav></header>'
+        + f'<main class="wp-block-group">{body}</main>'
+        + f'<aside class="sidebar">{widgets}</aside>'
+        + f'<footer class="wp-block-template-part"><p>{paragraph(rng, 3)}</p></footer>'
+        + '</body></html>'
+    )
+
+
+def comments_block(rng, count):
+    comments = ''.join(
+        f'<li class="comment"><div class="comment-author">{sentence(rng, 2)}</div>'
+        f'<div class="comment-content"><p>{paragraph(rng, 2)}</p></div></li>'
+        for _ in range(count)
+    )
+    return f'<div class="wp-block-comments"><h2>Comments</h2><ol class="wp-block-comment-template">{comments}</ol></div>'
+
+
+def chapter_page(seed=0, paragraphs=120, tables=1, images=2, comments=40, image_base='https://img.example.com'):
+    """Return a synthetic WordPress chapter page as bytes."""
+    rng = random.Random(seed)
+    parts = ['<p class="has-text-align-center"><a href="https://example.com/prev/">Previous</a> | <a href="https://example.com/next/">Next</a></p>']
+    image_every = max(paragraphs // images, 1) if images else 0
+    for i in range(paragraphs):
+        if i == paragraphs // 2:
+            parts.append('<p>Part 2</p>')
+        parts.append(f'<p>{paragraph(rng)}</p>')
+        if image_every and i % image_every == 0 and i // image_every < images:
+            n = i // image_every
+            parts.append(
+                f'<figure class="wp-block-image size-large"><img src="{image_base}/seed{seed}-inline{n}.png" alt="Inline {n}"/>'
+                f'<figcaption>{sentence(rng, 5)}</figcaption></figure>'
+            )
+    for _ in range(tables):
+        rows = ''.join(
+            '<tr>' + ''.join(f'<td>{sentence(rng, 3)}<br>{sentence(rng, 2)}</td>' for _ in range(3)) + '</tr>'
+            for _ in range(6)
+        )
+        parts.append(f'<figure class="wp-block-table"><table><tbody>{rows}</tbody></table></figure>')
+    parts.append('<p class="has-text-align-center"><a href="https://example.com/prev/">Previous</a> | <a href="https://example.com/next/">Next</a></p>')
+    parts.append(comments_block(rng, comments))
+    body = f'<div class="{CONTENT_CLASS}">' + ''.join(parts) + '</div>'
+    return page_chrome(rng, body).encode('utf-8')
+
+
+def illustrations_page(seed=0, images=8, image_base='https://img.example.com'):
+    """Return a synthetic illustrations page as bytes."""
+    rng = random.Random(seed)
+    figures = ''.join(
+        f'<figure class="wp-block-image size-full"><img src="{image_base}/seed{seed}-illustration{i}.png" alt="Illustration {i}"/></figure>'
+        for i in range(images)
+    )
+    body = f'<div class="{CONTENT_CLASS}">{figures}{comments_block(rng, 10)}</div>'
+    return page_chrome(rng, body).encode('utf-8')
+
+
+def index_page(base_url='https://example.com', volumes=5, chapters=10, seed=0):
+    """Return a synthetic series index page with ``Volume N`` sections as bytes."""
+    rng = random.Random(seed)
+    sections = [f'<p>{paragraph(rng, 5)}</p>']
+    for v in range(1, volumes + 1):
+        links = [f'<a href="{base_url}/v{v}-illustrations/">Illustrations</a><br>']
+        links += [f'<a href="{base_url}/v{v}-chapter-{c}/">Chapter {c}</a><br>' for c in range(1, chapters + 1)]
+        sections.append(
+            f'<h3 class="wp-block-heading">Volume {v}</h3>'
+            f'<div class="wp-block-group"><div class="wp-block-group__inner-container"><p>{"".join(links)}</p></div></div>'
+        )
+    body = f'<div class="{CONTENT_CLASS}">' + ''.join(sections) + comments_block(rng, 20) + '</div>'
+    return page_chrome(rng, body).encode('utf-8')
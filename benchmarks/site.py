@@ -0,0 +1,183 @@
+"""Local stand-in for a WordPress novel site, served from synthetic pages.
+
+The series index lists ``Volume N`` sections whose chapter and illustration
+links, and every image on those pages, point back at the local server, so the
+whole scraping and rendering path can run without network access.
+"""
+import hashlib
+import io
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image as PILImage
+
+from benchmarks import fixtures
+
+IMAGE_PATH = re.compile(r'^/img/[\w-]+\.png$')
+
+
+def image_bytes(path, size):
+    """Return a PNG of ``size`` with smooth noise seeded by ``path``.
+
+    Upscaled noise compresses roughly like a real illustration, and every
+    image differs, so content deduplication does not hide downloads.
+    """
+    seed = zlib.crc32(path.encode('utf-8'))
+    small = (max(size[0] // 8, 1), max(size[1] // 8, 1))
+    noise = PILImage.effect_noise(small, 40 + seed % 40).resize(size, PILImage.BILINEAR)
+    tint = PILImage.new('L', size, seed % 256)
+    image = PILImage.merge('RGB', (noise, tint, noise))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FixtureSite:
+    """Serves a synthetic series on 127.0.0.1 on a background thread.
+
+    Pages and images are generated when the site starts so that serving them
+    costs the same on every run. Pages carry an ``ETag`` and answer
+    ``If-None-Match`` with 304, like the real site. ``latency`` adds a delay in
+    seconds to every response to model a remote host.
+    """
+
+    def __init__(self, volumes=2, chapters=4, paragraphs=120, images=2, tables=1, comments=40,
+                 illustrations=4, illustration_size=(1200, 1700), inline_size=(800, 450), latency=0.0):
+        self.volumes = volumes
+        self.chapters = chapters
+        self.paragraphs = paragraphs
+        self.images = images
+        self.tables = tables
+        self.comments = comments
+        self.illustrations = illustrations
+        self.illustration_size = illustration_size
+        self.inline_size = inline_size
+        self.latency = latency
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'not_modified': 0, 'bytes_served': 0}
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def params(self):
+        return {
+            'volumes': self.volumes,
+            'chapters': self.chapters,
+            'paragraphs': self.paragraphs,
+            'images': self.images,
+            'tables': self.tables,
+            'comments': self.comments,
+            'illustrations': self.illustrations,
+            'illustration_size': list(self.illustration_size),
+            'inline_size': list(self.inline_size),
+            'latency': self.latency,
+        }
+
+    def _generate(self):
+        base = self.url.rstrip('/')
+        image_base = f"{base}/img"
+        pages = {'/': fixtures.index_page(base_url=base, volumes=self.volumes, chapters=self.chapters)}
+        for v in range(1, self.volumes + 1):
+            pages[f'/v{v}-illustrations/'] = fixtures.illustrations_page(seed=v, images=self.illustrations, image_base=image_base)
+            for c in range(1, self.chapters + 1):
+                pages[f'/v{v}-chapter-{c}/'] = fixtures.chapter_page(
+                    seed=v * 1000 + c, paragraphs=self.paragraphs, tables=self.tables, images=self.images,
+                    comments=self.comments, image_base=image_base
+                )
+
+        responses = {path: (body, 'text/html; charset=UTF-8') for path, body in pages.items()}
+        for body in pages.values():
+            for src in re.findall(rb'src="([^"]+)"', body):
+                path = src.decode('utf-8')[len(base):]
+                if IMAGE_PATH.match(path) and path not in responses:
+                    size = self.illustration_size if 'illustration' in path else self.inline_size
+                    responses[path] = (image_bytes(path, size), 'image/png')
+        return {
+            path: (body, content_type, f'"{hashlib.sha1(body).hexdigest()}"')
+            for path, (body, content_type) in responses.items()
+        }
+
+    def resize(self, chapters):
+        """Regenerate the site with ``chapters`` chapters per volume, as an ongoing series grows.
+
+        Pages and images that already existed are generated identically, so
+        they keep their ETags.
+        """
+        self.chapters = chapters
+        self._responses = self._generate()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset_counters(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self._counters, 0)
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if site.latency:
+                    time.sleep(site.latency)
+                site._count('requests')
+                response = site._responses.get(self.path.split('?', 1)[0])
+                if response is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body, content_type, etag = response
+                if self.headers.get('If-None-Match') == etag:
+                    site._count('not_modified')
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                site._count('bytes_served', len(body))
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._responses = self._generate()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fixture-site', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
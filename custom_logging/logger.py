@@ -1,13 +1,37 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
 import glob
 
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The standard QueueHandler formats every record before queueing it so that
+    it can be pickled; records here stay in-process, so the calling thread
+    only pays for putting the record on the queue.
+    """
+
+    def prepare(self, record):
+        return record
+
+
 class AppLogger:
-    """Application Logger with rotating file handler."""
+    """Application Logger with rotating file handler.
+
+    With ``async_mode`` the logger only puts records on a queue and a
+    background listener thread formats and writes them, so request handling
+    never waits for the disk.
+    """
 
-    def __init__(self, log_dir='logs', max_bytes=1_000_000, backup_count=5, max_age=10, max_lines=1000):
+    # Loggers are process-wide, so each one has at most one listener feeding from it
+    _listeners = {}
+
+    def __init__(self, log_dir='logs', max_bytes=1_000_000, backup_count=5, max_age=10, max_lines=1000,
+                 level=logging.DEBUG, async_mode=True, name='AppLogger'):
         self.log_dir = log_dir
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
@@ -16,15 +40,17 @@ class AppLogger:
         self.max_age = max_age
         self.max_lines = max_lines
 
-        log_file = os.path.join(log_dir, 'info.log')
-        self.logger = logging.getLogger('AppLogger')
-        self.logger.setLevel(logging.DEBUG)
+        self.name = name
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level)
 
+        self.stop()
         self.logger.handlers.clear()
-        self._setup_handlers()
+        # Trim before the file handler opens info.log
         self._cleanup_logs()
-        
-    def _setup_handlers(self):
+        self._setup_handlers(async_mode)
+
+    def _setup_handlers(self, async_mode):
         log_file = os.path.join(self.log_dir, 'info.log')
         file_handler = RotatingFileHandler(
             log_file, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
@@ -35,15 +61,57 @@ class AppLogger:
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.WARNING)
         console_formatter = logging.Formatter(
             '%(levelname)s - %(message)s'
         )
         console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
-        
+
+        if not async_mode:
+            self.logger.addHandler(file_handler)
+            self.logger.addHandler(console_handler)
+            return
+
+        records = queue.SimpleQueue()
+        self.logger.addHandler(DeferredQueueHandler(records))
+        listener = QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+        AppLogger._listeners[self.name] = listener
+        listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out queued records and stop the listener thread."""
+        listener = AppLogger._listeners.pop(self.name, None)
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+    @staticmethod
+    def _tail(path, max_lines, block_size=64 * 1024):
+        """Return the bytes of the last ``max_lines`` lines of ``path``, or None if it is not longer than that.
+
+        Reads backwards from the end of the file one block at a time, so only
+        the kept tail is ever loaded.
+        """
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            tail = b''
+            while position > 0:
+                read = min(block_size, position)
+                position -= read
+                f.seek(position)
+                tail = f.read(read) + tail
+                # A final newline ends the last line rather than starting another
+                cut = len(tail) - 1 if tail.endswith(b'\n') else len(tail)
+                if tail.count(b'\n', 0, cut) >= max_lines:
+                    for _ in range(max_lines):
+                        cut = tail.rindex(b'\n', 0, cut)
+                    return tail[cut + 1:]
+        return None
+
     def _cleanup_logs(self):
         """Clean up old log files based on age and line count."""
         try:
@@ -55,16 +123,17 @@ class AppLogger:
                     if file_age > self.max_age:
                         os.remove(log_file)
                         continue
-                    
-                    # Check line count and truncate if needed
+
+                    # Keep only the last max_lines lines
                     if log_file.endswith('.log'):
                         try:
-                            with open(log_file, 'r', encoding='utf-8') as f:
-                                lines = f.readlines()
-                            if len(lines) > self.max_lines:
-                                with open(log_file, 'w', encoding='utf-8') as f:
-                                    f.writelines(lines[-self.max_lines:])
+                            tail = self._tail(log_file, self.max_lines)
+                            if tail is not None:
+                                tmp_path = f"{log_file}.tmp"
+                                with open(tmp_path, 'wb') as f:
+                                    f.write(tail)
+                                os.replace(tmp_path, log_file)
                         except Exception:
                             pass
         except Exception:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from pipeline.storage import Database, evict_lru, link_or_copy, remove_file, replace_with_copy
+
+
+class ArtifactCache:
+    """Size- and age-bounded cache of finished downloads, shared by every worker.
+
+    Artifacts are stored under ``cache_dir/artifacts`` keyed by a hash of what
+    went into them (see ``key``). Readers take a lease on an entry while they
+    copy or send it; leased entries are never evicted, so cleanup cannot remove
+    a file that is still being served. Leases expire on their own after
+    ``lease_ttl`` seconds in case a worker dies without releasing them.
+    """
+
+    def __init__(self, cache_dir='cache', max_bytes=2 * 1024 * 1024 * 1024, max_age=24 * 3600, lease_ttl=3600):
+        self.artifacts_dir = os.path.join(cache_dir, 'artifacts')
+        if not os.path.exists(self.artifacts_dir):
+            os.makedirs(self.artifacts_dir, exist_ok=True)
+        self.db_path = os.path.join(self.artifacts_dir, 'index.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lease_ttl = lease_ttl
+
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stored': 0, 'evictions': 0}
+        self._db = Database(self.db_path, [
+            'CREATE TABLE IF NOT EXISTS artifacts ('
+            ' key TEXT PRIMARY KEY,'
+            ' filename TEXT NOT NULL,'
+            ' download_name TEXT NOT NULL,'
+            ' mimetype TEXT,'
+            ' size INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)',
+            'CREATE TABLE IF NOT EXISTS leases ('
+            ' id TEXT PRIMARY KEY,'
+            ' key TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed_at)',
+            'CREATE INDEX IF NOT EXISTS leases_key ON leases (key)',
+        ])
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    @staticmethod
+    def key(volumes, fingerprint, fmt, renderer_version):
+        """Hash the chapter URLs of ``volumes``, their content fingerprint, the format and renderer version.
+
+        ``volumes`` maps each volume name to the list of its chapter URLs.
+        """
+        chapters = [[volume, list(urls)] for volume, urls in volumes.items()]
+        payload = json.dumps([chapters, fingerprint, str(fmt).lower(), renderer_version])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, filename):
+        return os.path.join(self.artifacts_dir, filename)
+
+    def acquire(self, key):
+        """Lease the entry for ``key`` and return it, or None on a miss.
+
+        The returned dict has the artifact ``path``, ``download_name``,
+        ``mimetype`` and the ``lease`` id to pass to ``release``.
+        """
+        now = time.time()
+        conn = self._db.connection()
+        row = conn.execute('SELECT * FROM artifacts WHERE key = ?', (key,)).fetchone()
+        if row is None or now - row['created_at'] > self.max_age or not os.path.exists(self.path_for(row['filename'])):
+            self._count('misses')
+            return None
+        lease = uuid.uuid4().hex
+        conn.execute('INSERT INTO leases (id, key, expires_at) VALUES (?, ?, ?)', (lease, key, now + self.lease_ttl))
+        conn.execute('UPDATE artifacts SET accessed_at = ? WHERE key = ?', (now, key))
+        # The entry may have been evicted between the lookup and the lease
+        if not os.path.exists(self.path_for(row['filename'])):
+            self.release(lease)
+            self._count('misses')
+            return None
+        self._count('hits')
+        return {
+            'path': self.path_for(row['filename']),
+            'download_name': row['download_name'],
+            'mimetype': row['mimetype'],
+            'lease': lease,
+        }
+
+    def release(self, lease):
+        self._db.connection().execute('DELETE FROM leases WHERE id = ?', (lease,))
+
+    def put(self, key, path, download_name, mimetype):
+        """Store a copy of the finished artifact at ``path`` under ``key``."""
+        ext = os.path.splitext(download_name)[1]
+        filename = f"{key}{ext}"
+        # A hard link keeps the build's own file independent of the cache entry
+        replace_with_copy(path, self.path_for(filename))
+        now = time.time()
+        self._db.connection().execute(
+            'INSERT OR REPLACE INTO artifacts (key, filename, download_name, mimetype, size, created_at, accessed_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, filename, download_name, mimetype, os.path.getsize(self.path_for(filename)), now, now)
+        )
+        self._count('stored')
+        self.evict(keep=key)
+
+    @staticmethod
+    def link_into(entry, directory, filename=None):
+        """Hard-link (or copy) a leased artifact into ``directory`` and return the new path.
+
+        The link is called ``filename``, or the artifact's download name.
+        """
+        target = os.path.join(directory, filename or entry['download_name'])
+        link_or_copy(entry['path'], target)
+        return target
+
+    def _remove(self, row):
+        conn = self._db.connection()
+        conn.execute('DELETE FROM artifacts WHERE key = ?', (row['key'],))
+        remove_file(self.path_for(row['filename']))
+
+    def evict(self, keep=None):
+        """Drop expired entries, then least recently used ones until the cache fits in max_bytes.
+
+        Entries with an unexpired lease, and ``keep``, are left alone.
+        """
+        now = time.time()
+        conn = self._db.connection()
+        conn.execute('DELETE FROM leases WHERE expires_at < ?', (now,))
+        leased = {row['key'] for row in conn.execute('SELECT DISTINCT key FROM leases').fetchall()}
+        removed = 0
+        kept = lambda row: row['key'] in leased or row['key'] == keep
+        for row in conn.execute('SELECT * FROM artifacts WHERE created_at < ?', (now - self.max_age,)).fetchall():
+            if kept(row):
+                continue
+            self._remove(row)
+            removed += 1
+        removed += evict_lru(conn, 'artifacts', self.max_bytes, self._remove, keep=kept)
+        self._count('evictions', removed)
+        return removed
+
+    def clear(self):
+        conn = self._db.connection()
+        for row in conn.execute('SELECT * FROM artifacts').fetchall():
+            self._remove(row)
+        conn.execute('DELETE FROM leases')
+
+    def stats(self):
+        row = self._db.connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts'
+        ).fetchone()
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['artifacts'] = row[0]
+        stats['bytes'] = row[1]
+        return stats
@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class BuildProgress:
+    """Thread-safe progress counters for a single build."""
+
+    def __init__(self, on_change=None):
+        self._lock = threading.Lock()
+        self._on_change = on_change
+        self.counters = {
+            'chapters_total': 0,
+            'chapters_fetched': 0,
+            'images_downloaded': 0,
+            'pages_rendered': 0,
+        }
+
+    def advance(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        if self._on_change:
+            self._on_change()
+
+    def set(self, name, value):
+        with self._lock:
+            self.counters[name] = value
+        if self._on_change:
+            self._on_change()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+class JobStore:
+    """Job records stored as JSON files so any gunicorn worker can report status.
+
+    Each record notes the ``pid`` of the worker running it, which saves it at
+    least every heartbeat; a queued or running job not saved for
+    ``stale_after`` seconds belonged to a worker that died and is failed.
+    """
+
+    def __init__(self, jobs_dir='jobs', ttl=3600, stale_after=300):
+        self.jobs_dir = jobs_dir
+        if not os.path.exists(jobs_dir):
+            os.makedirs(jobs_dir, exist_ok=True)
+        self.ttl = ttl
+        self.stale_after = stale_after
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def create(self, params):
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'pid': os.getpid(),
+            'params': params,
+            'progress': BuildProgress().snapshot(),
+            'artifact': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+        self.save(job)
+        return job
+
+    def save(self, job):
+        job['updated_at'] = time.time()
+        path = self._path(job['id'])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id):
+        if not JOB_ID_PATTERN.fullmatch(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def prune(self):
+        """Fail stale unfinished jobs, and remove finished job records, and their artifacts, older than the TTL."""
+        now = time.time()
+        cutoff = now - self.ttl
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith('.json'):
+                continue
+            job = self.load(name[:-len('.json')])
+            if job is None:
+                continue
+            if job['status'] in ('queued', 'running'):
+                if job['updated_at'] < now - self.stale_after:
+                    job['status'] = 'failed'
+                    job['error'] = f"Build worker {job.get('pid')} stopped responding"
+                    self.save(job)
+                continue
+            if job['updated_at'] >= cutoff:
+                continue
+            artifact = job.get('artifact')
+            try:
+                if artifact and os.path.exists(artifact['path']):
+                    os.remove(artifact['path'])
+                os.remove(self._path(job['id']))
+            except OSError:
+                pass
+
+
+class JobManager:
+    """Runs download builds on a background executor and records their progress.
+
+    Queued and running jobs are saved every ``heartbeat_interval`` seconds,
+    even without progress, so that JobStore.prune can tell them from jobs of
+    a worker that died.
+    """
+
+    def __init__(self, store, max_workers=2, save_interval=0.5, heartbeat_interval=30):
+        self.store = store
+        self.save_interval = save_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='build-job')
+        self._active = {}
+        self._active_lock = threading.Lock()
+        self._stopped = threading.Event()
+        if heartbeat_interval:
+            threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            with self._active_lock:
+                active = list(self._active.values())
+            for job, lock in active:
+                with lock:
+                    try:
+                        self.store.save(job)
+                    except OSError:
+                        pass
+
+    def submit(self, build, params):
+        """Queue ``build(progress=..., **params)`` and return the new job id.
+
+        ``build`` must return a dict describing the artifact (path, download_name,
+        mimetype); any exception it raises marks the job as failed.
+        """
+        self.store.prune()
+        job = self.store.create(params)
+        lock = threading.Lock()
+        with self._active_lock:
+            self._active[job['id']] = (job, lock)
+        self._executor.submit(self._run, job, lock, build, params)
+        return job['id']
+
+    def get(self, job_id):
+        return self.store.load(job_id)
+
+    def _run(self, job, lock, build, params):
+        last_saved = [0.0]
+
+        def save_progress(force=False):
+            with lock:
+                now = time.monotonic()
+                if not force and now - last_saved[0] < self.save_interval:
+                    return
+                last_saved[0] = now
+                job['progress'] = progress.snapshot()
+                self.store.save(job)
+
+        progress = BuildProgress(on_change=save_progress)
+        with lock:
+            job['status'] = 'running'
+        save_progress(force=True)
+        try:
+            artifact = build(progress=progress, **params)
+            with lock:
+                job['artifact'] = artifact
+                job['status'] = 'finished'
+        except Exception as e:
+            with lock:
+                job['status'] = 'failed'
+                job['error'] = getattr(e, 'message', None) or str(e)
+        finally:
+            with self._active_lock:
+                self._active.pop(job['id'], None)
+        save_progress(force=True)
+
+    def shutdown(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from pipeline.storage import Database, evict_lru, link_or_copy, remove_file, replace_with_copy
+
+
+def content_fingerprint(parsed):
+    """Hash of a chapter's parsed content, independent of how the page around it changed."""
+    return hashlib.sha256(json.dumps(parsed, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """Manifest of each volume's chapters and the rendered PDF segment of every chapter.
+
+    For every chapter URL the manifest keeps the volume it was built in, the
+    fingerprint of its parsed content and when that content was last fetched
+    or revalidated. Rendered segments are stored under ``cache_dir/segments``
+    keyed by ``segment_key``, so a rebuild only renders chapters whose content
+    or position changed and reuses the stored segments for the rest. Segments
+    are evicted least recently used first once they exceed ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir='cache', max_bytes=1024 * 1024 * 1024):
+        self.segments_dir = os.path.join(cache_dir, 'segments')
+        if not os.path.exists(self.segments_dir):
+            os.makedirs(self.segments_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'manifest.sqlite3')
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._counters = {'reused': 0, 'rendered': 0, 'skipped_fetches': 0, 'evictions': 0}
+        self._db = Database(self.db_path, [
+            'CREATE TABLE IF NOT EXISTS chapters ('
+            ' url TEXT PRIMARY KEY,'
+            ' volume TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' fingerprint TEXT NOT NULL,'
+            ' validated_at REAL NOT NULL)',
+            'CREATE TABLE IF NOT EXISTS segments ('
+            ' key TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' accessed_at REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS chapters_volume ON chapters (volume)',
+            'CREATE INDEX IF NOT EXISTS segments_accessed ON segments (accessed_at)',
+        ])
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def record_skipped_fetch(self):
+        self._count('skipped_fetches')
+
+    @staticmethod
+    def segment_key(fingerprint, chapter, volume_title, renderer_version):
+        """Hash everything that goes into a chapter's segment.
+
+        ``volume_title`` is the title printed above the chapter, which only the
+        first chapter of a volume has, or None.
+        """
+        payload = json.dumps([
+            fingerprint, chapter['type'], chapter.get('chapter_num'), chapter.get('chapter_name'),
+            volume_title, renderer_version
+        ])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def chapters(self, urls):
+        """Return {url: {'volume', 'kind', 'fingerprint', 'validated_at'}} for the known ``urls``."""
+        conn = self._db.connection()
+        found = {}
+        for url in urls:
+            row = conn.execute('SELECT * FROM chapters WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                found[url] = dict(row)
+        return found
+
+    def record(self, volume, url, kind, fingerprint):
+        """Record that ``url`` was just fetched or revalidated with content ``fingerprint``."""
+        self._db.connection().execute(
+            'INSERT OR REPLACE INTO chapters (url, volume, kind, fingerprint, validated_at) VALUES (?, ?, ?, ?, ?)',
+            (url, volume, kind, fingerprint, time.time())
+        )
+
+    def segment_path(self, key):
+        return os.path.join(self.segments_dir, f"{key}.pdf")
+
+    def has_segment(self, key):
+        return os.path.exists(self.segment_path(key))
+
+    def link_segment(self, key, target):
+        """Hard-link (or copy) the stored segment ``key`` to ``target``; return False if there is none.
+
+        The build works on its own link, so evicting the segment meanwhile does no harm.
+        """
+        try:
+            link_or_copy(self.segment_path(key), target)
+        except FileNotFoundError:
+            return False
+        self._db.connection().execute('UPDATE segments SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        self._count('reused')
+        return True
+
+    def put_segment(self, key, path):
+        """Store a copy of a freshly rendered segment at ``path`` under ``key``."""
+        replace_with_copy(path, self.segment_path(key))
+        self._db.connection().execute(
+            'INSERT OR REPLACE INTO segments (key, size, accessed_at) VALUES (?, ?, ?)',
+            (key, os.path.getsize(self.segment_path(key)), time.time())
+        )
+        self._count('rendered')
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used segments until they fit in max_bytes."""
+        conn = self._db.connection()
+
+        def remove(row):
+            conn.execute('DELETE FROM segments WHERE key = ?', (row['key'],))
+            remove_file(self.segment_path(row['key']))
+        removed = evict_lru(conn, 'segments', self.max_bytes, remove, columns='key, size')
+        if removed:
+            self._count('evictions', removed)
+        return removed
+
+    def clear(self):
+        conn = self._db.connection()
+        for row in conn.execute('SELECT key FROM segments').fetchall():
+            remove_file(self.segment_path(row['key']))
+        conn.execute('DELETE FROM segments')
+        conn.execute('DELETE FROM chapters')
+
+    def stats(self):
+        conn = self._db.connection()
+        segments, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM segments').fetchone()
+        with self._lock:
+            stats = dict(self._counters)
+        stats['chapters'] = conn.execute('SELECT COUNT(*) FROM chapters').fetchone()[0]
+        stats['segments'] = segments
+        stats['bytes'] = size
+        return stats
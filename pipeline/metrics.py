@@ -0,0 +1,236 @@
+import atexit
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from pipeline.storage import Database
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Every metric the app records: name -> (type, help text)
+METRICS = {
+    'webtoreader_stage_duration_seconds': ('histogram', 'Time spent in each conversion stage.'),
+    'webtoreader_stage_errors_total': ('counter', 'Errors raised by each conversion stage.'),
+    'webtoreader_bytes_total': ('counter', 'Bytes of pages and images fetched and of artifacts produced.'),
+    'webtoreader_chapters_total': ('counter', 'Chapter and illustration pages fetched.'),
+    'webtoreader_chapters_missing_total': ('counter', 'Chapter and illustration pages left out after failing to fetch.'),
+    'webtoreader_chapters_skipped_total': ('counter', 'Chapter and illustration pages not fetched because their rendered segment was reused.'),
+    'webtoreader_segments_total': ('counter', 'Chapter PDF segments, by whether they were reused or rendered.'),
+    'webtoreader_images_total': ('counter', 'Images downloaded, by result.'),
+    'webtoreader_pages_rendered_total': ('counter', 'PDF pages rendered.'),
+    'webtoreader_downloads_total': ('counter', 'Download builds, by format and result.'),
+    'webtoreader_cache_requests_total': ('counter', 'Cache lookups, by cache and result.'),
+    'webtoreader_http_retries_total': ('counter', 'HTTP requests retried after a transient failure.'),
+    'webtoreader_http_circuit_rejections_total': ('counter', 'HTTP requests refused because the host circuit was open.'),
+}
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+# Process id under which the totals of exited processes are kept
+RETIRED = 'retired'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def sample_order(base, sample):
+    """Sort key keeping a histogram's buckets in ascending ``le`` order, then _sum and _count."""
+    name, labels, _ = sample
+    suffix = name[len(base):]
+    le = dict(labels).get('le')
+    return (
+        [pair for pair in labels if pair[0] != 'le'],
+        HISTOGRAM_SUFFIXES.index(suffix) if suffix else 0,
+        math.inf if le == '+Inf' else float(le or 0),
+    )
+
+
+class Metrics:
+    """Counters and histograms for the conversion pipeline, aggregated across processes.
+
+    Each process accumulates its own totals in memory and periodically adds
+    what changed since its last flush to ``cache_dir/metrics.sqlite3``, as one
+    row per series keyed by a per-process id. ``render`` sums the rows of
+    every process, so any gunicorn worker can answer a scrape with totals for
+    the whole server. Rows not updated for ``retention`` seconds, such as those
+    of workers that have exited, are folded into one set of retired rows, so
+    counters never go down and the table does not grow with every restart.
+
+    Collectors registered with ``add_collector`` are called at every flush and
+    return (name, labels, value) counter samples that the process already
+    keeps elsewhere, such as cache hit and miss counts.
+    """
+
+    def __init__(self, cache_dir='cache', flush_interval=5.0, retention=3600):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'metrics.sqlite3')
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._collectors = []
+        self._db = Database(self.db_path, [
+            'CREATE TABLE IF NOT EXISTS samples ('
+            ' process TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' labels TEXT NOT NULL,'
+            ' value REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' PRIMARY KEY (process, name, labels))',
+            'CREATE INDEX IF NOT EXISTS samples_updated ON samples (updated_at)',
+        ])
+        self._start()
+        atexit.register(self.flush)
+
+    def _start(self):
+        """Reset per-process state; also called in a forked child on first use."""
+        self._pid = os.getpid()
+        self._process = uuid.uuid4().hex
+        self._values = {}
+        self._flushed = {}
+        self._db.reset()
+        if self.flush_interval:
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._start()
+
+    def _flush_loop(self):
+        pid = self._pid
+        while os.getpid() == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def _add(self, name, labels, amount):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def inc(self, name, amount=1, **labels):
+        self._check_fork()
+        with self._lock:
+            self._add(name, labels, amount)
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        self._check_fork()
+        with self._lock:
+            for bound in buckets + (math.inf,):
+                self._add(f"{name}_bucket", dict(labels, le=format_value(bound)), 1 if value <= bound else 0)
+            self._add(f"{name}_sum", labels, value)
+            self._add(f"{name}_count", labels, 1)
+
+    @contextmanager
+    def stage(self, stage):
+        """Time the enclosed block as ``stage`` and count the exceptions it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('webtoreader_stage_errors_total', stage=stage)
+            raise
+        finally:
+            self.observe('webtoreader_stage_duration_seconds', time.perf_counter() - start, stage=stage)
+
+    def flush(self):
+        """Add what changed in this process's totals to the shared database, then fold stale rows."""
+        self._check_fork()
+        with self._flush_lock:
+            with self._lock:
+                values = dict(self._values)
+            for collector in self._collectors:
+                for name, labels, value in collector():
+                    values[(name, tuple(sorted((label, str(v)) for label, v in labels.items())))] = value
+            # Only differences are written, so rows folded away meanwhile are never counted twice
+            deltas = [(key, value - self._flushed.get(key, 0)) for key, value in values.items()
+                      if value != self._flushed.get(key, 0)]
+            now = time.time()
+            conn = self._db.connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    'INSERT INTO samples (process, name, labels, value, updated_at) VALUES (?, ?, ?, ?, ?)'
+                    ' ON CONFLICT (process, name, labels)'
+                    ' DO UPDATE SET value = value + excluded.value, updated_at = excluded.updated_at',
+                    [(self._process, name, json.dumps(labels), delta, now) for (name, labels), delta in deltas]
+                )
+                self._fold(conn, now - self.retention, now)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self._flushed = values
+
+    @staticmethod
+    def _fold(conn, cutoff, now):
+        """Move rows last updated before ``cutoff`` into the retired rows."""
+        conn.execute(
+            'INSERT INTO samples (process, name, labels, value, updated_at)'
+            ' SELECT ?, name, labels, SUM(value), ? FROM samples WHERE process != ? AND updated_at < ?'
+            ' GROUP BY name, labels'
+            ' ON CONFLICT (process, name, labels)'
+            ' DO UPDATE SET value = value + excluded.value, updated_at = excluded.updated_at',
+            (RETIRED, now, RETIRED, cutoff)
+        )
+        conn.execute('DELETE FROM samples WHERE process != ? AND updated_at < ?', (RETIRED, cutoff))
+
+    def totals(self):
+        """Return {(name, labels): value} summed over every process."""
+        rows = self._db.connection().execute(
+            'SELECT name, labels, SUM(value) FROM samples GROUP BY name, labels'
+        ).fetchall()
+        return {(name, tuple(tuple(pair) for pair in json.loads(labels))): value for name, labels, value in rows}
+
+    def render(self):
+        """Return the aggregated metrics in the Prometheus text exposition format."""
+        self.flush()
+        families = {}
+        for (name, labels), value in self.totals().items():
+            base = name
+            for suffix in HISTOGRAM_SUFFIXES:
+                if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                    base = name[:-len(suffix)]
+            families.setdefault(base, []).append((name, labels, value))
+
+        lines = []
+        for base in sorted(families):
+            kind, help_text = METRICS.get(base, ('untyped', ''))
+            lines.append(f"# HELP {base} {help_text}")
+            lines.append(f"# TYPE {base} {kind}")
+            for name, labels, value in sorted(families[base], key=lambda sample: sample_order(base, sample)):
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._flush_lock, self._lock:
+            self._values.clear()
+            self._flushed.clear()
+        self._db.connection().execute('DELETE FROM samples')
@@ -0,0 +1,99 @@
+import os
+import shutil
+import sqlite3
+import threading
+
+
+class Database:
+    """A SQLite database shared by every worker, with one connection per thread.
+
+    The database is switched to WAL mode, so readers in one gunicorn worker
+    are not blocked by a writer in another, and the ``schema`` statements are
+    run once when it is opened. Connections are in autocommit mode and return
+    ``sqlite3.Row`` rows.
+    """
+
+    def __init__(self, path, schema=()):
+        self.path = path
+        self.reset()
+        conn = self.connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        for statement in schema:
+            conn.execute(statement)
+
+    def reset(self):
+        """Forget every thread's connection; a forked child must not use its parent's."""
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+
+def evict_lru(conn, table, max_bytes, remove, keep=None, columns='*'):
+    """Remove least recently used rows of ``table`` until their sizes add up to at most ``max_bytes``.
+
+    ``table`` has ``size`` and ``accessed_at`` columns; only ``columns`` (which
+    must include ``size``) are read. ``remove(row)`` deletes a row and anything
+    stored for it; rows for which ``keep(row)`` is true are left alone.
+    Returns the number of rows removed.
+    """
+    total = conn.execute(f'SELECT COALESCE(SUM(size), 0) FROM {table}').fetchone()[0]
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for row in conn.execute(f'SELECT {columns} FROM {table} ORDER BY accessed_at').fetchall():
+        if total <= max_bytes:
+            break
+        if keep is not None and keep(row):
+            continue
+        remove(row)
+        total -= row['size']
+        removed += 1
+    return removed
+
+
+def remove_file(path):
+    """Remove ``path`` if it is still there."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def link_or_copy(source, target):
+    """Hard-link ``source`` to ``target``, or copy it where a link is not possible.
+
+    A link keeps the target valid even if the source is removed later. An
+    existing ``target`` is left as it is. Raises FileNotFoundError if there is
+    no ``source``.
+    """
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def replace_with_copy(source, target):
+    """Replace ``target`` with a link to or copy of ``source`` in one step.
+
+    The copy is made under a temporary name next to ``target`` and then
+    renamed over it, so readers never see a partly written file.
+    """
+    tmp_path = os.path.join(os.path.dirname(target), f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        remove_file(tmp_path)
@@ -0,0 +1,68 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class BoundedPipeline:
+    """Iterates a producer on a background thread, handing items over through a bounded queue.
+
+    At most ``depth`` items wait between the producer and the consumer, so the
+    producer blocks instead of running ahead of a slow consumer. Exceptions
+    raised by the producer are re-raised in the consumer.
+    """
+
+    def __init__(self, source, depth=1, name='pipeline'):
+        self._source = source
+        self._queue = queue.Queue(maxsize=max(1, int(depth)))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for item in self._source:
+                if not self._put((item, None)):
+                    return
+        except Exception as e:
+            self._put((_DONE, e))
+            return
+        finally:
+            close = getattr(self._source, 'close', None)
+            if close:
+                close()
+        self._put((_DONE, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._stopped.is_set():
+            raise StopIteration
+        item, error = self._queue.get()
+        if item is _DONE:
+            self._stopped.set()
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self, timeout=None):
+        """Stop the producer after its current item and wait for its thread."""
+        self._stopped.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
@@ -0,0 +1,98 @@
+import os
+import re
+import shutil
+import time
+import uuid
+
+BUILD_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+BUILDING_MARKER = '.building'
+
+
+class BuildWorkspace:
+    """Private directory tree for one build: output files plus an images/ folder.
+
+    Each workspace lives under ``root/<build_id>`` so concurrent builds never
+    share files, and cleanup only ever touches the workspace's own directory.
+    A marker file flags the workspace as in-progress until ``finish`` is called.
+    """
+
+    def __init__(self, root='app-downloads', build_id=None):
+        self.root = root
+        self.id = build_id or uuid.uuid4().hex
+        self.path = os.path.join(root, self.id)
+        self.images_dir = os.path.join(self.path, 'images')
+
+    @classmethod
+    def create(cls, root='app-downloads'):
+        workspace = cls(root)
+        os.makedirs(workspace.images_dir, exist_ok=True)
+        with open(os.path.join(workspace.path, BUILDING_MARKER), 'w') as f:
+            f.write(str(os.getpid()))
+        return workspace
+
+    @classmethod
+    def open(cls, root, build_id):
+        """Return the existing workspace ``build_id`` or None."""
+        if not BUILD_ID_PATTERN.fullmatch(build_id or ''):
+            return None
+        workspace = cls(root, build_id)
+        return workspace if os.path.isdir(workspace.path) else None
+
+    @classmethod
+    def find_by_filename(cls, root, filename):
+        """Return the finished workspaces that contain an output file called ``filename``."""
+        filename = os.path.basename(filename or '')
+        if not filename or not os.path.isdir(root):
+            return []
+        matches = []
+        for name in os.listdir(root):
+            workspace = cls.open(root, name)
+            if workspace and not workspace.building and os.path.isfile(workspace.file_path(filename)):
+                matches.append(workspace)
+        return matches
+
+    def file_path(self, filename):
+        return os.path.join(self.path, filename)
+
+    @property
+    def building(self):
+        return os.path.exists(os.path.join(self.path, BUILDING_MARKER))
+
+    def cleanup_images(self):
+        shutil.rmtree(self.images_dir, ignore_errors=True)
+
+    def finish(self):
+        """Drop intermediate images and mark the workspace as no longer building."""
+        self.cleanup_images()
+        try:
+            os.remove(os.path.join(self.path, BUILDING_MARKER))
+        except OSError:
+            pass
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def prune_workspaces(root='app-downloads', max_age=3600, max_build_age=24 * 3600):
+    """Remove workspaces not modified for ``max_age`` seconds.
+
+    Workspaces that are still building are only removed after ``max_build_age``,
+    which covers builds abandoned by a crashed worker.
+    """
+    if not os.path.isdir(root):
+        return []
+    now = time.time()
+    removed = []
+    for name in os.listdir(root):
+        workspace = BuildWorkspace.open(root, name)
+        if workspace is None:
+            continue
+        try:
+            age = now - os.path.getmtime(workspace.path)
+        except OSError:
+            continue
+        limit = max_build_age if workspace.building else max_age
+        if age > limit:
+            workspace.cleanup()
+            removed.append(workspace.id)
+    return removed
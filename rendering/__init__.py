@@ -0,0 +1 @@
+# Empty __init__.py to make rendering a Python package
\ No newline at end of file
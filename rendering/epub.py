@@ -0,0 +1,233 @@
+import html
+import mimetypes
+import re
+import uuid
+import zipfile
+from datetime import datetime, timezone
+
+from rendering.pdf import PART_PATTERN
+
+# Characters that are not allowed in XML 1.0 documents
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+STYLESHEET = """body { font-family: serif; line-height: 1.4; }
+h1, h2 { text-align: center; }
+p.part { text-align: center; font-weight: bold; margin: 1em 0 0.5em; }
+figure { margin: 1em 0; text-align: center; }
+figure img { max-width: 100%; max-height: 95vh; }
+figcaption { font-size: 0.85em; color: #666; }
+table { border-collapse: collapse; width: 100%; font-size: 0.8em; margin: 1em 0; }
+td { border: 1px solid #000; padding: 0.3em; vertical-align: middle; }
+tr:first-child td { font-weight: bold; background: #f5f5f5; }
+"""
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def text(value):
+    """Escape ``value`` for XHTML, dropping characters XML does not allow."""
+    return html.escape(INVALID_XML_CHARS.sub('', str(value)))
+
+
+def xhtml_document(title, body):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+        f'<head><meta charset="UTF-8"/><title>{text(title)}</title>'
+        '<link rel="stylesheet" type="text/css" href="../style.css"/></head>\n'
+        f'<body>\n{body}\n</body>\n</html>\n'
+    )
+
+
+class EpubWriter:
+    """Writes an EPUB 3 container entry by entry.
+
+    Chapters are written as soon as they are added and images are copied into
+    the archive from disk, so only the manifest and table of contents are kept
+    in memory; they are written when the writer is closed, so ``title`` may
+    still be changed until then.
+    """
+
+    def __init__(self, path, title, language='en', identifier=None):
+        self.path = path
+        self.title = title
+        self.language = language
+        self.identifier = identifier or f"urn:uuid:{uuid.uuid4()}"
+        self._manifest = []
+        self._spine = []
+        self._toc = []
+        self._images = {}
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        # The mimetype entry must come first and be stored uncompressed
+        self._zip.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        self._zip.writestr('META-INF/container.xml', CONTAINER_XML)
+        self._zip.writestr('OEBPS/style.css', STYLESHEET)
+        self._manifest.append(('style', 'style.css', 'text/css', None))
+
+    def add_image(self, image_path, cover=False):
+        """Copy an image into the book once and return its href relative to a chapter."""
+        if image_path in self._images:
+            return self._images[image_path]
+        media_type = mimetypes.guess_type(image_path)[0] or 'image/jpeg'
+        ext = mimetypes.guess_extension(media_type) or '.jpg'
+        item_id = f"img{len(self._images) + 1}"
+        href = f"images/{item_id}{ext}"
+        # Images are already compressed
+        self._zip.write(image_path, f"OEBPS/{href}", compress_type=zipfile.ZIP_STORED)
+        self._manifest.append((item_id, href, media_type, 'cover-image' if cover else None))
+        self._images[image_path] = f"../{href}"
+        return self._images[image_path]
+
+    @property
+    def chapter_count(self):
+        return len(self._spine)
+
+    def add_section(self, title):
+        """Start a new top-level table of contents entry (a volume)."""
+        self._toc.append((title, []))
+
+    def add_chapter(self, title, body):
+        """Write one chapter document with ``body`` as its XHTML body content."""
+        item_id = f"c{len(self._spine) + 1}"
+        href = f"text/{item_id}.xhtml"
+        self._zip.writestr(f"OEBPS/{href}", xhtml_document(title, body))
+        self._manifest.append((item_id, href, 'application/xhtml+xml', None))
+        self._spine.append(item_id)
+        if not self._toc:
+            self._toc.append((None, []))
+        self._toc[-1][1].append((title, href))
+        return href
+
+    def _nav(self):
+        sections = []
+        for section_title, chapters in self._toc:
+            if not chapters:
+                continue
+            links = ''.join(f'<li><a href="{href}">{text(title)}</a></li>' for title, href in chapters)
+            if section_title is None:
+                sections.append(links)
+            else:
+                sections.append(f'<li><a href="{chapters[0][1]}">{text(section_title)}</a><ol>{links}</ol></li>')
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+            f'<head><meta charset="UTF-8"/><title>{text(self.title)}</title></head>\n'
+            f'<body><nav epub:type="toc" id="toc"><h1>{text(self.title)}</h1><ol>{"".join(sections)}</ol></nav></body>\n</html>\n'
+        )
+
+    def _package(self):
+        modified = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        items = ''.join(
+            f'<item id="{item_id}" href="{href}" media-type="{media_type}"'
+            + (f' properties="{properties}"' if properties else '') + '/>'
+            for item_id, href, media_type, properties in self._manifest
+        )
+        itemrefs = ''.join(f'<itemref idref="{item_id}"/>' for item_id in self._spine)
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="book-id">{text(self.identifier)}</dc:identifier>'
+            f'<dc:title>{text(self.title)}</dc:title>'
+            f'<dc:language>{text(self.language)}</dc:language>'
+            f'<meta property="dcterms:modified">{modified}</meta></metadata>\n'
+            f'<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>{items}</manifest>\n'
+            f'<spine>{itemrefs}</spine>\n</package>\n'
+        )
+
+    def close(self):
+        """Write the navigation document and package file and finish the archive."""
+        self._zip.writestr('OEBPS/nav.xhtml', self._nav())
+        self._zip.writestr('OEBPS/content.opf', self._package())
+        self._zip.close()
+
+
+class ChapterWriter:
+    """Turns processed chapters into XHTML bodies for an EpubWriter.
+
+    ``images`` is the same URL -> (local_path, size) map used by the PDF
+    builder; images missing from it are left out.
+    """
+
+    def __init__(self, book, images):
+        self.book = book
+        self.images = images
+        self._cover_done = False
+
+    def volume(self, volume_name, chapters):
+        self.book.add_section(volume_name)
+        for chapter in chapters:
+            if chapter['type'] == 'text':
+                title = chapter.get('chapter_name', f"Chapter {chapter['chapter_num']}")
+                self.book.add_chapter(title, self._text_chapter(title, chapter['content']))
+            elif chapter['type'] == 'illustrations':
+                title = chapter.get('chapter_name', 'Illustrations')
+                self.book.add_chapter(title, self._illustrations(title, chapter['images']))
+
+    def _figure(self, img_info, cover=False):
+        image = self.images.get(img_info['src'])
+        if not image:
+            return ''
+        img_path, size = image
+        if size is None:
+            return f"<p>[Image: {text(img_info.get('alt', 'No description'))}]</p>"
+        href = self.book.add_image(img_path, cover=cover)
+        caption = f"<figcaption>{text(img_info['caption'])}</figcaption>" if img_info.get('caption') else ''
+        return f'<figure><img src="{href}" alt="{text(img_info.get("alt", ""))}"/>{caption}</figure>'
+
+    def _text_chapter(self, title, content):
+        parts = [f"<h2>{text(title)}</h2>"]
+        if content:
+            for para in content.get('paragraphs') or []:
+                para = para.strip()
+                if para:
+                    parts.append(f'<p class="part">{text(para)}</p>' if PART_PATTERN.match(para) else f"<p>{text(para)}</p>")
+            for img_info in content.get('inline_images') or []:
+                parts.append(self._figure(img_info))
+            for table_data in content.get('tables') or []:
+                if table_data:
+                    rows = ''.join(
+                        '<tr>' + ''.join(f"<td>{text(cell).replace(chr(10), '<br/>')}</td>" for cell in row) + '</tr>'
+                        for row in table_data
+                    )
+                    parts.append(f"<table>{rows}</table>")
+        return '\n'.join(parts)
+
+    def _illustrations(self, title, images):
+        parts = [f"<h2>{text(title)}</h2>"]
+        for index, img_info in enumerate(images):
+            cover = index == 0 and not self._cover_done
+            figure = self._figure(img_info, cover=cover)
+            if cover and figure.startswith('<figure'):
+                self._cover_done = True
+            parts.append(figure)
+        return '\n'.join(parts)
+
+
+def render_epub(volumes, filepath, images, title=None):
+    """Write ``volumes`` as one EPUB at ``filepath``.
+
+    ``volumes`` is a {volume name: chapters} dict or an iterable of
+    (volume name, chapters) pairs, which is consumed one volume at a time. The
+    title defaults to the volume names and the first illustration of the book
+    becomes its cover image. Returns the number of chapter documents written.
+    """
+    if isinstance(volumes, dict):
+        volumes = volumes.items()
+    book = EpubWriter(filepath, title)
+    names = []
+    try:
+        writer = ChapterWriter(book, images)
+        for volume_name, chapters in volumes:
+            names.append(volume_name)
+            writer.volume(volume_name, chapters)
+    finally:
+        book.title = title or ', '.join(names)
+        book.close()
+    return book.chapter_count
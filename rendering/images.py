@@ -0,0 +1,97 @@
+import hashlib
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+from PIL import Image as PILImage
+
+POINTS_PER_INCH = 72
+
+
+class ImageTranscoder:
+    """Prepares images for embedding at the resolution they are displayed at.
+
+    ReportLab embeds an image file as it is and only scales it when drawing,
+    so a 4000px illustration shown across an A4 page is stored at full size.
+    ``transcode`` downsamples an image to at most ``dpi`` pixels per inch of
+    its display box and writes it as a JPEG at ``quality``, which ReportLab
+    embeds without decoding it again. With ``grayscale`` images are converted
+    to grayscale first, for e-ink readers. Transparent areas are flattened
+    onto white, like the page they are drawn on.
+
+    Only settings are kept, so a transcoder can be sent to render workers.
+    """
+
+    def __init__(self, dpi=150, quality=80, grayscale=False):
+        self.dpi = dpi
+        self.quality = quality
+        self.grayscale = grayscale
+
+    def settings(self):
+        """Everything that changes the output; part of the segment and artifact cache keys."""
+        return {'dpi': self.dpi, 'quality': self.quality, 'grayscale': self.grayscale}
+
+    def pixels(self, width, height):
+        """Pixel size of a ``width`` x ``height`` point display box at ``dpi``."""
+        scale = self.dpi / POINTS_PER_INCH
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def transcode(self, directory, path, width, height):
+        """Return the path of ``path`` prepared for a ``width`` x ``height`` point display box.
+
+        The result is written to ``directory`` and reused for the same image
+        and box. The source is returned unchanged when re-encoding would not
+        make it smaller, unless it has to be converted to grayscale.
+        """
+        box = self.pixels(width, height)
+        name = hashlib.sha1(f"{path}\0{box[0]}x{box[1]}".encode('utf-8')).hexdigest()
+        target = os.path.join(directory, f"{name}.jpg")
+        if os.path.exists(target):
+            return target
+
+        mode = 'L' if self.grayscale else 'RGB'
+        with PILImage.open(path) as img:
+            if (img.format == 'JPEG' and img.mode == mode
+                    and img.width <= box[0] and img.height <= box[1]):
+                return path
+            # Let the JPEG decoder skip detail that is thrown away anyway
+            img.draft(mode, box)
+            if img.mode in ('P', '1'):
+                # Pillow only resizes palette and bilevel images with NEAREST
+                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            if mode == 'L' and img.mode in ('RGB', 'CMYK'):
+                # Resize one channel instead of three
+                img = img.convert('L')
+            img.thumbnail(box, PILImage.LANCZOS)
+            if img.mode in ('RGBA', 'LA'):
+                img = img.convert('RGBA')
+                background = PILImage.new('RGBA', img.size, (255, 255, 255, 255))
+                img = PILImage.alpha_composite(background, img)
+            img = img.convert(mode)
+            tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(tmp_path, 'JPEG', quality=self.quality, optimize=True)
+
+        if not self.grayscale and os.path.getsize(tmp_path) >= os.path.getsize(path):
+            os.remove(tmp_path)
+            return path
+        os.replace(tmp_path, target)
+        return target
+
+
+@contextmanager
+def transcoded_images(transcoder, filepath):
+    """Yield a ``transcode(path, width, height)`` callable for rendering ``filepath``, or None.
+
+    Transcoded images are written to a directory next to ``filepath``, which
+    is removed once the document has been saved.
+    """
+    if transcoder is None:
+        yield None
+        return
+    directory = f"{filepath}.images"
+    os.makedirs(directory, exist_ok=True)
+    try:
+        yield lambda path, width, height: transcoder.transcode(directory, path, width, height)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
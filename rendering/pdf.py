@@ -0,0 +1,369 @@
+import os
+import re
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Flowable, Paragraph, Spacer, PageBreak, Image, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER
+from reportlab.lib import colors
+
+from rendering.images import transcoded_images
+from rendering.pdf_concat import concat_pdfs
+
+PAGE_WIDTH = A4[0] - 108
+MAX_HEIGHT = A4[1] - 108
+# Room left for the chapter heading above the first illustration
+FIRST_ILLUSTRATION_MAX_HEIGHT = MAX_HEIGHT - 84
+PART_PATTERN = re.compile(r'^Part\s+\d+$')
+
+
+class PdfStyles:
+    """Paragraph and table styles shared by every document built in this process."""
+
+    def __init__(self):
+        sample = getSampleStyleSheet()
+        self.title = ParagraphStyle(
+            name='TitleStyle',
+            parent=sample['Heading1'],
+            fontSize=24,
+            spaceAfter=20,
+            alignment=TA_CENTER
+        )
+        self.chapter = ParagraphStyle(
+            name='ChapterStyle',
+            parent=sample['Heading2'],
+            fontSize=18,
+            spaceAfter=12,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        )
+        self.body = ParagraphStyle(
+            name='BodyStyle',
+            parent=sample['BodyText'],
+            fontSize=12,
+            spaceAfter=3
+        )
+        self.part = ParagraphStyle(
+            name='PartStyle',
+            parent=self.body,
+            fontSize=12,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold',
+            spaceAfter=6,
+            spaceBefore=6
+        )
+        self.caption = ParagraphStyle(
+            name='CaptionStyle',
+            parent=self.body,
+            fontSize=10,
+            textColor=colors.grey,
+            alignment=TA_CENTER,
+            spaceAfter=12
+        )
+        self.table_cell = ParagraphStyle(
+            name='TableCellStyle',
+            parent=self.body,
+            fontSize=9,
+            leading=11,
+            alignment=TA_JUSTIFY
+        )
+        self.table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ])
+
+
+_styles = None
+
+
+def get_styles():
+    """Return the process-wide PdfStyles, compiling them on first use."""
+    global _styles
+    if _styles is None:
+        _styles = PdfStyles()
+    return _styles
+
+
+def fit_inline_image(width, height, max_width=PAGE_WIDTH, max_height=MAX_HEIGHT):
+    """Scale an inline image down to the page, keeping smaller images at their own size."""
+    if width <= max_width and height <= max_height:
+        return width, height
+    aspect_ratio = width / height
+    if width > height:
+        img_width, img_height = max_width, max_width / aspect_ratio
+        if img_height > max_height:
+            img_width, img_height = max_height * aspect_ratio, max_height
+    else:
+        img_width, img_height = max_height * aspect_ratio, max_height
+        if img_width > max_width:
+            img_width, img_height = max_width, max_width / aspect_ratio
+    return img_width, img_height
+
+
+def fit_illustration(width, height, max_width=PAGE_WIDTH, max_height=MAX_HEIGHT):
+    """Scale an illustration to fit within ``max_width`` x ``max_height``."""
+    aspect_ratio = width / height
+    if width > height:
+        img_width = min(max_width, width)
+        img_height = img_width / aspect_ratio
+        if img_height > max_height:
+            img_height = max_height
+            img_width = img_height * aspect_ratio
+    else:
+        img_height = min(max_height, height)
+        img_width = img_height * aspect_ratio
+        if img_width > max_width:
+            img_width = max_width
+            img_height = img_width / aspect_ratio
+    return min(img_width, max_width), min(img_height, max_height)
+
+
+def chapter_title(chapter):
+    if chapter['type'] == 'illustrations':
+        return chapter.get('chapter_name', 'Illustrations')
+    return chapter.get('chapter_name', f"Chapter {chapter['chapter_num']}")
+
+
+class OutlineMark(Flowable):
+    """Zero-size flowable that adds an outline entry for the page it lands on.
+
+    When ``marks`` is a list, (title, page index) is appended to it as well, so
+    a document rendered in parts can rebuild the outline after concatenation.
+    """
+
+    def __init__(self, title, marks=None):
+        super().__init__()
+        self.title = title
+        self.marks = marks
+        self.width = self.height = 0
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        canv = self.canv
+        key = f"outline-{id(self)}"
+        canv.bookmarkPage(key)
+        canv.addOutlineEntry(self.title, key, level=0)
+        canv.showOutline()
+        if self.marks is not None:
+            self.marks.append((self.title, canv.getPageNumber() - 1))
+
+
+class FlowableBuilder:
+    """Turns processed chapters into ReportLab flowables.
+
+    ``images`` maps each image URL to ``(local_path, (width, height))``, with a
+    size of None when the image could not be measured. Images missing from the
+    map are left out. Every chapter starts with an OutlineMark recording into
+    ``marks``. ``transcode(path, width, height)``, if given, returns the file
+    to embed for an image shown at ``width`` x ``height`` points.
+    """
+
+    def __init__(self, images, styles=None, marks=None, transcode=None):
+        self.images = images
+        self.styles = styles or get_styles()
+        self.marks = marks
+        self.transcode = transcode
+
+    def volume(self, volume_name, chapters):
+        content = self.title(volume_name)
+        for chapter in chapters:
+            self.chapter(content, chapter)
+        return content
+
+    def title(self, volume_name):
+        return [Paragraph(volume_name, self.styles.title), Spacer(1, 12)]
+
+    def chapter(self, content, chapter):
+        content.append(OutlineMark(chapter_title(chapter), self.marks))
+        if chapter['type'] == 'text':
+            self._text_chapter(content, chapter)
+        elif chapter['type'] == 'illustrations':
+            self._illustrations(content, chapter)
+
+    def _text_chapter(self, content, chapter):
+        styles = self.styles
+        chapter_title = chapter.get('chapter_name', f"Chapter {chapter['chapter_num']}")
+        content.append(Paragraph(chapter_title, styles.chapter))
+
+        chapter_content = chapter['content']
+        if chapter_content:
+            for para in chapter_content.get('paragraphs') or []:
+                para = para.strip()
+                if para:
+                    content.append(Paragraph(para, styles.part if PART_PATTERN.match(para) else styles.body))
+                    content.append(Spacer(1, 6))
+            for img_info in chapter_content.get('inline_images') or []:
+                self._inline_image(content, img_info)
+            for table_data in chapter_content.get('tables') or []:
+                if table_data:
+                    self._table(content, table_data)
+
+        content.append(PageBreak())
+
+    def _inline_image(self, content, img_info):
+        image = self.images.get(img_info['src'])
+        if not image:
+            return
+        img_path, size = image
+        try:
+            img_width, img_height = fit_inline_image(*size)
+            content.append(self._image(img_path, img_width, img_height))
+            if img_info.get('caption'):
+                content.append(Paragraph(img_info['caption'], self.styles.caption))
+            content.append(Spacer(1, 12))
+        except Exception as e:
+            content.append(Paragraph(f"[Image: {img_info.get('alt', 'No description')}]", self.styles.body))
+            content.append(Spacer(1, 6))
+
+    def _image(self, img_path, width, height):
+        if self.transcode:
+            try:
+                img_path = self.transcode(img_path, width, height)
+            except Exception as e:
+                # Embed the source image as it is
+                pass
+        return Image(img_path, width=width, height=height)
+
+    def _table(self, content, table_data):
+        cell_style = self.styles.table_cell
+        rows = [
+            [Paragraph(str(cell).replace('\n', '<br/>'), cell_style) for cell in row]
+            for row in table_data
+        ]
+        num_cols = len(table_data[0])
+        table = Table(rows, colWidths=[PAGE_WIDTH / num_cols] * num_cols)
+        table.setStyle(self.styles.table)
+        content.append(table)
+        content.append(Spacer(1, 12))
+
+    def _illustrations(self, content, chapter):
+        styles = self.styles
+        content.append(Paragraph(chapter.get('chapter_name', 'Illustrations'), styles.chapter))
+
+        for index, img_info in enumerate(chapter['images']):
+            image = self.images.get(img_info['src'])
+            if not image:
+                continue
+            img_path, size = image
+            try:
+                max_height = FIRST_ILLUSTRATION_MAX_HEIGHT if index == 0 else MAX_HEIGHT
+                img_width, img_height = fit_illustration(*size, max_height=max_height)
+                content.append(self._image(img_path, img_width, img_height))
+                if img_info['caption']:
+                    content.append(Paragraph(img_info['caption'], styles.body))
+                content.append(Spacer(1, 12))
+            except Exception as e:
+                content.append(Paragraph(f"[Image could not be loaded: {img_info.get('alt', 'No description')}]", styles.body))
+                content.append(Spacer(1, 12))
+        content.append(PageBreak())
+
+
+def render_pdf(volumes, filepath, images, on_page=None, chunk_chapters=0, transcoder=None):
+    """Lay out ``volumes`` ({volume name: chapters}) into one PDF at ``filepath``.
+
+    Returns the page count. Only takes plain data so it can run in a worker
+    process; ``images`` is the map described on FlowableBuilder. ``on_page`` is
+    called once per rendered page.
+
+    ReportLab keeps every page and image of a document in memory until it is
+    saved, so with ``chunk_chapters`` set and more chapters than that, the
+    chapters are rendered in batches of ``chunk_chapters`` to partial PDFs next
+    to ``filepath`` and concatenated. Every chapter starts on a new page, so
+    the pages are the same as those of a single pass.
+
+    With a ``transcoder`` (a rendering.images.ImageTranscoder) images are
+    downsampled and recompressed for the box they are shown in.
+    """
+    with transcoded_images(transcoder, filepath) as transcode:
+        named = len(volumes) > 1
+        if not chunk_chapters or sum(len(chapters) for chapters in volumes.values()) <= chunk_chapters:
+            builder = FlowableBuilder(images, transcode=transcode)
+            content = []
+            for volume_name, chapters in volumes.items():
+                if named:
+                    content.append(OutlineMark(volume_name))
+                content.extend(builder.volume(volume_name, chapters))
+            return build_document(content, filepath, on_page)
+
+        chapters = [
+            (volume_name, index, chapter)
+            for volume_name, volume_chapters in volumes.items()
+            for index, chapter in enumerate(volume_chapters)
+        ]
+        parts = []
+        outline = []
+        try:
+            for start in range(0, len(chapters), chunk_chapters):
+                marks = []
+                builder = FlowableBuilder(images, marks=marks, transcode=transcode)
+                content = []
+                for volume_name, index, chapter in chapters[start:start + chunk_chapters]:
+                    if index == 0:
+                        if named:
+                            content.append(OutlineMark(volume_name, marks))
+                        content.extend(builder.title(volume_name))
+                    builder.chapter(content, chapter)
+                part = f"{filepath}.part{len(parts)}.pdf"
+                parts.append(part)
+                build_document(content, part, on_page)
+                outline.extend((title, len(parts) - 1, page) for title, page in marks)
+                # Let the part's flowables go before rendering the next one
+                del builder, content
+            return concat_pdfs(parts, filepath, outline)
+        finally:
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+
+
+def build_document(content, filepath, on_page=None):
+    """Lay out ``content`` flowables on A4 pages at ``filepath`` and return the page count."""
+    pages = [0]
+
+    def count_page(canvas, doc):
+        pages[0] += 1
+        if on_page:
+            on_page()
+
+    doc = SimpleDocTemplate(filepath, pagesize=A4, rightMargin=54, leftMargin=54, topMargin=54, bottomMargin=18)
+    doc.build(content, onFirstPage=count_page, onLaterPages=count_page)
+    return pages[0]
+
+
+def render_volume_pdf(volume_name, chapters, filepath, images, on_page=None, chunk_chapters=0, transcoder=None):
+    """Render a single volume; see render_pdf."""
+    return render_pdf({volume_name: chapters}, filepath, images, on_page, chunk_chapters, transcoder)
+
+
+def render_segmented_pdf(volume_name, chapters, filepath, images, on_page=None, transcoder=None):
+    """Render a volume from one PDF segment per chapter, reusing segments that already exist.
+
+    Every chapter carries a ``segment`` path. Existing segment files are used
+    as they are; the other chapters are rendered to their segment path first,
+    the first one under the volume title. Chapters start on a new page either
+    way, so the concatenated document has the same pages as render_volume_pdf
+    would produce, plus an outline with one entry per chapter. Returns the
+    number of pages rendered, which excludes reused segments.
+    """
+    rendered = 0
+    with transcoded_images(transcoder, filepath) as transcode:
+        builder = FlowableBuilder(images, transcode=transcode)
+        for index, chapter in enumerate(chapters):
+            if os.path.exists(chapter['segment']):
+                continue
+            content = builder.title(volume_name) if index == 0 else []
+            builder.chapter(content, chapter)
+            rendered += build_document(content, chapter['segment'], on_page)
+    outline = [(chapter_title(chapter), index, 0) for index, chapter in enumerate(chapters)]
+    concat_pdfs([chapter['segment'] for chapter in chapters], filepath, outline)
+    return rendered
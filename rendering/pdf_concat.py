@@ -0,0 +1,234 @@
+"""Concatenate PDFs written by ReportLab into one document with an outline.
+
+Only what ReportLab produces is supported: a classic cross-reference table,
+no object streams and no incremental updates. The pages of each part are
+copied, together with every object they reference, into a new page tree;
+the parts' own catalogs, page trees, outlines and document info are dropped.
+Stream data is copied byte for byte without being decoded, and objects that
+are identical in several parts are only written once.
+"""
+import hashlib
+import re
+
+OBJECT_HEADER = re.compile(rb'(\d+)\s+(\d+)\s+obj\b')
+# Literal and hex strings are matched too, so that references are only rewritten outside of strings
+TOKEN = re.compile(rb'\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>|(\d+)\s+(\d+)\s+R\b', re.S)
+PARENT = re.compile(rb'/Parent\s+\d+\s+\d+\s+R\b')
+PAGES_REF = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R\b')
+ROOT_REF = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R\b')
+KIDS = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+LENGTH = re.compile(rb'/Length\s+(\d+)(\s+\d+\s+R)?')
+TYPE_PAGES = re.compile(rb'/Type\s*/Pages\b')
+
+CATALOG, PAGE_TREE = 1, 2
+
+
+class PdfFormatError(ValueError):
+    """Raised for a PDF that is not in the form ReportLab writes."""
+
+
+def references(data):
+    return [int(match.group(1)) for match in TOKEN.finditer(data) if match.group(1)]
+
+
+def renumber(data, mapping):
+    """Rewrite the ``N G R`` references in ``data`` through ``mapping``; others are left alone."""
+    def replace(match):
+        if match.group(1) and int(match.group(1)) in mapping:
+            return b'%d 0 R' % mapping[int(match.group(1))]
+        return match.group(0)
+    return TOKEN.sub(replace, data)
+
+
+def text_string(text):
+    """Encode ``text`` as a UTF-16 PDF text string, which any title can be written in."""
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+
+class SourcePdf:
+    """Read access to the objects of one ReportLab PDF."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.offsets, trailer = self._read_xref()
+        root = ROOT_REF.search(trailer)
+        if not root:
+            raise PdfFormatError(f"{path}: trailer has no /Root")
+        self.root = int(root.group(1))
+
+    def _read_xref(self):
+        data = self.data
+        position = data.rfind(b'startxref')
+        if position == -1:
+            raise PdfFormatError("no startxref")
+        start = int(data[position + len(b'startxref'):].split()[0])
+        if not data.startswith(b'xref', start):
+            raise PdfFormatError("cross-reference streams are not supported")
+        trailer_at = data.index(b'trailer', start)
+        tokens = data[start + len(b'xref'):trailer_at].split()
+        offsets = {}
+        i = 0
+        while i < len(tokens):
+            first, count = int(tokens[i]), int(tokens[i + 1])
+            i += 2
+            for number in range(first, first + count):
+                offset, kind = int(tokens[i]), tokens[i + 2]
+                if kind == b'n':
+                    offsets[number] = offset
+                i += 3
+        return offsets, data[trailer_at:position]
+
+    def object(self, number):
+        """Return (dictionary bytes, raw stream bytes or None) of object ``number``."""
+        data = self.data
+        header = OBJECT_HEADER.match(data, self.offsets[number])
+        if not header or int(header.group(1)) != number:
+            raise PdfFormatError(f"object {number} is not at its cross-reference offset")
+        body_start = header.end()
+        end = data.index(b'endobj', body_start)
+        stream_at = data.find(b'stream', body_start, end)
+        if stream_at == -1:
+            return data[body_start:end].strip(), None
+        head = data[body_start:stream_at].strip()
+        length = LENGTH.search(head)
+        if not length:
+            raise PdfFormatError(f"object {number} has a stream without /Length")
+        size = int(length.group(1))
+        if length.group(2):
+            size = int(self.object(size)[0])
+        stream_start = stream_at + len(b'stream')
+        if data.startswith(b'\r\n', stream_start):
+            stream_start += 2
+        elif data.startswith(b'\n', stream_start):
+            stream_start += 1
+        return head, data[stream_start:stream_start + size]
+
+    def pages(self):
+        """Object numbers of the pages, in document order."""
+        pages_ref = PAGES_REF.search(self.object(self.root)[0])
+        if not pages_ref:
+            raise PdfFormatError("catalog has no /Pages")
+        pages = []
+        pending = [int(pages_ref.group(1))]
+        while pending:
+            number = pending.pop(0)
+            head = self.object(number)[0]
+            if TYPE_PAGES.search(head):
+                kids = KIDS.search(head)
+                pending[:0] = references(kids.group(1)) if kids else []
+            else:
+                pages.append(number)
+        return pages
+
+    def page_resources(self, pages):
+        """Object numbers reachable from ``pages``, not following /Parent links back up the tree."""
+        seen = set()
+        pending = list(pages)
+        while pending:
+            number = pending.pop()
+            if number in seen or number not in self.offsets:
+                continue
+            seen.add(number)
+            head = PARENT.sub(b'', self.object(number)[0])
+            pending.extend(references(head))
+        return sorted(seen)
+
+
+class PdfWriter:
+    """Writes numbered objects to a file and keeps their offsets for the cross-reference table."""
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        f.write(b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n')
+
+    def write(self, number, head, stream=None):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b'%d 0 obj\n' % number)
+        self.f.write(head)
+        if stream is not None:
+            self.f.write(b'\nstream\n')
+            self.f.write(stream)
+            self.f.write(b'\nendstream')
+        self.f.write(b'\nendobj\n')
+
+    def close(self, size):
+        xref_at = self.f.tell()
+        self.f.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for number in range(1, size):
+            self.f.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.f.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, CATALOG, xref_at))
+
+
+def write_outline(writer, next_number, outline, page_numbers):
+    """Write a flat outline of (title, page index) entries and return the outline root's number."""
+    root = next_number
+    items = list(range(root + 1, root + 1 + len(outline)))
+    for index, (title, page) in enumerate(outline):
+        entry = [b'/Title ' + text_string(title), b'/Parent %d 0 R' % root,
+                 b'/Dest [ %d 0 R /Fit ]' % page_numbers[page]]
+        if index > 0:
+            entry.append(b'/Prev %d 0 R' % items[index - 1])
+        if index < len(items) - 1:
+            entry.append(b'/Next %d 0 R' % items[index + 1])
+        writer.write(items[index], b'<< ' + b' '.join(entry) + b' >>')
+    writer.write(root, b'<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>' % (items[0], items[-1], len(items)))
+    return root
+
+
+def concat_pdfs(parts, filepath, outline=None):
+    """Write the pages of the PDFs at ``parts``, in order, into one PDF at ``filepath``.
+
+    ``outline`` is a list of (title, part index, page index within that part)
+    bookmarks. Only one part is read into memory at a time. Returns the number
+    of pages written.
+    """
+    page_numbers = []
+    part_starts = []
+    # Objects that reference nothing, such as fonts and images, are written once and shared by every part
+    shared = {}
+    next_number = PAGE_TREE + 1
+    with open(filepath, 'wb') as f:
+        writer = PdfWriter(f)
+        for part in parts:
+            source = SourcePdf(part)
+            pages = source.pages()
+            page_set = set(pages)
+            mapping = {}
+            copied = []
+            for old in source.page_resources(pages):
+                head, stream = source.object(old)
+                if old not in page_set and not references(head):
+                    digest = hashlib.sha256(head + b'\0' + (stream if stream is not None else b'\0')).digest()
+                    if digest in shared:
+                        mapping[old] = shared[digest]
+                        continue
+                    shared[digest] = next_number
+                mapping[old] = next_number
+                next_number += 1
+                copied.append(old)
+            part_starts.append(len(page_numbers))
+            page_numbers.extend(mapping[page] for page in pages)
+            for old in copied:
+                head, stream = source.object(old)
+                head = renumber(head, mapping)
+                if old in page_set:
+                    head = PARENT.sub(b'/Parent %d 0 R' % PAGE_TREE, head)
+                writer.write(mapping[old], head, stream)
+            del source
+
+        entries = [
+            (title, part_starts[part] + page) for title, part, page in outline or []
+            if part < len(part_starts) and part_starts[part] + page < len(page_numbers)
+        ]
+        catalog = [b'/Type /Catalog', b'/Pages %d 0 R' % PAGE_TREE]
+        if entries:
+            outline_root = write_outline(writer, next_number, entries, page_numbers)
+            next_number += len(entries) + 1
+            catalog += [b'/Outlines %d 0 R' % outline_root, b'/PageMode /UseOutlines']
+        kids = b' '.join(b'%d 0 R' % number for number in page_numbers)
+        writer.write(PAGE_TREE, b'<< /Type /Pages /Kids [ %s ] /Count %d >>' % (kids, len(page_numbers)))
+        writer.write(CATALOG, b'<< ' + b' '.join(catalog) + b' >>')
+        writer.close(next_number)
+    return len(page_numbers)
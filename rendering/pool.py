@@ -0,0 +1,86 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def timed_call(func, *args):
+    """Return (``func(*args)``, seconds it took); times work where it actually runs."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class RenderPool:
+    """Process pool for CPU-bound renders, so several volumes use several cores.
+
+    Workers are started with ``start_method`` ('spawn' by default, which is safe
+    to use from a multi-threaded server) and are reused across builds.
+    """
+
+    def __init__(self, max_workers=4, start_method='spawn'):
+        self.max_workers = max(1, int(max_workers))
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+            return self._executor
+
+    def _discard(self, executor):
+        """Drop a broken executor so that later tasks start a fresh one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def map(self, func, tasks):
+        """Run ``func(*args)`` for every args tuple in ``tasks`` on the pool.
+
+        Yields, in the same order as ``tasks``, either the function's return
+        value or the exception it raised, as soon as each one is available. A
+        task that fails does not affect the others; if a worker process dies the
+        tasks that were running on the pool are reported as failed and a fresh
+        pool takes the rest.
+
+        ``tasks`` is consumed lazily and at most ``max_workers`` tasks are in
+        flight, so a generator of tasks is never read far ahead of the results.
+        """
+        pending = deque()
+        for args in tasks:
+            # A pool broken by an earlier task is replaced for the tasks that follow
+            executor = self._get_executor()
+            try:
+                pending.append((executor, executor.submit(func, *args)))
+            except BrokenProcessPool as e:
+                self._discard(executor)
+                pending.append((executor, e))
+            while len(pending) >= self.max_workers:
+                yield self._result(*pending.popleft())
+        while pending:
+            yield self._result(*pending.popleft())
+
+    def _result(self, executor, future):
+        if isinstance(future, Exception):
+            return future
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            self._discard(executor)
+            return e
+        except Exception as e:
+            return e
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,94 @@
+import io
+import os
+import time
+import zipfile
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class StreamingZip:
+    """Builds a ZIP archive incrementally without ever holding it in memory or on disk.
+
+    Entries are written uncompressed (ZIP_STORED): the archive is only used to
+    bundle PDFs, which are already compressed.
+    """
+
+    def __init__(self, chunk_size=1024 * 1024):
+        self.chunk_size = chunk_size
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', zipfile.ZIP_STORED)
+
+    def add_file(self, path, arcname):
+        """Yield the archive bytes for one file entry."""
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime(os.path.getmtime(path))[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        info.file_size = os.path.getsize(path)
+        with open(path, 'rb') as src, self._zip.open(info, 'w') as entry:
+            for chunk in iter(lambda: src.read(self.chunk_size), b''):
+                entry.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def add_bytes(self, data, arcname):
+        """Yield the archive bytes for an entry holding ``data``."""
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self._zip.writestr(info, data)
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def close(self):
+        """Yield the trailing central directory bytes."""
+        self._zip.close()
+        data = self._sink.drain()
+        if data:
+            yield data
+
+
+def stream_zip(paths, remove_after=False, trailer=None):
+    """Yield a ZIP archive of ``paths`` entry by entry.
+
+    ``paths`` may be a generator, so each file is added as soon as it exists.
+    With ``remove_after`` every file is deleted once it is in the archive.
+    ``trailer`` is called after the last file and may return an
+    (arcname, bytes) entry to add at the end, or None.
+    """
+    archive = StreamingZip()
+    for path in paths:
+        yield from archive.add_file(path, os.path.basename(path))
+        if remove_after:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    entry = trailer() if trailer else None
+    if entry:
+        yield from archive.add_bytes(entry[1], entry[0])
+    yield from archive.close()
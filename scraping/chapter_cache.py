@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from pipeline.storage import Database, evict_lru
+
+
+class ChapterCache:
+    """On-disk cache of chapter pages and their parsed content, keyed by URL.
+
+    Entries keep the ETag/Last-Modified validators of the original response so
+    callers can revalidate them with conditional requests. The cache is a
+    SQLite database, which keeps it safe to share between gunicorn workers.
+    """
+
+    def __init__(self, cache_dir='cache', max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'chapters.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'changed': 0, 'evictions': 0}
+        self._db = Database(self.db_path, [
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' url TEXT PRIMARY KEY,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' body BLOB,'
+            ' kind TEXT,'
+            ' parsed TEXT,'
+            ' size INTEGER NOT NULL,'
+            ' validated_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)',
+            'CREATE INDEX IF NOT EXISTS entries_validated ON entries (validated_at)',
+        ])
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def record_hit(self):
+        self._count('hits')
+
+    def record_miss(self):
+        self._count('misses')
+
+    def get(self, url):
+        """Return the cached entry for ``url`` or None if missing or expired."""
+        row = self._db.connection().execute(
+            'SELECT * FROM entries WHERE url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row['validated_at'] > self.max_age:
+            self._delete(url)
+            return None
+        return {
+            'url': row['url'],
+            'etag': row['etag'],
+            'last_modified': row['last_modified'],
+            'body': zlib.decompress(row['body']),
+            'kind': row['kind'],
+            'parsed': json.loads(row['parsed']) if row['parsed'] is not None else None,
+        }
+
+    def fingerprint(self, urls):
+        """Hash the cached parsed content of ``urls``, or None if any of them is not cached.
+
+        Only the parsed content goes into the hash, so page chrome that changes
+        on every request (comments, sidebars) does not change the fingerprint.
+        """
+        urls = list(urls)
+        conn = self._db.connection()
+        oldest = time.time() - self.max_age
+        digest = hashlib.sha256()
+        for url in urls:
+            row = conn.execute(
+                'SELECT kind, parsed, validated_at FROM entries WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None or row['parsed'] is None or row['validated_at'] < oldest:
+                return None
+            digest.update(f"{url}\n{row['kind']}\n{row['parsed']}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, body, etag=None, last_modified=None, kind=None, parsed=None):
+        compressed = zlib.compress(body)
+        parsed_json = json.dumps(parsed)
+        size = len(compressed) + len(parsed_json)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        self._db.connection().execute(
+            'INSERT OR REPLACE INTO entries'
+            ' (url, etag, last_modified, body, kind, parsed, size, validated_at, accessed_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, etag, last_modified, compressed, kind, parsed_json, size, now, now)
+        )
+        self.evict()
+
+    def set_parsed(self, url, kind, parsed):
+        parsed_json = json.dumps(parsed)
+        self._db.connection().execute(
+            'UPDATE entries SET kind = ?, parsed = ?, size = length(body) + ? WHERE url = ?',
+            (kind, parsed_json, len(parsed_json), url)
+        )
+
+    def mark_validated(self, url):
+        """Record a successful revalidation (304) of ``url``."""
+        now = time.time()
+        self._db.connection().execute(
+            'UPDATE entries SET validated_at = ?, accessed_at = ? WHERE url = ?',
+            (now, now, url)
+        )
+        self._count('revalidated')
+
+    def mark_changed(self):
+        self._count('changed')
+
+    def _delete(self, url):
+        self._db.connection().execute('DELETE FROM entries WHERE url = ?', (url,))
+        self._count('evictions')
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        conn = self._db.connection()
+        removed = conn.execute(
+            'DELETE FROM entries WHERE validated_at < ?', (time.time() - self.max_age,)
+        ).rowcount
+        removed += evict_lru(conn, 'entries', self.max_bytes,
+                             lambda row: conn.execute('DELETE FROM entries WHERE url = ?', (row['url'],)),
+                             columns='url, size')
+        if removed:
+            self._count('evictions', removed)
+
+    def clear(self):
+        self._db.connection().execute('DELETE FROM entries')
+
+    def stats(self):
+        row = self._db.connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+        ).fetchone()
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = row[0]
+        stats['bytes'] = row[1]
+        return stats
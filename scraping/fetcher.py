@@ -0,0 +1,62 @@
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ConcurrentFetcher:
+    """Bounded thread pool that caps concurrent requests per host."""
+
+    def __init__(self, max_workers=8, per_host=4):
+        self.max_workers = max(1, int(max_workers))
+        self.per_host = max(1, int(per_host))
+        self._executor = None
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='fetch'
+                )
+            return self._executor
+
+    def _host_limit(self, url):
+        host = urllib.parse.urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _call(self, func, url, args):
+        with self._host_limit(url):
+            return func(url, *args)
+
+    def submit(self, func, url, *args):
+        """Schedule ``func(url, *args)`` and return its Future."""
+        return self._get_executor().submit(self._call, func, url, args)
+
+    def map(self, tasks):
+        """Run (func, url, *args) tasks concurrently.
+
+        Returns a list in the same order as ``tasks``; each item is either the
+        function's return value or the exception it raised.
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return []
+        executor = self._get_executor()
+        futures = [executor.submit(self._call, func, url, args) for func, url, *args in tasks]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,207 @@
+import os
+import threading
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from scraping.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+# Errors after which a request is retried and counted against its host's circuit
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, ChunkedEncodingError)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Charsets': 'utf-8'
+}
+
+
+class ConnectionCounter:
+    """Thread-safe counters for requests sent, connections opened and retries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def add_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def add_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def add_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+
+def _counting_pool(base, counter):
+    class CountingPool(base):
+        def _new_conn(self):
+            counter.add_connection()
+            return super()._new_conn()
+    CountingPool.__name__ = f"Counting{base.__name__}"
+    return CountingPool
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new connection."""
+
+    def __init__(self, counter, **kwargs):
+        self.counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.counter),
+            'https': _counting_pool(HTTPSConnectionPool, self.counter),
+        }
+
+
+class HttpClient:
+    """Shared keep-alive HTTP client used for all page and image requests.
+
+    Every request has connect and read timeouts. Connection errors, timeouts
+    and retryable statuses (see RetryPolicy) are retried with backoff, and
+    each host has a circuit breaker so that requests to a failing host fail
+    fast with CircuitOpenError instead of waiting out their timeouts.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=16, connect_timeout=10, read_timeout=60, headers=None,
+                 retry=None, breaker=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.counter = ConnectionCounter()
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+
+        adapter = CountingAdapter(
+            self.counter, pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    @staticmethod
+    def host(url):
+        return urllib.parse.urlparse(url).netloc.lower()
+
+    def _before(self, host):
+        try:
+            self.breaker.before(host)
+        except CircuitOpenError:
+            self.counter.add_rejected()
+            raise
+
+    def _backoff(self, delay):
+        self.counter.add_retry()
+        self.retry.sleep(delay)
+
+    def get(self, url, **kwargs):
+        """Send a GET request, retrying transient failures.
+
+        Returns the last response when a retryable status is still returned
+        after the final attempt; raises the last error when a connection error
+        or timeout is.
+        """
+        return self._send(url, 0, **kwargs)[0]
+
+    def _send(self, url, attempt, **kwargs):
+        """Like ``get``, counting attempts from ``attempt``; returns (response, attempt it took)."""
+        kwargs.setdefault('timeout', self.timeout)
+        host = self.host(url)
+        while True:
+            self._before(host)
+            self.counter.add_request()
+            try:
+                response = self.session.get(url, **kwargs)
+            except TRANSIENT_ERRORS:
+                self.breaker.failure(host)
+                delay = self.retry.delay(attempt)
+                if delay is None:
+                    raise
+            except Exception:
+                # Not worth retrying, but it must still settle a half-open probe
+                self.breaker.failure(host)
+                raise
+            else:
+                if response.status_code not in self.retry.statuses:
+                    self.breaker.success(host)
+                    return response, attempt
+                self.breaker.failure(host)
+                delay = self.retry.delay(attempt, response)
+                if delay is None:
+                    return response, attempt
+                response.close()
+            self._backoff(delay)
+            attempt += 1
+
+    def download(self, url, filepath, chunk_size=64 * 1024):
+        """Stream a response body to ``filepath`` and return the path.
+
+        A transfer that breaks off part-way is started again. Failed requests
+        and broken transfers share one budget of ``max_attempts`` requests.
+        """
+        tmp_path = f"{filepath}.part"
+        attempt = 0
+        try:
+            while True:
+                response, attempt = self._send(url, attempt, stream=True)
+                with response:
+                    response.raise_for_status()
+                    try:
+                        with open(tmp_path, 'wb') as f:
+                            for chunk in response.iter_content(chunk_size=chunk_size):
+                                f.write(chunk)
+                        break
+                    except TRANSIENT_ERRORS:
+                        self.breaker.failure(self.host(url))
+                        delay = self.retry.delay(attempt)
+                        if delay is None:
+                            raise
+                self._backoff(delay)
+                attempt += 1
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return filepath
+
+    def stats(self):
+        requests_sent = self.counter.requests
+        connections = self.counter.connections
+        return {
+            'requests': requests_sent,
+            'connections_opened': connections,
+            'connections_reused': max(requests_sent - connections, 0),
+        }
+
+    def retry_stats(self):
+        return {
+            'retries': self.counter.retries,
+            'circuit_rejections': self.counter.rejected,
+        }
+
+    def close(self):
+        self.session.close()
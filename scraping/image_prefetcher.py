@@ -0,0 +1,68 @@
+import hashlib
+import threading
+from concurrent.futures import CancelledError, wait
+
+
+class ImagePrefetcher:
+    """Downloads a build's images in the background as soon as their URLs are known.
+
+    ``download(url, images_dir, filename, progress)`` does the actual transfer and
+    returns the local path or None. Each URL is downloaded at most once per build;
+    ``get`` only blocks on images that have not finished yet.
+    """
+
+    def __init__(self, images_dir, download, fetcher, progress=None):
+        self.images_dir = images_dir
+        self.download = download
+        self.fetcher = fetcher
+        self.progress = progress
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @staticmethod
+    def filename_for(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def prefetch(self, url):
+        with self._lock:
+            if self._closed or url in self._futures:
+                return self._futures.get(url)
+            future = self.fetcher.submit(
+                self.download, url, self.images_dir, self.filename_for(url), self.progress
+            )
+            self._futures[url] = future
+            return future
+
+    def prefetch_all(self, images):
+        """Queue every image dict (with a ``src`` key) from a parsed chapter."""
+        for img_info in images or []:
+            if img_info.get('src'):
+                self.prefetch(img_info['src'])
+
+    def get(self, url, timeout=None):
+        """Return the local path of ``url``, waiting only if it is not ready yet."""
+        future = self.prefetch(url)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except (CancelledError, Exception):
+            return None
+
+    def stats(self):
+        with self._lock:
+            futures = list(self._futures.values())
+        return {
+            'queued': len(futures),
+            'ready': sum(1 for future in futures if future.done()),
+        }
+
+    def close(self):
+        """Cancel pending downloads and wait for the ones already running."""
+        with self._lock:
+            self._closed = True
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+        wait(futures)
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import threading
+import time
+import urllib.parse
+from PIL import Image as PILImage
+
+from pipeline.storage import Database, evict_lru, link_or_copy, remove_file
+from scraping.keyed_locks import KeyedLocks
+
+
+class ImageStore:
+    """Content-addressed, size-bounded image store shared by every build.
+
+    Blobs are stored once per content hash under ``cache_dir/images`` and looked
+    up by source URL, so an image used by several chapters, volumes or requests is
+    downloaded and measured once. Builds get hard links to the blobs, which keeps
+    their files valid even if the store evicts the blob mid-build.
+    """
+
+    def __init__(self, download, cache_dir='cache', max_bytes=1024 * 1024 * 1024):
+        self.download = download
+        self.images_dir = os.path.join(cache_dir, 'images')
+        if not os.path.exists(self.images_dir):
+            os.makedirs(self.images_dir, exist_ok=True)
+        self.db_path = os.path.join(self.images_dir, 'index.sqlite3')
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._url_locks = KeyedLocks()
+        self._sizes = {}
+        self._counters = {'hits': 0, 'misses': 0, 'deduplicated': 0, 'evictions': 0}
+        self._db = Database(self.db_path, [
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            ' digest TEXT PRIMARY KEY,'
+            ' ext TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' width INTEGER,'
+            ' height INTEGER,'
+            ' accessed_at REAL NOT NULL)',
+            'CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed_at)',
+        ])
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.images_dir, f"{digest}{ext}")
+
+    def _record(self, row):
+        return {
+            'digest': row['digest'],
+            'path': self.blob_path(row['digest'], row['ext']),
+            'ext': row['ext'],
+            'width': row['width'],
+            'height': row['height'],
+        }
+
+    def lookup(self, url):
+        row = self._db.connection().execute(
+            'SELECT blobs.* FROM urls JOIN blobs ON blobs.digest = urls.digest WHERE urls.url = ?',
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = self._record(row)
+        if not os.path.exists(record['path']):
+            return None
+        self._db.connection().execute(
+            'UPDATE blobs SET accessed_at = ? WHERE digest = ?', (time.time(), record['digest'])
+        )
+        return record
+
+    def fetch(self, url):
+        """Return the stored record for ``url``, downloading it on a miss."""
+        record = self.lookup(url)
+        if record:
+            self._count('hits')
+            return record
+        with self._url_locks.hold(url):
+            record = self.lookup(url)
+            if record:
+                self._count('hits')
+                return record
+            self._count('misses')
+            return self._ingest(url)
+
+    def _ingest(self, url):
+        ext = os.path.splitext(urllib.parse.urlparse(url).path)[1] or '.jpg'
+        tmp_path = os.path.join(self.images_dir, f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.download(url, tmp_path)
+            digest = hashlib.sha256()
+            size = 0
+            with open(tmp_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(chunk)
+                    size += len(chunk)
+            digest = digest.hexdigest()
+
+            conn = self._db.connection()
+            row = conn.execute('SELECT * FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if row is not None and os.path.exists(self.blob_path(digest, row['ext'])):
+                self._count('deduplicated')
+                ext = row['ext']
+                width, height = row['width'], row['height']
+            else:
+                width, height = self._measure(tmp_path)
+                os.replace(tmp_path, self.blob_path(digest, ext))
+            conn.execute(
+                'INSERT OR REPLACE INTO blobs (digest, ext, size, width, height, accessed_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (digest, ext, size, width, height, time.time())
+            )
+            conn.execute('INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)', (url, digest))
+        finally:
+            remove_file(tmp_path)
+        self.evict(keep=digest)
+        return {
+            'digest': digest,
+            'path': self.blob_path(digest, ext),
+            'ext': ext,
+            'width': width,
+            'height': height,
+        }
+
+    @staticmethod
+    def _measure(path):
+        try:
+            with PILImage.open(path) as pil_img:
+                return pil_img.size
+        except Exception:
+            return None, None
+
+    def link_into(self, record, directory):
+        """Hard-link (or copy) a stored blob into ``directory`` and return the new path."""
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, f"{record['digest']}{record['ext']}")
+        if not os.path.exists(target):
+            link_or_copy(record['path'], target)
+        return target
+
+    def size_of(self, path):
+        """Return the stored (width, height) for a blob or linked copy, or None."""
+        digest = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            if digest in self._sizes:
+                return self._sizes[digest]
+        row = self._db.connection().execute(
+            'SELECT width, height FROM blobs WHERE digest = ?', (digest,)
+        ).fetchone()
+        if row is None or row['width'] is None:
+            return None
+        size = (row['width'], row['height'])
+        with self._lock:
+            self._sizes[digest] = size
+        return size
+
+    def evict(self, keep=None):
+        """Remove least recently used blobs, except ``keep``, until the store fits in max_bytes."""
+        conn = self._db.connection()
+
+        def remove(row):
+            conn.execute('DELETE FROM urls WHERE digest = ?', (row['digest'],))
+            conn.execute('DELETE FROM blobs WHERE digest = ?', (row['digest'],))
+            remove_file(self.blob_path(row['digest'], row['ext']))
+        removed = evict_lru(conn, 'blobs', self.max_bytes, remove, keep=lambda row: row['digest'] == keep,
+                            columns='digest, ext, size')
+        if removed:
+            self._count('evictions', removed)
+
+    def clear(self):
+        conn = self._db.connection()
+        for row in conn.execute('SELECT digest, ext FROM blobs').fetchall():
+            remove_file(self.blob_path(row['digest'], row['ext']))
+        conn.execute('DELETE FROM urls')
+        conn.execute('DELETE FROM blobs')
+        with self._lock:
+            self._sizes.clear()
+
+    def stats(self):
+        row = self._db.connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs'
+        ).fetchone()
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['blobs'] = row[0]
+        stats['bytes'] = row[1]
+        return stats
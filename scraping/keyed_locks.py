@@ -0,0 +1,35 @@
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """One lock per key, such as a URL, kept only while some thread holds or waits for it.
+
+    A long-running worker sees an unbounded number of distinct keys, so locks
+    are created on first use and dropped again once nobody needs them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        """Hold the lock for ``key`` for the duration of the block."""
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._locks)
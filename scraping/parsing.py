@@ -0,0 +1,48 @@
+import importlib.util
+from bs4 import BeautifulSoup, SoupStrainer
+
+CONTENT_CLASS = 'entry-content alignfull wp-block-post-content has-global-padding is-layout-constrained wp-block-post-content-is-layout-constrained'
+
+# BeautifulSoup tree builders and the module each one needs
+PARSER_BACKENDS = {
+    'html.parser': None,
+    'lxml': 'lxml',
+    'html5lib': 'html5lib',
+}
+
+
+def available_backends():
+    return [name for name, module in PARSER_BACKENDS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+class HtmlParser:
+    """BeautifulSoup front end with a selectable backend and scoped parsing.
+
+    With ``scoped`` enabled only the post's ``entry-content`` div is turned into
+    a tree; the WordPress header, sidebars, navigation and footer are skipped
+    by the tokenizer instead of being built and then ignored.
+    """
+
+    def __init__(self, backend='html.parser', scoped=True):
+        if backend not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown HTML parser backend: {backend}")
+        self.requested_backend = backend
+        self.backend = backend if backend in available_backends() else 'html.parser'
+        self.scoped = scoped
+        self.content_strainer = SoupStrainer('div', class_=CONTENT_CLASS)
+
+    @property
+    def fell_back(self):
+        return self.backend != self.requested_backend
+
+    def parse(self, html, parse_only=None, **kwargs):
+        return BeautifulSoup(html, self.backend, parse_only=parse_only, **kwargs)
+
+    def content_soup(self, html, **kwargs):
+        """Return a tree limited to the entry-content div when scoping is enabled."""
+        return self.parse(html, parse_only=self.content_strainer if self.scoped else None, **kwargs)
+
+    def content_div(self, html, **kwargs):
+        """Return the post's entry-content div, or None if the page has none."""
+        return self.content_soup(html, **kwargs).find('div', class_=CONTENT_CLASS)
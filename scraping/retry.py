@@ -0,0 +1,110 @@
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+# Responses that are worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+def parse_retry_after(value, now=None):
+    """Return the delay in seconds requested by a Retry-After header, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(when.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+class RetryPolicy:
+    """Bounded retries with full-jitter exponential backoff.
+
+    Attempt ``n`` (counting from 0) waits a random time between 0 and
+    ``min(max_backoff, backoff * 2 ** n)``. A 429 or 503 response with a
+    Retry-After header waits as long as the server asks instead, unless that is
+    longer than ``max_retry_after``, in which case it is not retried at all.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=10, max_retry_after=60,
+                 statuses=RETRY_STATUSES, sleep=time.sleep):
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+        self.sleep = sleep
+
+    def delay(self, attempt, response=None):
+        """Return how long to wait before retrying after ``attempt``, or None to give up."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if response is not None and response.status_code in (429, 503):
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Per-host circuit breaker.
+
+    After ``failure_threshold`` consecutive failures a host's circuit opens and
+    requests to it fail immediately with CircuitOpenError. Once
+    ``reset_timeout`` seconds have passed a single trial request is let through;
+    its success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        return self._hosts.setdefault(host, {'failures': 0, 'opened_at': None, 'probing': False})
+
+    def before(self, host):
+        """Raise CircuitOpenError unless a request to ``host`` may be sent now."""
+        with self._lock:
+            state = self._host(host)
+            if state['opened_at'] is None:
+                return
+            if not state['probing'] and self.clock() - state['opened_at'] >= self.reset_timeout:
+                state['probing'] = True
+                return
+        raise CircuitOpenError(f"Circuit open for {host}")
+
+    def success(self, host):
+        with self._lock:
+            self._hosts[host] = {'failures': 0, 'opened_at': None, 'probing': False}
+
+    def failure(self, host):
+        with self._lock:
+            state = self._host(host)
+            state['failures'] += 1
+            if state['probing'] or state['failures'] >= self.failure_threshold:
+                state['opened_at'] = self.clock()
+            state['probing'] = False
+
+    def state(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state['opened_at'] is None:
+                return 'closed'
+            if state['probing'] or self.clock() - state['opened_at'] >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from scraping.keyed_locks import KeyedLocks
+
+
+class TocCache:
+    """Parsed table-of-contents cache with a TTL.
+
+    Entries live in memory and in JSON files under ``cache_dir/toc`` so that a
+    /process handled by one gunicorn worker can serve the /download that lands
+    on another. At most ``max_entries`` are kept in memory, least recently
+    used first out; older ones are read back from disk.
+    """
+
+    def __init__(self, cache_dir='cache', ttl=900, max_entries=256):
+        self.toc_dir = os.path.join(cache_dir, 'toc')
+        if not os.path.exists(self.toc_dir):
+            os.makedirs(self.toc_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._url_locks = KeyedLocks()
+        self._counters = {'hits': 0, 'misses': 0}
+
+    def _path(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.toc_dir, f"{digest}.json")
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, url, expires_at, data):
+        with self._lock:
+            self._memory[url] = (expires_at, data)
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, url):
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(url)
+            if cached and cached[0] > now:
+                self._memory.move_to_end(url)
+            elif cached:
+                del self._memory[url]
+        if cached and cached[0] > now:
+            return json.loads(cached[1])
+
+        path = self._path(url)
+        try:
+            stored_at = os.path.getmtime(path)
+            if now - stored_at <= self.ttl:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = f.read()
+                self._remember(url, stored_at + self.ttl, data)
+                return json.loads(data)
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def get(self, url):
+        toc = self._lookup(url)
+        self._count('hits' if toc is not None else 'misses')
+        return toc
+
+    def put(self, url, toc):
+        data = json.dumps(toc)
+        self._remember(url, time.time() + self.ttl, data)
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_or_load(self, url, loader):
+        """Return the cached ToC for ``url``, calling ``loader(url)`` at most once per miss."""
+        toc = self._lookup(url)
+        if toc is None:
+            with self._url_locks.hold(url):
+                toc = self._lookup(url)
+                if toc is None:
+                    self._count('misses')
+                    toc = loader(url)
+                    self.put(url, toc)
+                    return toc
+        self._count('hits')
+        return toc
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for name in os.listdir(self.toc_dir):
+            try:
+                os.remove(os.path.join(self.toc_dir, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._memory)
+        return stats
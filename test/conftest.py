@@ -1,12 +1,32 @@
 import pytest
 import sys
 import os
+import tempfile
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Keep test runs away from the real on-disk caches
+os.environ.setdefault('FLASK_CACHE_DIR', tempfile.mkdtemp(prefix='webtoreader-test-cache-'))
+os.environ.setdefault('FLASK_JOBS_DIR', tempfile.mkdtemp(prefix='webtoreader-test-jobs-'))
+os.environ.setdefault('FLASK_DOWNLOADS_DIR', tempfile.mkdtemp(prefix='webtoreader-test-downloads-'))
+
+import app as app_module
 from app import app as flask_app
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    app_module.toc_cache.clear()
+    if app_module.chapter_cache is not None:
+        app_module.chapter_cache.clear()
+    if app_module.image_store is not None:
+        app_module.image_store.clear()
+    if app_module.artifact_cache is not None:
+        app_module.artifact_cache.clear()
+    if app_module.build_manifest is not None:
+        app_module.build_manifest.clear()
+    yield
+
 @pytest.fixture
 def app():
     flask_app.config['TESTING'] = True
@@ -1,7 +1,46 @@
 import pytest
+import re
 import json
+import os
+import threading
+import sqlite3
+import time
+import urllib.parse
 from unittest.mock import patch, MagicMock
-from app import  validate_url, get_book_names, get_webpage_content
+from app import  validate_url, get_book_names, get_webpage_content, process_chapters
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scraping.fetcher import ConcurrentFetcher
+from scraping.http_client import HttpClient
+from scraping.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+import requests
+from requests.exceptions import ChunkedEncodingError
+from scraping.chapter_cache import ChapterCache
+from scraping.toc_cache import TocCache
+from pipeline.artifact_cache import ArtifactCache
+from pipeline.jobs import JobManager, JobStore
+from pipeline.metrics import Metrics
+from custom_logging.logger import AppLogger
+from pipeline.workspace import BuildWorkspace, prune_workspaces
+from pipeline.streaming import BoundedPipeline
+from scraping.image_prefetcher import ImagePrefetcher
+from scraping.image_store import ImageStore
+from scraping.parsing import HtmlParser, available_backends
+from benchmarks import fixtures
+from benchmarks.site import FixtureSite
+from rendering.epub import render_epub
+from rendering.images import ImageTranscoder
+from rendering.pdf import FlowableBuilder, get_styles, render_pdf
+from rendering.pdf_concat import SourcePdf, concat_pdfs
+import xml.etree.ElementTree as ET
+from rendering.pool import RenderPool
+from rendering.zip_stream import stream_zip
+import io
+import logging
+import flask
+import zipfile
+import app as app_module
+from reportlab.lib.pagesizes import A4
+A4_WIDTH = A4[0]
 
 class TestURLValidation:
     """Test URL validation functions."""
@@ -126,10 +165,194 @@ class TestDownloadEndpoint:
         data = json.loads(response.data)
         assert data["error"] == "No format selected"
 
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_download_streams_multi_volume_zip(self, mock_get_content, mock_process, mock_create_pdf, client):
+        """Test that several volumes are streamed as a ZIP and the workspace is removed afterwards."""
+        mock_get_content.return_value = {"Volume 1": {}, "Volume 2": {}}
+        mock_process.side_effect = lambda books, **kwargs: iter([("Volume 1", []), ("Volume 2", [])])
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-" + volume_name.encode())
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+
+        response = client.post('/download', json={"selectedBooks": [1, 2], "format": "PDF", "url": "https://example.com"})
+
+        assert response.status_code == 200
+        assert response.is_streamed
+        build_id = response.headers['X-Build-Id']
+        with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+            assert archive.namelist() == ["Volume 1.pdf", "Volume 2.pdf"]
+            assert archive.read("Volume 2.pdf") == b"%PDF-Volume 2"
+        response.close()
+        assert 'X-Artifact-Url' not in response.headers
+        assert not os.path.exists(os.path.join(app_module.app.config['DOWNLOADS_DIR'], build_id))
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_interrupted_stream_can_be_resumed(self, mock_get_content, mock_volumes, mock_create_pdf, client,
+                                               monkeypatch):
+        """Test that with STREAM_ZIP_KEEP a streamed ZIP is finished after the client disconnects and can be resumed."""
+        monkeypatch.setitem(app_module.app.config, 'STREAM_ZIP_KEEP', True)
+        mock_get_content.return_value = {"Volume 1": {}, "Volume 2": {}}
+        mock_volumes.side_effect = lambda books, **kwargs: iter([("Volume 1", []), ("Volume 2", [])])
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-" + volume_name.encode() * 100)
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+
+        response = client.post('/download', json={"selectedBooks": [1, 2], "format": "PDF",
+                                                  "url": "https://example.com"})
+        artifact_url = response.headers['X-Artifact-Url']
+        assert client.get(artifact_url).status_code == 404
+        received = next(response.response)
+        response.close()
+
+        resumed = client.get(artifact_url, headers={'Range': f'bytes={len(received)}-'})
+        assert resumed.status_code == 206
+        with zipfile.ZipFile(io.BytesIO(received + resumed.get_data())) as archive:
+            assert archive.namelist() == ["Volume 1.pdf", "Volume 2.pdf"]
+            assert archive.read("Volume 2.pdf") == b"%PDF-" + b"Volume 2" * 100
+        resumed.close()
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_streamed_zip_lists_what_is_missing(self, mock_get_content, mock_volumes, mock_create_pdf, client):
+        """Test that a streamed ZIP reports failed volumes and missing chapters in a MISSING.txt entry."""
+        mock_get_content.return_value = {"Volume 1": {}, "Volume 2": {}, "Volume 3": {}}
+
+        def volumes(books, missing=None, **kwargs):
+            yield "Volume 1", []
+            missing.append("Volume 2: Chapter 4")
+            yield "Volume 2", []
+            yield "Volume 3", []
+        mock_volumes.side_effect = volumes
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            if volume_name == "Volume 3":
+                return None
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-" + volume_name.encode())
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+
+        response = client.post('/download', json={"selectedBooks": [1, 2, 3], "format": "PDF",
+                                                  "url": "https://example.com"})
+
+        assert response.is_streamed
+        with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+            assert archive.namelist() == ["Volume 1.pdf", "Volume 2.pdf", "MISSING.txt"]
+            report = archive.read("MISSING.txt").decode('utf-8')
+        response.close()
+        assert "Volumes that could not be rendered:\n  Volume 3\n" in report
+        assert "Chapters that could not be fetched:\n  Volume 2: Chapter 4\n" in report
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_artifact_url_supports_range_requests(self, mock_get_content, mock_volumes, mock_create_pdf, client):
+        """Test that a finished download can be resumed from its artifact URL."""
+        mock_get_content.return_value = {"Volume 1": {}, "Volume 2": {}}
+        mock_volumes.side_effect = lambda books, **kwargs: iter([("Volume 1", []), ("Volume 2", [])])
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-" + volume_name.encode() * 100)
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+
+        response = client.post('/download', json={"selectedBooks": [1, 2], "format": "PDF",
+                                                  "url": "https://example.com", "stream": False})
+        assert response.headers['Content-Length']
+        body = response.get_data()
+        url = response.headers['X-Artifact-Url']
+        response.close()
+
+        partial = client.get(url, headers={"Range": "bytes=100-"})
+        assert partial.status_code == 206
+        assert partial.headers['Content-Range'] == f"bytes 100-{len(body) - 1}/{len(body)}"
+        assert partial.get_data() == body[100:]
+        etag = partial.headers['ETag']
+        partial.close()
+
+        resumed = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+        assert resumed.status_code == 206 and resumed.get_data() == body[:10]
+        resumed.close()
+
+        client.post('/confirm-download', json={"buildId": response.headers['X-Build-Id']})
+        assert client.get(url).status_code == 404
+
+    def test_artifact_url_rejects_unfinished_builds(self, client):
+        """Test that files of builds in progress and unknown builds are not served."""
+        workspace = BuildWorkspace.create(app_module.app.config['DOWNLOADS_DIR'])
+        with open(workspace.file_path("Vol1.pdf"), 'wb') as f:
+            f.write(b"%PDF")
+
+        assert client.get(f"/artifacts/{workspace.id}/Vol1.pdf").status_code == 404
+        assert client.get("/artifacts/not-a-build/Vol1.pdf").status_code == 404
+        workspace.finish()
+        assert client.get(f"/artifacts/{workspace.id}/images").status_code == 404
+        assert client.get(f"/artifacts/{workspace.id}/Vol1.pdf").get_data() == b"%PDF"
+        workspace.cleanup()
+
+    @pytest.mark.parametrize("mode, header", [("x-accel-redirect", "X-Accel-Redirect"), ("x-sendfile", "X-Sendfile")])
+    def test_artifacts_can_be_offloaded_to_the_proxy(self, mode, header, client, monkeypatch):
+        """Test that offload mode hands the file to the proxy instead of sending it."""
+        monkeypatch.setitem(app_module.app.config, 'ARTIFACT_OFFLOAD', mode)
+        root = app_module.app.config['DOWNLOADS_DIR']
+        workspace = BuildWorkspace.create(root)
+        with open(workspace.file_path("Vol 1 ü.pdf"), 'wb') as f:
+            f.write(b"%PDF")
+        workspace.finish()
+
+        response = client.get(f"/artifacts/{workspace.id}/Vol%201%20%C3%BC.pdf")
+
+        assert response.status_code == 200
+        assert response.get_data() == b""
+        assert response.mimetype == "application/pdf"
+        assert "filename*=UTF-8''Vol%201%20%C3%BC.pdf" in response.headers['Content-Disposition']
+        if mode == "x-accel-redirect":
+            assert response.headers[header] == f"/internal-downloads/{workspace.id}/Vol%201%20%C3%BC.pdf"
+        else:
+            assert response.headers[header] == os.path.abspath(workspace.file_path("Vol 1 ü.pdf"))
+        workspace.cleanup()
+
+    def test_stream_zip_stores_entries(self, tmp_path):
+        """Test that the streamed archive is valid, uncompressed and removes added files."""
+        paths = []
+        for i in range(3):
+            path = tmp_path / f"Vol{i}.pdf"
+            path.write_bytes(os.urandom(3000))
+            paths.append(str(path))
+        expected = {os.path.basename(p): open(p, 'rb').read() for p in paths}
+
+        data = b''.join(stream_zip(iter(paths), remove_after=True))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+            assert {name: archive.read(name) for name in archive.namelist()} == expected
+        assert not any(os.path.exists(p) for p in paths)
+
 class TestUtilityFunctions:
     """Test utility functions."""
     
-    @patch('requests.get')
+    @patch('app.http_client.get')
     def test_get_book_names_success(self, mock_get):
         """Test successful book name extraction."""
         # Mock HTML response
@@ -146,10 +369,1579 @@ class TestUtilityFunctions:
         result = get_book_names("https://example.com")
         assert result == ["Volume 1", "Volume 2"]
     
-    @patch('requests.get')
+    @patch('app.http_client.get')
     def test_get_book_names_request_failure(self, mock_get):
         """Test book name extraction with request failure."""
         mock_get.side_effect = Exception("Network error")
         
         result = get_book_names("https://example.com")
-        assert result is None
\ No newline at end of file
+        assert result is None
+
+class TestProcessChapters:
+    """Test chapter processing and concurrent fetching."""
+
+    books = {
+        "Volume 1": [
+            {"name": "Illustrations", "url": "https://example.com/v1-illustrations/"},
+            {"name": "Prologue", "url": "https://example.com/v1-prologue/"},
+            {"name": "Chapter 1", "url": "https://example.com/v1-chapter-1/"},
+            {"name": "Chapter 2", "url": "https://example.com/v1-chapter-2/"},
+        ]
+    }
+
+    @staticmethod
+    def slow_first_chapter(url):
+        # Make earlier chapters finish last so ordering is actually exercised
+        if url.endswith('prologue/'):
+            time.sleep(0.05)
+        return {"paragraphs": [url], "inline_images": [], "tables": []}
+
+    @pytest.mark.parametrize("concurrent", [True, False])
+    @patch('app.fetch_illustrations')
+    @patch('app.fetch_chapter')
+    def test_process_chapters_keeps_order_and_numbering(self, mock_fetch, mock_illustrations, concurrent):
+        """Test that both modes keep chapter order and text numbering."""
+        mock_fetch.side_effect = self.slow_first_chapter
+        mock_illustrations.return_value = [{"src": "a.jpg", "alt": "", "caption": ""}]
+
+        result = process_chapters(self.books, concurrent=concurrent)
+
+        chapters = result["Volume 1"]
+        assert [c["chapter_name"] for c in chapters] == ["Illustrations", "Prologue", "Chapter 1", "Chapter 2"]
+        assert [c["chapter_num"] for c in chapters] == [None, 1, 2, 3]
+        assert chapters[0]["type"] == "illustrations"
+        assert chapters[0]["images"] == mock_illustrations.return_value
+        assert chapters[1]["content"]["paragraphs"] == ["https://example.com/v1-prologue/"]
+
+    @patch('app.fetch_illustrations')
+    @patch('app.fetch_chapter')
+    def test_process_chapters_skips_failed_chapter(self, mock_fetch, mock_illustrations):
+        """Test that a failed chapter is skipped without renumbering the others."""
+        def fetch(url):
+            if url.endswith('chapter-1/'):
+                raise RuntimeError("boom")
+            return {"paragraphs": [], "inline_images": [], "tables": []}
+        mock_fetch.side_effect = fetch
+        mock_illustrations.return_value = []
+
+        chapters = process_chapters(self.books, concurrent=True)["Volume 1"]
+
+        assert [c["chapter_num"] for c in chapters] == [None, 1, 3]
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.fetch_chapter')
+    @patch('app.get_webpage_content')
+    def test_missing_chapters_are_reported(self, mock_get_content, mock_fetch, mock_create_pdf, client):
+        """Test that chapters that fail to fetch are listed, or fail the build when configured."""
+        mock_get_content.return_value = {"Volume 1": self.books["Volume 1"][1:]}
+
+        def fetch(url):
+            if url.endswith('chapter-1/'):
+                raise requests.ConnectionError("refused")
+            return {"paragraphs": [], "inline_images": [], "tables": []}
+        mock_fetch.side_effect = fetch
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-")
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+        request = {"selectedBooks": [1], "format": "PDF", "url": "https://example.com"}
+
+        response = client.post('/download', json=request)
+        assert response.status_code == 200
+        assert response.headers['X-Missing-Chapters'] == "Volume%201%3A%20Chapter%201"
+        response.close()
+
+        with patch.dict(app_module.app.config, {'FAIL_ON_MISSING_CHAPTERS': True}):
+            response = client.post('/download', json=request)
+        assert response.status_code == 502
+        assert "Chapter 1" in response.get_json()["error"]
+
+    def test_fetcher_caps_requests_per_host(self):
+        """Test that the fetcher never exceeds the per-host limit."""
+        fetcher = ConcurrentFetcher(max_workers=8, per_host=2)
+        active = {"now": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def work(url):
+            with lock:
+                active["now"] += 1
+                active["peak"] = max(active["peak"], active["now"])
+            time.sleep(0.02)
+            with lock:
+                active["now"] -= 1
+            return url
+
+        urls = [f"https://example.com/{i}" for i in range(8)]
+        try:
+            assert fetcher.map((work, url) for url in urls) == urls
+        finally:
+            fetcher.shutdown()
+        assert active["peak"] <= 2
+
+
+def png_bytes(width=40, height=30):
+    from io import BytesIO
+    from PIL import Image as PILImage
+    buffer = BytesIO()
+    PILImage.new('RGB', (width, height), (200, 30, 30)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.endswith('.png'):
+            body = png_bytes()
+            content_type = 'image/png'
+        else:
+            body = b'<html><h3>Volume 1</h3></html>'
+            content_type = 'text/html'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestHttpClient:
+    """Test the shared pooled HTTP client."""
+
+    def test_connections_are_reused(self, local_server):
+        """Test that sequential requests share one keep-alive connection."""
+        client = HttpClient()
+        for i in range(3):
+            response = client.get(f"{local_server}/page{i}")
+            assert response.status_code == 200
+        stats = client.stats()
+        client.close()
+        assert stats == {'requests': 3, 'connections_opened': 1, 'connections_reused': 2}
+
+    def test_default_and_custom_headers(self):
+        """Test that default headers are applied and can be overridden."""
+        client = HttpClient(headers={'User-Agent': 'custom-agent'})
+        assert client.session.headers['User-Agent'] == 'custom-agent'
+        assert client.session.headers['Accept-Language'] == 'en-US,en;q=0.5'
+
+    def test_download_writes_file(self, local_server, tmp_path):
+        """Test that download streams the body to disk."""
+        client = HttpClient()
+        path = client.download(f"{local_server}/image.jpg", str(tmp_path / "image.jpg"))
+        client.close()
+        with open(path, 'rb') as f:
+            assert f.read() == b'<html><h3>Volume 1</h3></html>'
+
+    def test_retries_honor_retry_after(self):
+        """Test that a 503 is retried after the delay the server asks for."""
+        sleeps = []
+        client = HttpClient(retry=RetryPolicy(max_attempts=3, sleep=sleeps.append))
+        client.session.get = MagicMock(side_effect=[
+            make_response(503, headers={'Retry-After': '2'}),
+            make_response(429, headers={'Retry-After': '3600'}),
+        ])
+
+        response = client.get("https://example.com/c1")
+
+        # A Retry-After beyond the limit is not waited for
+        assert response.status_code == 429
+        assert sleeps == [2.0]
+        assert client.session.get.call_count == 2
+
+    def test_download_shares_one_attempt_budget(self, tmp_path):
+        """Test that failed requests and broken transfers together send at most max_attempts requests."""
+        broken = make_response(200)
+        broken.iter_content.side_effect = ChunkedEncodingError("connection reset")
+        broken.__enter__ = MagicMock(return_value=broken)
+        broken.__exit__ = MagicMock(return_value=False)
+        client = HttpClient(retry=RetryPolicy(max_attempts=3, sleep=lambda delay: None),
+                            breaker=CircuitBreaker(failure_threshold=10))
+        client.session.get = MagicMock(side_effect=[requests.ConnectionError("refused"), broken, broken, broken])
+
+        with pytest.raises(ChunkedEncodingError):
+            client.download("https://img.example.com/a.png", str(tmp_path / "a.png"))
+
+        assert client.session.get.call_count == 3
+        assert client.retry_stats()['retries'] == 2
+        assert not os.listdir(tmp_path)
+
+    def test_circuit_opens_for_failing_host(self):
+        """Test that a failing host fails fast until the reset timeout, then is probed again."""
+        now = [0.0]
+        client = HttpClient(
+            retry=RetryPolicy(max_attempts=2, sleep=lambda delay: None),
+            breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+        )
+        client.session.get = MagicMock(side_effect=requests.ConnectionError("refused"))
+
+        with pytest.raises(requests.ConnectionError):
+            client.get("https://down.example.com/c1")
+        with pytest.raises(CircuitOpenError):
+            client.get("https://down.example.com/c2")
+        assert client.session.get.call_count == 2
+        assert client.retry_stats() == {'retries': 1, 'circuit_rejections': 1}
+
+        now[0] = 31
+        client.session.get = MagicMock(return_value=make_response(200))
+        assert client.get("https://down.example.com/c3").status_code == 200
+        assert client.breaker.state("down.example.com") == 'closed'
+
+    def test_non_transient_error_settles_half_open_probe(self):
+        """Test that a probe failing with an error that is not retried does not leave the circuit stuck."""
+        now = [0.0]
+        client = HttpClient(
+            retry=RetryPolicy(max_attempts=1, sleep=lambda delay: None),
+            breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        )
+        client.session.get = MagicMock(side_effect=requests.ConnectionError("refused"))
+        with pytest.raises(requests.ConnectionError):
+            client.get("https://loop.example.com/c1")
+
+        now[0] = 31
+        client.session.get = MagicMock(side_effect=requests.TooManyRedirects("redirect loop"))
+        with pytest.raises(requests.TooManyRedirects):
+            client.get("https://loop.example.com/c2")
+        assert client.breaker.state("loop.example.com") == 'open'
+
+        now[0] = 62
+        client.session.get = MagicMock(return_value=make_response(200))
+        assert client.get("https://loop.example.com/c3").status_code == 200
+        assert client.breaker.state("loop.example.com") == 'closed'
+
+
+CHAPTER_HTML = b'''
+<html><body>
+<div class="entry-content alignfull wp-block-post-content has-global-padding is-layout-constrained wp-block-post-content-is-layout-constrained"><p>First paragraph</p><p>Second paragraph</p></div>
+</body></html>
+'''
+
+
+def make_response(status_code, content=b'', headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = content
+    response.headers = headers or {}
+    return response
+
+
+class TestChapterCache:
+    """Test the on-disk chapter cache."""
+
+    def test_put_and_get_round_trip(self, tmp_path):
+        """Test that body, validators and parsed content are stored."""
+        cache = ChapterCache(cache_dir=str(tmp_path))
+        cache.put("https://example.com/c1", b"<p>hi</p>", etag='"abc"', kind='chapter', parsed={"paragraphs": ["hi"]})
+
+        entry = cache.get("https://example.com/c1")
+        assert entry['body'] == b"<p>hi</p>"
+        assert entry['parsed'] == {"paragraphs": ["hi"]}
+        assert ChapterCache.conditional_headers(entry) == {'If-None-Match': '"abc"'}
+
+    def test_lru_eviction_by_size(self, tmp_path):
+        """Test that least recently used entries are evicted over max_bytes."""
+        cache = ChapterCache(cache_dir=str(tmp_path), max_bytes=3000)
+        for i in range(3):
+            cache.put(f"https://example.com/c{i}", os.urandom(1200), kind='chapter', parsed=None)
+            time.sleep(0.01)
+
+        assert cache.get("https://example.com/c0") is None
+        assert cache.get("https://example.com/c2") is not None
+        assert cache.stats()['bytes'] <= 3000
+
+    def test_age_eviction(self, tmp_path):
+        """Test that entries older than max_age are dropped."""
+        cache = ChapterCache(cache_dir=str(tmp_path), max_age=0)
+        cache.put("https://example.com/c1", b"body", kind='chapter', parsed=None)
+        time.sleep(0.01)
+        assert cache.get("https://example.com/c1") is None
+
+    def test_fetch_chapter_revalidates_with_etag(self, tmp_path):
+        """Test that a 304 response serves the cached parsed chapter."""
+        cache = ChapterCache(cache_dir=str(tmp_path))
+        url = "https://example.com/c1"
+        with patch.object(app_module, 'chapter_cache', cache), \
+                patch('app.http_client.get') as mock_get:
+            mock_get.return_value = make_response(200, CHAPTER_HTML, {'ETag': '"v1"'})
+            first = app_module.fetch_chapter(url)
+
+            mock_get.return_value = make_response(304)
+            second = app_module.fetch_chapter(url)
+
+            assert mock_get.call_args.kwargs['headers'] == {'If-None-Match': '"v1"'}
+
+        assert first['paragraphs'] == ["First paragraph", "Second paragraph"]
+        assert second == first
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['revalidated'] == 1
+
+
+
+class TestArtifactCache:
+    """Test the rendered artifact cache."""
+
+    def store(self, cache, tmp_path, name, size=1000):
+        path = tmp_path / name
+        path.write_bytes(os.urandom(size))
+        key = ArtifactCache.key({name: [f"https://example.com/{name}"]}, "fp", "pdf", 1)
+        cache.put(key, str(path), name, "application/pdf")
+        time.sleep(0.01)
+        return key
+
+    def test_put_and_acquire(self, tmp_path):
+        """Test that a stored artifact is found by its key and keyed on format and content."""
+        cache = ArtifactCache(cache_dir=str(tmp_path / "cache"))
+        key = self.store(cache, tmp_path, "Vol1.pdf")
+
+        entry = cache.acquire(key)
+        assert entry['download_name'] == "Vol1.pdf"
+        assert open(entry['path'], 'rb').read() == (tmp_path / "Vol1.pdf").read_bytes()
+        cache.release(entry['lease'])
+        assert key != ArtifactCache.key({"Vol1.pdf": ["https://example.com/Vol1.pdf"]}, "fp", "epub", 1)
+        assert key != ArtifactCache.key({"Vol1.pdf": ["https://example.com/Vol1.pdf"]}, "fp2", "pdf", 1)
+        assert cache.acquire("missing") is None
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    def test_expired_artifacts_are_misses(self, tmp_path):
+        """Test that entries older than the TTL are not served."""
+        cache = ArtifactCache(cache_dir=str(tmp_path / "cache"), max_age=0)
+        key = self.store(cache, tmp_path, "Vol1.pdf")
+        assert cache.acquire(key) is None
+
+    def test_eviction_skips_leased_artifacts(self, tmp_path):
+        """Test that quota eviction drops the least recently used entry that is not being served."""
+        cache = ArtifactCache(cache_dir=str(tmp_path / "cache"), max_bytes=2500)
+        first = self.store(cache, tmp_path, "Vol1.pdf")
+        second = self.store(cache, tmp_path, "Vol2.pdf")
+        lease = cache.acquire(first)['lease']
+
+        self.store(cache, tmp_path, "Vol3.pdf")
+
+        assert cache.acquire(first) is not None
+        assert cache.acquire(second) is None
+        assert cache.stats()['bytes'] <= 2500
+        cache.release(lease)
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_repeat_download_is_served_from_cache(self, mock_get_content, mock_volumes, mock_create_pdf, client):
+        """Test that a second identical download skips fetching and rendering."""
+        url = "https://example.com/v1-c1/"
+        mock_get_content.return_value = {"Volume 1": [{"name": "Chapter 1", "url": url}]}
+        app_module.chapter_cache.put(url, b"<p>hi</p>", kind='chapter', parsed={"paragraphs": ["hi"]})
+        mock_volumes.side_effect = lambda books, **kwargs: iter([("Volume 1", [])])
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-cached")
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+        request = {"selectedBooks": [1], "format": "PDF", "url": "https://example.com"}
+
+        first = client.post('/download', json=request)
+        first.close()
+        client.post('/confirm-download', json={"buildId": first.headers['X-Build-Id']})
+        second = client.post('/download', json=request)
+
+        assert second.status_code == 200
+        assert second.headers['X-Artifact-Cache'] == "hit"
+        assert second.get_data() == b"%PDF-cached"
+        second.close()
+        assert mock_create_pdf.call_count == 1
+        assert mock_volumes.call_count == 1
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_cache_hits_get_their_own_file_name(self, mock_get_content, mock_volumes, mock_create_pdf, client):
+        """Test that a cached artifact is linked under a freshly stamped name, not the first build's."""
+        url = "https://example.com/v1-c1/"
+        mock_get_content.return_value = {"Volume 1": [{"name": "Chapter 1", "url": url}]}
+        app_module.chapter_cache.put(url, b"<p>hi</p>", kind='chapter', parsed={"paragraphs": ["hi"]})
+        mock_volumes.side_effect = lambda books, **kwargs: iter([("Volume 1", [])])
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            path = workspace.file_path("Vol1_20200101_000000.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-cached")
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+        request = {"selectedBooks": [1], "format": "PDF", "url": "https://example.com", "stream": False}
+
+        first = client.post('/download', json=request)
+        second = client.post('/download', json=request)
+
+        assert second.headers['X-Artifact-Cache'] == "hit"
+        assert 'Vol1_20200101_000000.pdf' in first.headers['Content-Disposition']
+        assert 'Vol1_20200101_000000.pdf' not in second.headers['Content-Disposition']
+        assert re.search(r'Vol1_\d{8}_\d{6}\.pdf', second.headers['Content-Disposition'])
+        first.close()
+        second.close()
+
+
+INDEX_HTML = b'''
+<html><body>
+<h3>Volume 1</h3>
+<div><div>
+<p><a href="https://example.com/v1-c1/">Chapter 1</a><a href="https://example.com/v1-c2/">Chapter 2</a></p>
+</div></div>
+<h3>Volume 2</h3>
+<h3>Side Stories</h3>
+</body></html>
+'''
+
+
+class TestChapterSelection:
+    """Test downloading a subset of a volume's chapters."""
+
+    def test_parse_chapter_selection(self):
+        """Test chapter ids, closed and open ranges, and rejected input."""
+        assert app_module.parse_chapter_selection([2, "4", "6-8", "10-"]) == [(2, 2), (4, 4), (6, 8), (10, None)]
+        for invalid in ([], "1-3", ["3-1"], [0], ["x"], [True], [1.5]):
+            with pytest.raises(ValueError):
+                app_module.parse_chapter_selection(invalid)
+
+    @patch('app.get_table_of_contents')
+    def test_process_lists_chapter_ids(self, mock_toc, client):
+        """Test that /process lists chapter ids when asked to."""
+        mock_toc.return_value = [{"title": "Volume 1", "number": "1", "chapters": [
+            {"name": "Illustrations", "url": "https://example.com/v1-illustrations/"},
+            {"name": "Chapter 1", "url": "https://example.com/v1-c1/"},
+        ]}]
+
+        plain = client.post('/process', json={"url": "https://example.com"}).get_json()
+        detailed = client.post('/process', json={"url": "https://example.com", "includeChapters": True}).get_json()
+
+        assert plain["books"] == [{"id": 1, "title": "Volume 1"}]
+        assert detailed["books"][0]["number"] == "1"
+        assert detailed["books"][0]["chapters"] == [
+            {"id": 1, "name": "Illustrations", "type": "illustrations"},
+            {"id": 2, "name": "Chapter 1", "type": "text"},
+        ]
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.fetch_chapter')
+    @patch('app.get_webpage_content')
+    def test_only_selected_chapters_are_fetched(self, mock_get_content, mock_fetch, mock_create_pdf, client):
+        """Test that a chapter range fetches and renders only those chapters, keeping their numbers."""
+        mock_get_content.return_value = {
+            "Volume 1": [{"name": f"Chapter {i}", "url": f"https://example.com/v1-c{i}/"} for i in range(1, 7)],
+            "Volume 2": [{"name": "Chapter 1", "url": "https://example.com/v2-c1/"}],
+        }
+        mock_fetch.side_effect = lambda url: {"paragraphs": [url], "tables": [], "inline_images": []}
+        rendered = []
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            rendered.append([chapter['chapter_num'] for chapter in chapters])
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF")
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+
+        response = client.post('/download', json={"selectedChapters": {"1": [2, "5-"]}, "format": "PDF",
+                                                  "url": "https://example.com"})
+
+        assert response.status_code == 200
+        response.close()
+        assert sorted(call.args[0] for call in mock_fetch.call_args_list) == [
+            "https://example.com/v1-c2/", "https://example.com/v1-c5/", "https://example.com/v1-c6/"]
+        assert rendered == [[2, 5, 6]]
+
+    def test_invalid_chapter_selection_is_rejected(self, client):
+        """Test that malformed chapter ranges are a 400."""
+        response = client.post('/download', json={"selectedChapters": {"1": ["5-2"]}, "format": "PDF",
+                                                  "url": "https://example.com"})
+        assert response.status_code == 400
+        assert "Invalid chapter selection" in response.get_json()["error"]
+
+
+class TestTableOfContents:
+    """Test the shared table-of-contents cache."""
+
+    @patch('app.http_client.get')
+    def test_process_and_download_share_one_fetch(self, mock_get):
+        """Test that the index page is fetched once for both endpoints."""
+        mock_get.return_value = make_response(200, INDEX_HTML)
+
+        assert get_book_names("https://example.com/series") == ["Volume 1", "Volume 2"]
+        books = get_webpage_content("https://example.com/series")
+
+        assert mock_get.call_count == 1
+        assert books == {
+            "Volume 1": [
+                {"name": "Chapter 1", "url": "https://example.com/v1-c1/"},
+                {"name": "Chapter 2", "url": "https://example.com/v1-c2/"},
+            ]
+        }
+
+    def test_toc_cache_is_shared_through_disk(self, tmp_path):
+        """Test that a second cache instance (another worker) sees stored entries."""
+        TocCache(cache_dir=str(tmp_path)).put("https://example.com/series", [{"title": "Volume 1"}])
+        other_worker = TocCache(cache_dir=str(tmp_path))
+        assert other_worker.get("https://example.com/series") == [{"title": "Volume 1"}]
+
+    def test_toc_cache_expires(self, tmp_path):
+        """Test that entries older than the TTL are reloaded."""
+        cache = TocCache(cache_dir=str(tmp_path), ttl=0)
+        loader = MagicMock(return_value=[])
+        cache.get_or_load("https://example.com/series", loader)
+        time.sleep(0.01)
+        cache.get_or_load("https://example.com/series", loader)
+        assert loader.call_count == 2
+
+    def test_toc_cache_memory_and_locks_are_bounded(self, tmp_path):
+        """Test that only the most recently used entries stay in memory and no per-URL locks are left behind."""
+        cache = TocCache(cache_dir=str(tmp_path), max_entries=2)
+        for i in range(5):
+            cache.get_or_load(f"https://example.com/series-{i}", lambda url: [{"title": url}])
+        cache.get("https://example.com/series-3")
+        cache.put("https://example.com/series-5", [])
+
+        assert list(cache._memory) == ["https://example.com/series-3", "https://example.com/series-5"]
+        assert len(cache._url_locks) == 0
+        # Entries dropped from memory are still read back from disk
+        assert cache.get("https://example.com/series-0") == [{"title": "https://example.com/series-0"}]
+
+
+def wait_for_job(get_status, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = get_status()
+        if job['status'] in ('finished', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish in time")
+
+
+class TestJobs:
+    """Test asynchronous download jobs."""
+
+    def test_job_records_progress_and_artifact(self, tmp_path):
+        """Test that a finished job keeps its progress counters and artifact."""
+        manager = JobManager(JobStore(jobs_dir=str(tmp_path)), max_workers=1)
+
+        def build(progress, name):
+            progress.set('chapters_total', 2)
+            progress.advance('chapters_fetched', 2)
+            progress.advance('pages_rendered')
+            return {'path': name, 'download_name': name, 'mimetype': 'application/pdf'}
+
+        job_id = manager.submit(build, {'name': 'book.pdf'})
+        job = wait_for_job(lambda: manager.get(job_id))
+        manager.shutdown()
+
+        assert job['status'] == 'finished'
+        assert job['artifact']['download_name'] == 'book.pdf'
+        assert job['progress']['chapters_total'] == 2
+        assert job['progress']['chapters_fetched'] == 2
+        assert job['progress']['pages_rendered'] == 1
+
+    def test_failed_job_reports_error(self, tmp_path):
+        """Test that an exception in the build marks the job as failed."""
+        manager = JobManager(JobStore(jobs_dir=str(tmp_path)), max_workers=1)
+
+        def build(progress):
+            raise app_module.BuildError("No valid books to process", 400)
+
+        job_id = manager.submit(build, {})
+        job = wait_for_job(lambda: manager.get(job_id))
+        manager.shutdown()
+
+        assert job['status'] == 'failed'
+        assert job['error'] == "No valid books to process"
+
+    def test_stale_running_job_is_failed_on_prune(self, tmp_path):
+        """Test that a running job of a worker that died is marked failed instead of running forever."""
+        store = JobStore(jobs_dir=str(tmp_path), stale_after=60)
+        job = store.create({})
+        job['status'] = 'running'
+        store.save(job)
+        job['updated_at'] -= 120
+        with open(os.path.join(str(tmp_path), f"{job['id']}.json"), 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        live = store.create({})
+
+        store.prune()
+
+        stale = store.load(job['id'])
+        assert stale['status'] == 'failed'
+        assert stale['error'] == f"Build worker {os.getpid()} stopped responding"
+        assert store.load(live['id'])['status'] == 'queued'
+
+    def test_running_job_sends_heartbeats(self, tmp_path):
+        """Test that a job without progress is still saved regularly while it runs."""
+        manager = JobManager(JobStore(jobs_dir=str(tmp_path)), max_workers=1, heartbeat_interval=0.05)
+        started = threading.Event()
+        release = threading.Event()
+
+        def build(progress):
+            started.set()
+            release.wait(5)
+            return {'path': 'book.pdf', 'download_name': 'book.pdf', 'mimetype': 'application/pdf'}
+
+        job_id = manager.submit(build, {})
+        started.wait(5)
+        first = manager.get(job_id)['updated_at']
+        time.sleep(0.2)
+        running = manager.get(job_id)
+        release.set()
+        job = wait_for_job(lambda: manager.get(job_id))
+        manager.shutdown()
+
+        assert running['status'] == 'running' and running['updated_at'] > first
+        assert job['status'] == 'finished'
+
+    def test_unknown_job_returns_404(self, client):
+        """Test status polling for a job id that does not exist."""
+        assert client.get('/jobs/0123456789abcdef0123456789abcdef').status_code == 404
+        assert client.get('/jobs/../../etc/passwd').status_code == 404
+
+    def test_job_endpoints_end_to_end(self, client, tmp_path):
+        """Test submitting, polling and downloading a job."""
+        artifact_path = tmp_path / "Vol1.pdf"
+        artifact_path.write_bytes(b"%PDF-1.4 test")
+
+        def fake_build(url, selected_books, selected_format, progress=None):
+            progress.advance('chapters_fetched')
+            return {'path': str(artifact_path), 'download_name': 'Vol1.pdf', 'mimetype': 'application/pdf'}
+
+        with patch('app.build_download', side_effect=fake_build):
+            response = client.post('/jobs', json={
+                "selectedBooks": [1],
+                "format": "pdf",
+                "url": "https://example.com/series"
+            })
+            assert response.status_code == 202
+            job_id = response.get_json()["job_id"]
+            status = wait_for_job(lambda: client.get(f'/jobs/{job_id}').get_json())
+
+        assert status["status"] == "finished"
+        assert status["progress"]["chapters_fetched"] == 1
+        artifact = client.get(status["artifact_url"])
+        assert artifact.status_code == 200
+        assert artifact.data == b"%PDF-1.4 test"
+
+    def test_job_submission_validates_request(self, client):
+        """Test that invalid requests are rejected before queuing a job."""
+        response = client.post('/jobs', json={"selectedBooks": [1], "format": "mobi", "url": "https://example.com"})
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Unsupported format"
+
+
+class TestBuildWorkspaces:
+    """Test per-build workspaces and scoped cleanup."""
+
+    def test_workspaces_are_isolated(self, tmp_path):
+        """Test that concurrent builds get separate directories."""
+        first = BuildWorkspace.create(str(tmp_path))
+        second = BuildWorkspace.create(str(tmp_path))
+        assert first.path != second.path
+        assert first.images_dir.startswith(first.path)
+
+        first.cleanup()
+        assert not os.path.exists(first.path)
+        assert os.path.isdir(second.images_dir)
+
+    def test_cleanup_directories_uses_configured_downloads_dir(self, tmp_path, monkeypatch):
+        """Test that shutdown cleanup removes the configured downloads directory and nothing else."""
+        downloads = tmp_path / "downloads"
+        BuildWorkspace.create(str(downloads))
+        default = tmp_path / "app-downloads"
+        default.mkdir()
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setitem(app_module.app.config, 'DOWNLOADS_DIR', str(downloads))
+
+        app_module.cleanup_directories()
+
+        assert not downloads.exists()
+        assert default.is_dir()
+
+    def test_prune_skips_builds_in_progress(self, tmp_path):
+        """Test that stale finished workspaces are pruned but running ones are kept."""
+        running = BuildWorkspace.create(str(tmp_path))
+        finished = BuildWorkspace.create(str(tmp_path))
+        finished.finish()
+        old = time.time() - 7200
+        os.utime(running.path, (old, old))
+        os.utime(finished.path, (old, old))
+
+        assert prune_workspaces(str(tmp_path), max_age=3600) == [finished.id]
+        assert os.path.isdir(running.path)
+
+    def test_confirm_download_only_removes_confirmed_build(self, client):
+        """Test that confirming one download leaves other builds untouched."""
+        root = app_module.app.config['DOWNLOADS_DIR']
+        confirmed = BuildWorkspace.create(root)
+        other = BuildWorkspace.create(root)
+        with open(confirmed.file_path("Vol1.pdf"), 'wb') as f:
+            f.write(b"%PDF")
+        confirmed.finish()
+
+        response = client.post('/confirm-download', json={"buildId": confirmed.id})
+
+        assert response.status_code == 200
+        assert not os.path.exists(confirmed.path)
+        assert os.path.isdir(other.images_dir)
+        other.cleanup()
+
+    def test_confirm_download_by_filename(self, client):
+        """Test that a filename-only confirmation finds its workspace."""
+        root = app_module.app.config['DOWNLOADS_DIR']
+        workspace = BuildWorkspace.create(root)
+        with open(workspace.file_path("books_20250101_000000.zip"), 'wb') as f:
+            f.write(b"PK")
+        workspace.finish()
+
+        client.post('/confirm-download', json={"filename": "books_20250101_000000.zip"})
+
+        assert not os.path.exists(workspace.path)
+
+    def test_confirm_download_by_ambiguous_filename_removes_nothing(self, client):
+        """Test that a filename held by several builds does not remove any of them."""
+        root = app_module.app.config['DOWNLOADS_DIR']
+        workspaces = [BuildWorkspace.create(root) for _ in range(2)]
+        for workspace in workspaces:
+            with open(workspace.file_path("Vol1_20250101_000000.pdf"), 'wb') as f:
+                f.write(b"%PDF")
+            workspace.finish()
+
+        client.post('/confirm-download', json={"filename": "Vol1_20250101_000000.pdf"})
+
+        assert all(os.path.isdir(workspace.path) for workspace in workspaces)
+        for workspace in workspaces:
+            workspace.cleanup()
+
+
+class TestPipelinedBuild:
+    """Test streaming fetched volumes into the renderer."""
+
+    def test_pipeline_is_bounded(self):
+        """Test that the producer runs at most ``depth`` items ahead of the consumer."""
+        produced = []
+
+        def source():
+            for i in range(6):
+                produced.append(i)
+                yield i
+
+        pipeline = BoundedPipeline(source(), depth=2)
+        time.sleep(0.2)
+        # Two items queued and a third waiting to be put
+        assert len(produced) == 3
+        assert list(pipeline) == list(range(6))
+
+    def test_pipeline_reraises_and_stops(self):
+        """Test that producer errors reach the consumer and close stops the producer."""
+        def failing():
+            yield 1
+            raise ValueError("fetch failed")
+
+        pipeline = BoundedPipeline(failing())
+        assert next(pipeline) == 1
+        with pytest.raises(ValueError):
+            next(pipeline)
+
+        produced = []
+
+        def endless():
+            while True:
+                produced.append(1)
+                yield len(produced)
+
+        pipeline = BoundedPipeline(endless(), depth=1)
+        assert next(pipeline) == 1
+        pipeline.close()
+        count = len(produced)
+        time.sleep(0.2)
+        assert len(produced) == count and list(pipeline) == []
+
+    @patch('app.render_pool', None)
+    @patch('app.create_single_pdf')
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_rendering_overlaps_fetching(self, mock_get_content, mock_volumes, mock_create_pdf, client):
+        """Test that volume 1 is rendered while volume 2 is still being fetched."""
+        mock_get_content.return_value = {"Volume 1": {}, "Volume 2": {}}
+        rendering_started = threading.Event()
+        overlapped = []
+
+        def volumes(books, **kwargs):
+            yield "Volume 1", []
+            overlapped.append(rendering_started.wait(5))
+            yield "Volume 2", []
+        mock_volumes.side_effect = volumes
+
+        def fake_pdf(volume_name, chapters, progress=None, workspace=None, images=None, missing=None):
+            rendering_started.set()
+            path = workspace.file_path(f"{volume_name}.pdf")
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-")
+            return path
+        mock_create_pdf.side_effect = fake_pdf
+
+        response = client.post('/download', json={"selectedBooks": [1, 2], "format": "PDF", "url": "https://example.com"})
+        with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+            assert archive.namelist() == ["Volume 1.pdf", "Volume 2.pdf"]
+        response.close()
+
+        assert overlapped == [True]
+
+
+class TestImagePrefetch:
+    """Test background image prefetching."""
+
+    def test_prefetcher_downloads_each_url_once(self, tmp_path):
+        """Test that repeated URLs share one download and get() waits for it."""
+        fetcher = ConcurrentFetcher(max_workers=2, per_host=2)
+        calls = []
+
+        def download(url, save_dir, filename, progress):
+            time.sleep(0.02)
+            calls.append(url)
+            return os.path.join(save_dir, filename)
+
+        prefetcher = ImagePrefetcher(str(tmp_path), download, fetcher)
+        prefetcher.prefetch_all([{"src": "https://img.example.com/a.jpg"}, {"src": "https://img.example.com/a.jpg"}])
+        path = prefetcher.get("https://img.example.com/a.jpg")
+        prefetcher.close()
+        fetcher.shutdown()
+
+        assert calls == ["https://img.example.com/a.jpg"]
+        assert path == os.path.join(str(tmp_path), ImagePrefetcher.filename_for("https://img.example.com/a.jpg"))
+
+    @patch('app.fetch_illustrations')
+    @patch('app.fetch_chapter')
+    def test_images_are_queued_while_chapters_are_fetched(self, mock_fetch, mock_illustrations):
+        """Test that process_chapters hands discovered images to the prefetcher."""
+        mock_fetch.return_value = {"paragraphs": [], "tables": [], "inline_images": [{"src": "https://img.example.com/inline.png"}]}
+        mock_illustrations.return_value = [{"src": "https://img.example.com/cover.png", "alt": "", "caption": ""}]
+        images = MagicMock()
+
+        process_chapters(TestProcessChapters.books, images=images)
+
+        queued = [img["src"] for call in images.prefetch_all.call_args_list for img in call.args[0]]
+        assert "https://img.example.com/cover.png" in queued
+        assert queued.count("https://img.example.com/inline.png") == 3
+
+    def test_create_single_pdf_embeds_prefetched_images(self, local_server):
+        """Test rendering a volume whose images come from the prefetcher."""
+        workspace = BuildWorkspace.create(app_module.app.config['DOWNLOADS_DIR'])
+        images = app_module.new_image_prefetcher(workspace)
+        chapters = [
+            {"chapter_num": None, "chapter_name": "Illustrations", "type": "illustrations",
+             "images": [{"src": f"{local_server}/cover.png", "alt": "", "caption": "Cover"}]},
+            {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+             "content": {"paragraphs": ["Hello"], "tables": [],
+                         "inline_images": [{"src": f"{local_server}/inline.png", "alt": "", "caption": ""}]}},
+        ]
+        images.prefetch_all(chapters[0]["images"])
+
+        path = app_module.create_single_pdf("Volume 1", chapters, workspace=workspace, images=images)
+        stats = images.stats()
+        images.close()
+
+        assert path and os.path.getsize(path) > 0
+        assert stats == {"queued": 2, "ready": 2}
+        workspace.cleanup()
+
+
+class TestPdfLayout:
+    """Test the shared flowable builder."""
+
+    def test_styles_are_shared_across_images_and_tables(self, tmp_path):
+        """Test that captions and table cells reuse the process-wide styles."""
+        image_path = tmp_path / "inline.png"
+        image_path.write_bytes(png_bytes(2000, 1000))
+        images = {"https://img.example.com/a.png": (str(image_path), (2000, 1000))}
+        chapter = {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text", "content": {
+            "paragraphs": ["Part 1", "Hello"],
+            "inline_images": [{"src": "https://img.example.com/a.png", "alt": "", "caption": "First"},
+                              {"src": "https://img.example.com/a.png", "alt": "", "caption": "Second"},
+                              {"src": "https://img.example.com/missing.png", "alt": "", "caption": "Gone"}],
+            "tables": [[["a", "b"]], [["c", "d"]]],
+        }}
+
+        content = FlowableBuilder(images).volume("Volume 1", [chapter])
+
+        styles = get_styles()
+        assert styles is get_styles()
+        captions = [f for f in content if getattr(f, 'style', None) is styles.caption]
+        assert len(captions) == 2
+        assert [f for f in content if getattr(f, 'style', None) is styles.part][0].text == "Part 1"
+        pictures = [f for f in content if type(f).__name__ == 'Image']
+        assert pictures[0].drawWidth == pytest.approx(A4_WIDTH - 108)
+        cells = [cell for f in content if type(f).__name__ == 'Table' for row in f._cellvalues for cell in row]
+        assert len(cells) == 4 and all(cell.style is styles.table_cell for cell in cells)
+
+    def test_create_pdf_combines_volumes(self):
+        """Test that the combined PDF goes through the same builder as single volumes."""
+        chapter = {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+                   "content": {"paragraphs": ["Hello"], "tables": [], "inline_images": []}}
+        with patch('app.render_pdf', wraps=app_module.render_pdf) as render:
+            path = app_module.create_pdf({"Volume 1": [chapter], "Volume 2": [chapter]})
+
+        assert open(path, 'rb').read(5) == b"%PDF-"
+        assert list(render.call_args.args[0]) == ["Volume 1", "Volume 2"]
+        for workspace in BuildWorkspace.find_by_filename(app_module.app.config['DOWNLOADS_DIR'], path):
+            workspace.cleanup()
+
+    def test_create_single_pdf_releases_its_own_workspace(self):
+        """Test that a workspace and prefetcher created by create_single_pdf are finished and closed."""
+        chapter = {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+                   "content": {"paragraphs": ["Hello"], "tables": [], "inline_images": []}}
+        prefetchers = []
+        original = app_module.new_image_prefetcher
+
+        def new_prefetcher(workspace, progress=None):
+            prefetchers.append(MagicMock(wraps=original(workspace, progress)))
+            return prefetchers[-1]
+
+        with patch('app.new_image_prefetcher', side_effect=new_prefetcher):
+            path = app_module.create_single_pdf("Volume 1", [chapter])
+
+        assert open(path, 'rb').read(5) == b"%PDF-"
+        prefetchers[0].close.assert_called_once()
+        workspaces = BuildWorkspace.find_by_filename(app_module.app.config['DOWNLOADS_DIR'], path)
+        assert len(workspaces) == 1 and not workspaces[0].building
+        workspaces[0].cleanup()
+
+    def test_chunked_build_matches_single_pass(self, tmp_path):
+        """Test that rendering in batches of chapters gives the same pages and one bookmark per chapter."""
+        chapters = [{"chapter_num": num, "chapter_name": f"Chapter {num}", "type": "text",
+                     "content": {"paragraphs": ["Hello"] * 30 * num, "tables": [], "inline_images": []}}
+                    for num in range(1, 6)]
+        volumes = {"Volume 1": chapters, "Volume 2": chapters[:2]}
+
+        whole = render_pdf(volumes, str(tmp_path / "whole.pdf"), {})
+        chunked = render_pdf(volumes, str(tmp_path / "chunked.pdf"), {}, chunk_chapters=2)
+
+        single, combined = SourcePdf(str(tmp_path / "whole.pdf")), SourcePdf(str(tmp_path / "chunked.pdf"))
+        assert whole == chunked == len(single.pages()) == len(combined.pages())
+        assert b"/Outlines" in single.object(single.root)[0]
+        # Two volume bookmarks and one per chapter
+        assert combined.data.count(b"/Title <FEFF") == 9
+        assert sorted(os.listdir(tmp_path)) == ["chunked.pdf", "whole.pdf"]
+
+
+class TestImageTranscoding:
+    """Test preparing images for the size they are shown at."""
+
+    def test_transcode_downsamples_to_display_box(self, tmp_path):
+        """Test that a large transparent PNG becomes a JPEG sized for its box at the target DPI."""
+        from PIL import Image as PILImage
+        source = tmp_path / "large.png"
+        PILImage.new('RGBA', (4000, 2000), (200, 30, 30, 0)).save(source)
+        out_dir = tmp_path / "out"
+        out_dir.mkdir()
+
+        path = ImageTranscoder(dpi=144).transcode(str(out_dir), str(source), 400, 200)
+        gray_path = ImageTranscoder(dpi=72, grayscale=True).transcode(str(out_dir), str(source), 400, 200)
+
+        with PILImage.open(path) as img:
+            assert (img.format, img.size, img.mode) == ("JPEG", (800, 400), "RGB")
+            # Transparent areas are flattened onto the white page
+            assert img.getpixel((10, 10)) == (255, 255, 255)
+        with PILImage.open(gray_path) as img:
+            assert (img.size, img.mode) == ((400, 200), "L")
+        assert ImageTranscoder(dpi=144).transcode(str(out_dir), str(source), 400, 200) == path
+
+    def test_small_jpeg_is_embedded_as_is(self, tmp_path):
+        """Test that an image already smaller than its box is not re-encoded."""
+        from PIL import Image as PILImage
+        source = tmp_path / "small.jpg"
+        PILImage.new('RGB', (100, 50), (10, 20, 30)).save(source)
+
+        assert ImageTranscoder().transcode(str(tmp_path), str(source), 400, 200) == str(source)
+
+    def test_palette_image_is_resampled_smoothly(self, tmp_path):
+        """Test that a palette PNG is downsampled with LANCZOS rather than nearest neighbour."""
+        from PIL import Image as PILImage
+        source = tmp_path / "stripes.png"
+        stripes = PILImage.new('P', (800, 400))
+        stripes.putpalette([0, 0, 0, 255, 255, 255])
+        stripes.putdata([x % 2 for y in range(400) for x in range(800)])
+        stripes.save(source)
+
+        path = ImageTranscoder(dpi=72, grayscale=True).transcode(str(tmp_path), str(source), 200, 100)
+
+        with PILImage.open(path) as img:
+            assert img.size == (200, 100)
+            # Nearest neighbour would keep only black or only white pixels
+            assert all(96 < value < 160 for value in img.crop((20, 20, 180, 80)).getdata())
+
+    def test_render_embeds_transcoded_images(self, tmp_path):
+        """Test that a PDF rendered with a transcoder is smaller and leaves no transcoded files behind."""
+        from PIL import Image as PILImage
+        source = tmp_path / "illustration.png"
+        PILImage.effect_noise((600, 800), 60).convert('RGB').save(source)
+        images = {"https://img.example.com/a.png": (str(source), (600, 800))}
+        chapter = {"chapter_num": None, "chapter_name": "Illustrations", "type": "illustrations",
+                   "images": [{"src": "https://img.example.com/a.png", "alt": "", "caption": ""}]}
+
+        render_pdf({"Volume 1": [chapter]}, str(tmp_path / "source.pdf"), images)
+        render_pdf({"Volume 1": [chapter]}, str(tmp_path / "small.pdf"), images, transcoder=ImageTranscoder(dpi=36))
+
+        assert b"/DCTDecode" in (tmp_path / "small.pdf").read_bytes()
+        assert (tmp_path / "small.pdf").stat().st_size < (tmp_path / "source.pdf").stat().st_size / 4
+        assert sorted(os.listdir(tmp_path)) == ["illustration.png", "small.pdf", "source.pdf"]
+
+
+class TestIncrementalBuilds:
+    """Test rebuilding volumes from stored per-chapter segments."""
+
+    @staticmethod
+    def chapter(num, text="Hello"):
+        return {"chapter_num": num, "chapter_name": f"Chapter {num}", "type": "text",
+                "content": {"paragraphs": [text] * 40 * num, "tables": [], "inline_images": []}}
+
+    @staticmethod
+    def download(client, request):
+        """POST /download and return the pages of the PDF it built and the manifest counters."""
+        response = client.post('/download', json=request)
+        filename = response.headers['Content-Disposition'].split('filename=')[1]
+        response.close()
+        path = os.path.join(app_module.app.config['DOWNLOADS_DIR'], response.headers['X-Build-Id'], filename)
+        return SourcePdf(path), app_module.build_manifest.stats()
+
+    def test_concat_keeps_page_order_and_outline(self, tmp_path):
+        """Test that concatenated parts keep their pages in order and get one bookmark each."""
+        parts = []
+        for num in (1, 2, 3):
+            path = str(tmp_path / f"part{num}.pdf")
+            render_pdf({f"Part {num}": [self.chapter(num, f"Text {num}")]}, path, {})
+            parts.append(path)
+        sizes = [len(SourcePdf(path).pages()) for path in parts]
+
+        pages = concat_pdfs(parts, str(tmp_path / "all.pdf"), outline=[("Eins", 0, 0), ("Zwei", 1, 0), ("Drei", 2, 0)])
+
+        combined = SourcePdf(str(tmp_path / "all.pdf"))
+        assert pages == sum(sizes) == len(combined.pages())
+        assert b"/Outlines" in combined.object(combined.root)[0]
+        assert combined.data.count(b"/Title <FEFF") == 3
+
+    @patch('app.render_pool', None)
+    @patch('app.fetch_chapter')
+    @patch('app.get_webpage_content')
+    def test_rebuild_only_fetches_and_renders_new_chapters(self, mock_get_content, mock_fetch, client):
+        """Test that a volume with one more chapter only fetches and renders that chapter."""
+        links = [{"name": f"Chapter {i}", "url": f"https://example.com/v1-c{i}/"} for i in range(1, 5)]
+        mock_fetch.side_effect = lambda url: {"paragraphs": [f"Text of {url}"] * 60, "tables": [], "inline_images": []}
+        request = {"selectedBooks": [1], "format": "PDF", "url": "https://example.com"}
+
+        mock_get_content.return_value = {"Volume 1": links[:3]}
+        first, before = self.download(client, request)
+        mock_fetch.reset_mock()
+        mock_get_content.return_value = {"Volume 1": links}
+        rebuilt, after = self.download(client, request)
+
+        assert [call.args[0] for call in mock_fetch.call_args_list] == ["https://example.com/v1-c4/"]
+        assert after['rendered'] - before['rendered'] == 1
+        assert after['reused'] - before['reused'] == 3
+        assert after['skipped_fetches'] - before['skipped_fetches'] == 3
+        assert len(rebuilt.pages()) > len(first.pages())
+        assert rebuilt.data.count(b"/Title <FEFF") == 4
+
+    @patch('app.render_pool', None)
+    @patch('app.fetch_chapter')
+    @patch('app.get_webpage_content')
+    def test_changed_chapters_are_rendered_again(self, mock_get_content, mock_fetch, client, monkeypatch):
+        """Test that revalidated chapters are only re-rendered when their content changed."""
+        monkeypatch.setitem(app_module.app.config, 'MANIFEST_REVALIDATE_AFTER', 0)
+        texts = {f"https://example.com/v1-c{i}/": f"Chapter {i}" for i in range(1, 4)}
+        mock_get_content.return_value = {"Volume 1": [{"name": f"Chapter {i}", "url": url}
+                                                      for i, url in enumerate(texts, start=1)]}
+        mock_fetch.side_effect = lambda url: {"paragraphs": [texts[url]], "tables": [], "inline_images": []}
+        request = {"selectedBooks": [1], "format": "PDF", "url": "https://example.com"}
+
+        _, before = self.download(client, request)
+        texts["https://example.com/v1-c2/"] = "Chapter 2, corrected"
+        _, after = self.download(client, request)
+
+        assert mock_fetch.call_count == 6
+        assert after['rendered'] - before['rendered'] == 1
+        assert after['reused'] - before['reused'] == 2
+
+    @patch('app.render_pool', None)
+    @patch('app.fetch_chapter')
+    @patch('app.get_webpage_content')
+    def test_failed_refetch_of_evicted_segment_is_missing(self, mock_get_content, mock_fetch, client, monkeypatch):
+        """Test that a chapter whose skipped fetch has to be redone after eviction is reported missing if it fails."""
+        links = [{"name": f"Chapter {i}", "url": f"https://example.com/v1-c{i}/"} for i in range(1, 4)]
+        mock_get_content.return_value = {"Volume 1": links}
+        unreachable = set()
+
+        def fetch(url):
+            if url in unreachable:
+                raise ConnectionError("Connection refused")
+            return {"paragraphs": [f"Text of {url}"] * 60, "tables": [], "inline_images": []}
+        mock_fetch.side_effect = fetch
+        request = {"selectedBooks": [1], "format": "PDF", "url": "https://example.com"}
+        original = app_module.reusable_segments
+        max_bytes = app_module.build_manifest.max_bytes
+
+        def evict_after_planning(volume, planned):
+            reusable = original(volume, planned)
+            if unreachable:
+                # Segments are evicted between skipping the fetch and rendering the volume
+                app_module.build_manifest.max_bytes = 0
+                app_module.build_manifest.evict()
+                app_module.build_manifest.max_bytes = max_bytes
+            return reusable
+        monkeypatch.setattr(app_module, 'reusable_segments', evict_after_planning)
+        self.download(client, request)
+        unreachable.add("https://example.com/v1-c2/")
+
+        response = client.post('/download', json=request)
+        assert response.status_code == 200
+        assert response.headers['X-Missing-Chapters'] == urllib.parse.quote("Volume 1: Chapter 2")
+        filename = response.headers['Content-Disposition'].split('filename=')[1]
+        response.close()
+        path = os.path.join(app_module.app.config['DOWNLOADS_DIR'], response.headers['X-Build-Id'], filename)
+        assert SourcePdf(path).data.count(b"/Title <FEFF") == 2
+
+        unreachable.clear()
+        self.download(client, request)
+        unreachable.add("https://example.com/v1-c2/")
+        monkeypatch.setitem(app_module.app.config, 'FAIL_ON_MISSING_CHAPTERS', True)
+        response = client.post('/download', json=request)
+        assert response.status_code == 502
+
+
+class TestEpub:
+    """Test the streaming EPUB writer."""
+
+    def test_epub_container_is_well_formed(self, tmp_path):
+        """Test the EPUB layout, chapter XHTML, images and navigation."""
+        cover = tmp_path / "cover.png"
+        cover.write_bytes(png_bytes(300, 400))
+        images = {"https://img.example.com/cover.png": (str(cover), (300, 400))}
+        volumes = {
+            "Volume 1": [
+                {"chapter_num": None, "chapter_name": "Illustrations", "type": "illustrations",
+                 "images": [{"src": "https://img.example.com/cover.png", "alt": "", "caption": "Cover"}]},
+                {"chapter_num": 1, "chapter_name": "Chapter 1 & Prologue", "type": "text",
+                 "content": {"paragraphs": ["Part 1", "<Hello>\x0b"], "tables": [[["a\nb", "c"]]],
+                             "inline_images": [{"src": "https://img.example.com/cover.png", "alt": "", "caption": ""},
+                                               {"src": "https://img.example.com/missing.png", "alt": "", "caption": ""}]}},
+            ],
+            "Volume 2": [
+                {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+                 "content": {"paragraphs": ["Again"], "tables": [], "inline_images": []}},
+            ],
+        }
+        path = str(tmp_path / "book.epub")
+
+        assert render_epub(volumes, path, images) == 3
+
+        with zipfile.ZipFile(path) as book:
+            first = book.infolist()[0]
+            assert first.filename == "mimetype" and first.compress_type == zipfile.ZIP_STORED
+            assert book.read("mimetype") == b"application/epub+zip"
+            names = book.namelist()
+            assert [n for n in names if n.startswith("OEBPS/images/")] == ["OEBPS/images/img1.png"]
+            for name in names:
+                if name.endswith((".xhtml", ".opf", ".xml")):
+                    ET.fromstring(book.read(name))
+            chapter = book.read("OEBPS/text/c2.xhtml").decode()
+            assert '<p class="part">Part 1</p>' in chapter
+            assert "&lt;Hello&gt;</p>" in chapter and "a<br/>b" in chapter
+            assert 'properties="cover-image"' in book.read("OEBPS/content.opf").decode()
+            nav = book.read("OEBPS/nav.xhtml").decode()
+            assert nav.index(">Volume 1</a>") < nav.index(">Chapter 1 &amp; Prologue</a>") < nav.index(">Volume 2</a>")
+
+    @patch('app.iter_processed_volumes')
+    @patch('app.get_webpage_content')
+    def test_download_epub(self, mock_get_content, mock_process, client):
+        """Test that the EPUB format returns a real EPUB file."""
+        mock_get_content.return_value = {"Volume 1": {}}
+        mock_process.side_effect = lambda books, **kwargs: iter([("Volume 1", [
+            {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+             "content": {"paragraphs": ["Hello"], "tables": [], "inline_images": []}}])])
+
+        response = client.post('/download', json={"selectedBooks": [1], "format": "EPUB", "url": "https://example.com"})
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/epub+zip"
+        assert response.get_data()[30:58] == b"mimetypeapplication/epub+zip"
+        response.close()
+
+    def test_failed_epub_releases_its_own_workspace(self):
+        """Test that a failed create_epub closes its prefetcher and removes its workspace and partial file."""
+        chapter = {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+                   "content": {"paragraphs": ["Hello"], "tables": [], "inline_images": []}}
+        prefetchers = []
+        workspaces = []
+        original_prefetcher = app_module.new_image_prefetcher
+        original_create = BuildWorkspace.create
+
+        def new_prefetcher(workspace, progress=None):
+            prefetchers.append(MagicMock(wraps=original_prefetcher(workspace, progress)))
+            return prefetchers[-1]
+
+        def create(downloads_dir):
+            workspaces.append(original_create(downloads_dir))
+            return workspaces[-1]
+
+        def failing_render(volumes, path, images):
+            list(volumes)
+            open(path, 'wb').close()
+            raise OSError("disk full")
+
+        with patch('app.new_image_prefetcher', side_effect=new_prefetcher), \
+                patch('app.BuildWorkspace.create', side_effect=create), \
+                patch('app.render_epub', side_effect=failing_render):
+            assert app_module.create_epub({"Volume 1": [chapter]}) is None
+
+        prefetchers[0].close.assert_called_once()
+        assert not os.path.exists(workspaces[0].path)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = RenderPool(max_workers=2)
+    yield pool
+    pool.shutdown()
+
+
+class TestRenderPool:
+    """Test rendering volumes in parallel on worker processes."""
+
+    @staticmethod
+    def volume(paragraphs):
+        return [{"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+                 "content": {"paragraphs": paragraphs, "tables": [], "inline_images": []}}]
+
+    def test_results_keep_volume_order_and_isolate_failures(self, pool, tmp_path):
+        """Test that a failing volume is reported in its slot while the others render."""
+        tasks = [
+            ("Volume 1", self.volume(["One"] * 50), str(tmp_path / "v1.pdf"), {}),
+            ("Volume 2", [{"type": "text"}], str(tmp_path / "v2.pdf"), {}),
+            ("Volume 3", self.volume(["Three"]), str(tmp_path / "v3.pdf"), {}),
+        ]
+
+        results = list(pool.map(app_module.render_volume_pdf, tasks))
+
+        assert results[0] >= 1 and results[2] == 1
+        assert isinstance(results[1], KeyError)
+        assert (tmp_path / "v1.pdf").read_bytes().startswith(b"%PDF")
+        assert (tmp_path / "v3.pdf").exists()
+
+    def test_render_volume_pdfs_reports_failed_volumes(self, pool):
+        """Test that multi-volume builds use the pool and name the volumes that failed."""
+        workspace = BuildWorkspace.create(app_module.app.config['DOWNLOADS_DIR'])
+        images = MagicMock()
+        books = {"Volume 1": self.volume(["One"]), "Volume 2": [{"type": "text"}], "Volume 3": self.volume(["Three"])}
+        failed = []
+
+        with patch('app.render_pool', pool):
+            paths = list(app_module.render_volume_pdfs(books, workspace, images, failed=failed))
+
+        assert [os.path.basename(p).split('_')[0] for p in paths] == ["Vol1", "Vol3"]
+        assert failed == ["Volume 2"]
+        workspace.cleanup()
+
+
+class TestImageStore:
+    """Test the content-addressed image store."""
+
+    @staticmethod
+    def fake_download(contents):
+        calls = []
+
+        def download(url, filepath):
+            calls.append(url)
+            with open(filepath, 'wb') as f:
+                f.write(contents[url])
+            return filepath
+        return download, calls
+
+    def test_same_url_is_downloaded_once(self, tmp_path):
+        """Test that a second request for a URL is served from the store."""
+        download, calls = self.fake_download({"https://img.example.com/a.png": png_bytes()})
+        store = ImageStore(download, cache_dir=str(tmp_path))
+
+        first = store.fetch("https://img.example.com/a.png")
+        second = store.fetch("https://img.example.com/a.png")
+
+        assert calls == ["https://img.example.com/a.png"]
+        assert first == second
+        assert (first['width'], first['height']) == (40, 30)
+        assert store.stats()['hits'] == 1
+
+    def test_concurrent_fetches_share_one_download_and_leave_no_locks(self, tmp_path):
+        """Test that threads asking for the same URL wait for one download and its lock is then dropped."""
+        download, calls = self.fake_download({"https://img.example.com/a.png": png_bytes()})
+
+        def slow_download(url, filepath):
+            time.sleep(0.05)
+            return download(url, filepath)
+        store = ImageStore(slow_download, cache_dir=str(tmp_path))
+
+        threads = [threading.Thread(target=store.fetch, args=("https://img.example.com/a.png",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ["https://img.example.com/a.png"]
+        assert len(store._url_locks) == 0
+
+    def test_identical_content_is_stored_once(self, tmp_path):
+        """Test that different URLs with the same bytes share one blob."""
+        data = png_bytes()
+        download, calls = self.fake_download({
+            "https://img.example.com/cover.png": data,
+            "https://cdn.example.com/cover-copy.png": data,
+        })
+        store = ImageStore(download, cache_dir=str(tmp_path))
+
+        first = store.fetch("https://img.example.com/cover.png")
+        second = store.fetch("https://cdn.example.com/cover-copy.png")
+
+        assert first['path'] == second['path']
+        assert store.stats()['blobs'] == 1
+        assert store.stats()['deduplicated'] == 1
+
+    def test_eviction_keeps_linked_build_copies(self, tmp_path):
+        """Test size-bounded eviction and that build links outlive evicted blobs."""
+        contents = {f"https://img.example.com/{i}.bin": os.urandom(1000) for i in range(3)}
+        download, calls = self.fake_download(contents)
+        store = ImageStore(download, cache_dir=str(tmp_path / "cache"), max_bytes=2500)
+
+        first = store.fetch("https://img.example.com/0.bin")
+        linked = store.link_into(first, str(tmp_path / "build"))
+        time.sleep(0.01)
+        store.fetch("https://img.example.com/1.bin")
+        time.sleep(0.01)
+        store.fetch("https://img.example.com/2.bin")
+
+        assert store.lookup("https://img.example.com/0.bin") is None
+        assert store.stats()['bytes'] <= 2500
+        with open(linked, 'rb') as f:
+            assert f.read() == contents["https://img.example.com/0.bin"]
+
+    def test_download_image_links_from_store(self, local_server, tmp_path):
+        """Test that builds share store blobs instead of re-downloading."""
+        url = f"{local_server}/shared.png"
+        misses_before = app_module.image_store.stats()['misses']
+        first = app_module.download_image(url, str(tmp_path / "build1"), "ignored")
+        second = app_module.download_image(url, str(tmp_path / "build2"), "ignored")
+
+        assert os.path.basename(first) == os.path.basename(second)
+        assert app_module.image_store.stats()['misses'] == misses_before + 1
+        assert app_module.image_size(second) == (40, 30)
+
+
+class TestHtmlParsing:
+    """Test the pluggable HTML parser backends and scoped parsing."""
+
+    @pytest.fixture
+    def reference_parser(self):
+        original = app_module.html_parser
+        yield
+        app_module.html_parser = original
+
+    @pytest.mark.parametrize("backend", available_backends())
+    @pytest.mark.parametrize("scoped", [True, False])
+    def test_backends_produce_identical_output(self, backend, scoped, reference_parser):
+        """Test that every backend and scope setting yields the original structured output."""
+        pages = [
+            (app_module.parse_chapter, fixtures.chapter_page(seed=3, paragraphs=30, tables=2, images=3)),
+            (app_module.parse_illustrations, fixtures.illustrations_page(seed=3)),
+            (app_module.parse_table_of_contents, fixtures.index_page(volumes=3, chapters=4)),
+        ]
+        app_module.html_parser = HtmlParser('html.parser', scoped=False)
+        expected = [parse(html) for parse, html in pages]
+
+        app_module.html_parser = HtmlParser(backend, scoped=scoped)
+        assert [parse(html) for parse, html in pages] == expected
+
+    def test_scoped_chapter_drops_comments_and_navigation(self, reference_parser):
+        """Test the parsed chapter content on a realistic page."""
+        app_module.html_parser = HtmlParser('html.parser', scoped=True)
+        content = app_module.parse_chapter(fixtures.chapter_page(seed=1, paragraphs=10, tables=1, images=2))
+
+        # The navigation line next to the comments is removed, the top one is kept
+        assert len(content['paragraphs']) == 12
+        assert content['paragraphs'].count("Previous|Next") == 1
+        assert len(content['inline_images']) == 2
+        assert len(content['tables']) == 1
+
+    def test_unknown_backend_is_rejected(self):
+        """Test that a misspelled backend name fails loudly."""
+        with pytest.raises(ValueError):
+            HtmlParser('lxmll')
+
+
+class TestFixtureSite:
+    """Test the local stand-in site used by the end-to-end benchmark."""
+
+    def test_site_serves_a_scrapable_series(self, tmp_path):
+        """Test that the index, chapters and images are served and revalidated like the real site."""
+        cache = ChapterCache(cache_dir=str(tmp_path))
+        with FixtureSite(volumes=2, chapters=2, illustrations=1, illustration_size=(60, 80), inline_size=(40, 30)) as site, \
+                patch.object(app_module, 'toc_cache', TocCache(cache_dir=str(tmp_path))), \
+                patch.object(app_module, 'chapter_cache', cache):
+            books = app_module.get_webpage_content(site.url)
+            assert list(books) == ["Volume 1", "Volume 2"]
+            chapter_url = books["Volume 1"][1]['url']
+
+            chapter = app_module.fetch_chapter(chapter_url)
+            assert chapter['paragraphs'] and len(chapter['inline_images']) == 2
+            image = app_module.http_client.get(chapter['inline_images'][0]['src'])
+            assert image.headers['Content-Type'] == "image/png"
+
+            site.reset_counters()
+            assert app_module.fetch_chapter(chapter_url) == chapter
+            assert site.counters() == {'requests': 1, 'not_modified': 1, 'bytes_served': 0}
+
+
+class TestMetrics:
+    """Test pipeline metrics and the /metrics endpoint."""
+
+    def test_totals_are_summed_across_workers(self, tmp_path):
+        """Test that two processes sharing the database are reported together."""
+        first = Metrics(cache_dir=str(tmp_path), flush_interval=0)
+        second = Metrics(cache_dir=str(tmp_path), flush_interval=0)
+        first.inc('webtoreader_chapters_total', 2, type='text')
+        second.inc('webtoreader_chapters_total', 3, type='text')
+        second.observe('webtoreader_stage_duration_seconds', 0.3, stage='pdf_build')
+        with pytest.raises(ValueError):
+            with first.stage('pdf_build'):
+                raise ValueError("render failed")
+        second.flush()
+
+        text = first.render()
+
+        assert '# TYPE webtoreader_chapters_total counter' in text
+        assert 'webtoreader_chapters_total{type="text"} 5' in text
+        assert 'webtoreader_stage_duration_seconds_bucket{le="0.25",stage="pdf_build"} 1' in text
+        assert 'webtoreader_stage_duration_seconds_bucket{le="0.5",stage="pdf_build"} 2' in text
+        assert 'webtoreader_stage_duration_seconds_count{stage="pdf_build"} 2' in text
+        assert 'webtoreader_stage_errors_total{stage="pdf_build"} 1' in text
+
+    def test_stale_process_rows_are_folded(self, tmp_path):
+        """Test that rows of processes that stopped flushing are folded into one retired total."""
+        exited = [Metrics(cache_dir=str(tmp_path), flush_interval=0, retention=60) for _ in range(3)]
+        for worker in exited:
+            worker.inc('webtoreader_chapters_total', 2, type='text')
+            worker.flush()
+        live = Metrics(cache_dir=str(tmp_path), flush_interval=0, retention=60)
+        conn = sqlite3.connect(live.db_path)
+        conn.execute('UPDATE samples SET updated_at = updated_at - 120')
+        conn.commit()
+
+        live.inc('webtoreader_chapters_total', 1, type='text')
+        live.flush()
+        processes = sorted(row[0] for row in conn.execute('SELECT DISTINCT process FROM samples'))
+        assert processes == sorted(['retired', live._process])
+        assert live.totals()[('webtoreader_chapters_total', (('type', 'text'),))] == 7
+
+        # A process whose rows were folded keeps adding only what changed
+        exited[0].inc('webtoreader_chapters_total', 1, type='text')
+        exited[0].flush()
+        assert live.totals()[('webtoreader_chapters_total', (('type', 'text'),))] == 8
+        conn.close()
+
+    @patch('app.http_client.get')
+    def test_metrics_endpoint_reports_stages_and_caches(self, mock_get, client):
+        """Test that fetching a chapter shows up in the scraped metrics."""
+        mock_get.return_value = make_response(200, CHAPTER_HTML, {'ETag': '"v1"'})
+        app_module.fetch_chapter("https://example.com/metrics-c1")
+
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        text = response.get_data(as_text=True)
+        assert 'webtoreader_stage_duration_seconds_count{stage="chapter_fetch"}' in text
+        assert 'webtoreader_stage_duration_seconds_count{stage="chapter_parse"}' in text
+        assert 'webtoreader_bytes_total{kind="page"}' in text
+        assert 'webtoreader_cache_requests_total{cache="chapter",result="miss"}' in text
+
+
+class TestAppLogger:
+    """Test asynchronous logging and startup log trimming."""
+
+    def test_trim_keeps_the_tail(self, tmp_path):
+        """Test that long logs are cut to their last lines and short ones are left alone."""
+        (tmp_path / "info.log").write_text(''.join(f"line {i}\n" for i in range(5000)))
+        (tmp_path / "short.log").write_text("a\nb\n")
+
+        log = AppLogger(log_dir=str(tmp_path), max_lines=100, name='TestAppLogger.trim')
+        log.stop()
+
+        lines = (tmp_path / "info.log").read_text().splitlines()
+        assert lines[0] == "line 4900" and lines[-1] == "line 4999" and len(lines) == 100
+        assert (tmp_path / "short.log").read_text() == "a\nb\n"
+        assert AppLogger._tail(str(tmp_path / "info.log"), 100, block_size=16) is None
+
+    def test_async_logging_respects_level(self, tmp_path):
+        """Test that records are written by the listener and filtered by level."""
+        log = AppLogger(log_dir=str(tmp_path), level='INFO', name='TestAppLogger.async')
+        log.logger.debug("hidden %s", "detail")
+        log.logger.info("chapter %s fetched", 7)
+        log.stop()
+
+        text = (tmp_path / "info.log").read_text()
+        assert "INFO - chapter 7 fetched" in text
+        assert "hidden" not in text
+
+
+class TestRequestLogging:
+    """Test the request logging hooks."""
+
+    @patch('app.get_webpage_content')
+    @patch('app.iter_processed_volumes')
+    def test_file_responses_are_not_read(self, mock_volumes, mock_get_content, client, caplog):
+        """Test that a file download is logged without reading its body."""
+        mock_get_content.return_value = {"Volume 1": {}}
+        mock_volumes.side_effect = lambda books, **kwargs: iter([("Volume 1", [
+            {"chapter_num": 1, "chapter_name": "Chapter 1", "type": "text",
+             "content": {"paragraphs": ["Hello"], "tables": [], "inline_images": []}}])])
+
+        with caplog.at_level(logging.DEBUG, logger='AppLogger'), \
+                patch.object(flask.Response, 'get_data', side_effect=AssertionError("body was read")):
+            response = client.post('/download', json={"selectedBooks": [1], "format": "EPUB", "url": "https://example.com"})
+
+        assert response.status_code == 200
+        size = response.headers['Content-Length']
+        assert f"POST /download 200 {size} bytes" in caplog.text
+        assert "response body" not in caplog.text
+        response.close()
+
+    def test_small_json_bodies_are_sampled_at_debug(self, client, caplog):
+        """Test that small JSON request and response bodies are logged only at debug level."""
+        with caplog.at_level(logging.INFO, logger='AppLogger'):
+            client.post('/download', json={"selectedBooks": []})
+        assert "POST /download 400" in caplog.text
+        assert "request body" not in caplog.text
+
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger='AppLogger'):
+            client.post('/download', json={"selectedBooks": []})
+        assert 'request body: {"selectedBooks": []}' in caplog.text
+        assert "response body" in caplog.text and "No books selected" in caplog.text